@@ -0,0 +1,183 @@
+"""
+Benchmarks for the metric and scoring hot paths.
+
+Generates synthetic base/improved pairs at DALL-E 3 like resolutions and times every
+`calculate_*` function, a full `compare_images` run and improvement scoring (per pair and
+batched). VMAF runs through the bundled fake ffmpeg and scoring uses the placeholder
+prompt, so no libvmaf build or API key is needed and timings reflect this code only.
+
+Run from the repository root:
+
+    python benchmarks/bench_metrics.py                                 # all sizes, saved under benchmarks/results/
+    python benchmarks/bench_metrics.py --sizes 512 --repeat 3
+    python benchmarks/bench_metrics.py --baseline benchmarks/results/<earlier>.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+from src.evaluation_metrics import SCORED_METRICS, evaluate_image_improvement, metrics_to_columns, score_batch  # noqa: E402
+from src.metrics import ImageContext, compare_images  # noqa: E402
+from src.metrics import metric_calculations as mc  # noqa: E402
+from src.metrics.vmaf import VmafEngine  # noqa: E402
+from src.utils.constants import DEFAULT_PLACEHOLDER_PROMPT  # noqa: E402
+
+FAKE_FFMPEG = os.path.join(REPO_ROOT, "src", "utils", "fake_ffmpeg.py")
+RESULTS_DIRECTORY = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# (label, width, height); 1792x1024 is DALL-E 3's landscape output size
+SIZES = {'512': (512, 512), '1024': (1024, 1024), '1792x1024': (1792, 1024)}
+
+
+def synthetic_pair(width, height, seed=0):
+    """
+    A base image with smooth gradients, shapes and texture, and an "improved" version that is
+    slightly sharpened, shifted in colour and re-noised, so every metric has real work to do.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        127 + 80 * np.sin(x / 57.0) * np.cos(y / 43.0),
+        127 + 80 * np.cos((x + y) / 91.0),
+        127 + 60 * np.sin(np.hypot(x - width / 2, y - height / 2) / 29.0),
+    ], axis=-1)
+    for _ in range(12):
+        cx, cy, radius = rng.uniform(0, width), rng.uniform(0, height), rng.uniform(20, min(width, height) / 6)
+        base[(x - cx) ** 2 + (y - cy) ** 2 < radius ** 2] += rng.uniform(-60, 60, size=3)
+    base += rng.normal(0, 6, base.shape)
+    improved = base * 1.04 + rng.normal(0, 3, base.shape) + np.array([3, -2, 4])
+    improved[:, 1:] = 0.85 * improved[:, 1:] + 0.15 * improved[:, :-1]
+    to_image = lambda array: Image.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+    return to_image(base), to_image(improved)
+
+
+def time_call(function, repeat):
+    """Median wall time of `repeat` calls, after one untimed warm-up call (lazy imports, model loading)."""
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def metric_benchmarks(base_path, improved_path):
+    """Each calculate_* function as a standalone call on arrays, the way callers outside compare_images use them."""
+    base, improved = Image.open(base_path), Image.open(improved_path)
+    gray1, gray2 = np.array(base.convert("L")), np.array(improved.convert("L"))
+    rgb = np.array(base)
+    engine = VmafEngine()
+    return {
+        'calculate_mse': lambda: mc.calculate_mse(gray1, gray2),
+        'calculate_ssim': lambda: mc.calculate_ssim(gray1, gray2),
+        'calculate_psnr': lambda: mc.calculate_psnr(gray1, gray2),
+        'calculate_histogram_correlation': lambda: mc.calculate_histogram_correlation(gray1, gray2),
+        'calculate_edge_mse': lambda: mc.calculate_edge_mse(gray1, gray2),
+        'calculate_fft_mse': lambda: mc.calculate_fft_mse(gray1, gray2),
+        'calculate_ms_ssim': lambda: mc.calculate_ms_ssim(gray1, gray2),
+        'calculate_gsim': lambda: mc.calculate_gsim(gray1, gray2),
+        'calculate_entropy': lambda: mc.calculate_entropy(gray1),
+        'calculate_colorfulness': lambda: mc.calculate_colorfulness(rgb),
+        'calculate_brisque': lambda: mc.calculate_brisque(ImageContext(base_path)),
+        'calculate_vmaf': lambda: mc.calculate_vmaf(improved_path, base_path, engine=engine),
+    }
+
+
+def run_size(label, width, height, repeat, directory, score_rows):
+    base, improved = synthetic_pair(width, height)
+    base_path = os.path.join(directory, f"bench_{label}_base.png")
+    improved_path = os.path.join(directory, f"bench_{label}_improved.png")
+    base.save(base_path)
+    improved.save(improved_path)
+
+    timings = {}
+    for name, function in metric_benchmarks(base_path, improved_path).items():
+        timings[name] = time_call(function, repeat)
+        print(f"  {name:34} {1000 * timings[name]:10.2f} ms")
+
+    # Paths rather than contexts, so decoding and the shared planes are part of the measurement
+    timings['compare_images'] = time_call(lambda: compare_images(base_path, improved_path), repeat)
+    print(f"  {'compare_images':34} {1000 * timings['compare_images']:10.2f} ms  ({1 / timings['compare_images']:.2f} pairs/s)")
+
+    # Scoring on this pair's metric values, per pair and as one batch of `score_rows` pairs
+    results = compare_images(base_path, improved_path, metrics=list(SCORED_METRICS))
+    row = {name: results[name] for name in SCORED_METRICS}
+    timings['evaluate_image_improvement'] = time_call(lambda: evaluate_image_improvement(row, prompt=DEFAULT_PLACEHOLDER_PROMPT), repeat)
+    columns = metrics_to_columns([row] * score_rows)
+    timings['score_batch'] = time_call(lambda: score_batch(columns), repeat) / score_rows
+    print(f"  {'evaluate_image_improvement':34} {1e6 * timings['evaluate_image_improvement']:10.2f} us/pair")
+    print(f"  {'score_batch':34} {1e6 * timings['score_batch']:10.2f} us/pair  (batches of {score_rows})")
+    return {name: {'seconds': seconds, 'pairs_per_second': 1 / seconds if seconds else None} for name, seconds in timings.items()}
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Print the slowdown of every timing against the baseline and return the ones beyond `tolerance`."""
+    regressions = []
+    print(f"\nAgainst baseline from {baseline.get('created_at', '?')} ({baseline.get('machine', '?')}):")
+    for size, timings in results['sizes'].items():
+        for name, timing in timings.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(name)
+            if not previous or not previous['seconds']:
+                continue
+            ratio = timing['seconds'] / previous['seconds']
+            flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+            print(f"  {size:10} {name:34} {ratio:6.2f}x{flag}")
+            if flag:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the metric and scoring hot paths on synthetic image pairs.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES), help="Resolutions to benchmark.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per benchmark; the median is reported.")
+    parser.add_argument("--score-rows", type=int, default=10000, help="Pairs per batch when timing score_batch.")
+    parser.add_argument("--output", help="Where to save the results JSON (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Slowdown against the baseline tolerated before flagging a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 when any benchmark regressed.")
+    args = parser.parse_args()
+
+    # Every VmafEngine in this process, including the ones compare_images creates, uses the stand-in
+    os.environ['FFMPEG_PATH'] = FAKE_FFMPEG
+    os.environ.pop('VMAF_MODEL', None)
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': f"{platform.node()} {platform.machine()} {platform.python_version()}",
+        'repeat': args.repeat,
+        'sizes': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for label in args.sizes:
+            width, height = SIZES[label]
+            print(f"{label} ({width}x{height})")
+            results['sizes'][label] = run_size(label, width, height, args.repeat, directory, args.score_rows)
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_to_baseline(results, json.load(file), args.tolerance)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,139 +1,408 @@
 # Essentials for computation
 import os
-# Essentials for running VMAF models the ground-up way
-from src.metrics import metric_calculations
+import math
+import time
+import argparse
+import re
 # Formatting output
 from termcolor import colored
 # Helpers and AI-adaptive code
-from src.evaluation_metrics import evaluate_image_improvement, compare_images
-
-# Necessary constants
-from src.utils.constants import DEFAULT_PLACEHOLDER_PROMPT
+from src.evaluation_metrics import evaluate_image_improvement, IDENTICAL_SUMMARY, SCORED_METRICS
+# Streaming per-pair results, incremental aggregates and the optional console view
+from src.results import ResultsAggregator, ConsoleView, open_results_writer, report_summary, write_json_atomic, write_summary
+# Run manifests and stored results, for resuming interrupted runs
+from src.results import check_resumable, load_manifest, read_results, write_manifest
+# Indexed SQLite store of results across runs
+from src.results import ResultsStore
+# Bootstrap confidence intervals and paired significance over the per-pair results
+from src.results import DEFAULT_RESAMPLES, bootstrap_statistics, read_columns, report_bootstrap
+# Prompt-tailored evaluation functions, cached per prompt
+from src.evaluation_metrics import get_ai_evaluation_function
+# Serial or process-pool evaluation of image pairs
+from src.pipeline import DEFAULT_SETTLE_SECONDS, EvaluationOptions, PairWatcher, dataset_identity, evaluate_pairs, parse_shard, shard_of
+# Recursive, pattern-based pairing of base and improved images with an incremental scan manifest
+from src.pipeline import DEFAULT_GENERATED_PATTERN, DEFAULT_REFERENCE_PATTERN, PairIndex, compile_key_pattern, pair_manifest_path
+# Persistent cache of per-image and per-pair metric values
+from src.metrics import open_feature_cache, METRICS_VERSION
+# Per-stage wall/CPU time and memory, and sampled cProfile captures
+from src.utils.instrumentation import dump_stats, format_stats_table, reset_stats, stage
+# Named, dependency-aware metric selection
+from src.metrics import METRICS, RESAMPLE_POLICIES, resolve_metrics, parse_metric_list
 
 # Import and initialize env variables
 from dotenv import load_dotenv
 
 env_found = load_dotenv()
 AI_ASSISTED = os.getenv('AI_ENHANCED_EVALUATION')
+# Prompt the evaluated image pairs were generated from
+PAIR_PROMPT = "Make a hyper realistic  beautiful spotted bengal cat with green eyes "
+
+# Console labels for compare_images outputs; per-image outputs name the file they belong to
+METRIC_LABELS = {
+    'mse': "MSE",
+    'ssim': "SSIM",
+    'psnr': "PSNR",
+    'brisque_image1': "BRISQUE for {base}",
+    'brisque_image2': "BRISQUE for {improved}",
+    'brisque_diff': "BRISQUE Difference (Improved - Base)",
+    'hist_corr': "Histogram Correlation",
+    'colorfulness_image1': "Colorfulness for {base}",
+    'colorfulness_image2': "Colorfulness for {improved}",
+    'edge_mse': "Edge MSE",
+    'entropy_image1': "Entropy for {base}",
+    'entropy_image2': "Entropy for {improved}",
+    'entropy_diff': "Entropy Difference (Improved - Base)",
+    'fft_mse': "FFT MSE",
+    'ms_ssim': "MS-SSIM",
+    'gsim': "GSIM",
+    'vmaf': "VMAF",
+}
+
+def run_settings(reference_directory, generated_directory, options, shard=None, key_patterns=(DEFAULT_REFERENCE_PATTERN, DEFAULT_GENERATED_PATTERN)):
+    """What a run evaluates and how: recorded in its manifest and partial aggregates, and compared on resume and merge."""
+    bounded = {'max_pair_memory_mb': options.max_pair_bytes / (1024 * 1024) if options.max_pair_bytes else None} if options.memory_bounded else None
+    return {'reference_directory': os.path.abspath(reference_directory), 'generated_directory': os.path.abspath(generated_directory),
+            'metrics': options.metrics, 'metrics_version': METRICS_VERSION, 'shard': list(shard) if shard else None,
+            'resample': options.resample, 'memory_bounded': bounded, 'key_patterns': list(key_patterns)}
 
-def compare_all_images(reference_directory, generated_directory):
+def pair_record(key, reference_name, generated_name, results, scored_metrics=None):
+    """
+    The stored record of one evaluated pair: its `compare_images` results, plus the improvement
+    score and summary when `scored_metrics` (every metric the score weighs) is given and the
+    pair has a finite value for each of them. Identical pairs get no score and the identical summary.
+    A pair that could not be compared is recorded with just its `error`, as a failure record.
+    """
+    record = {'key': key, 'reference': reference_name, 'generated': generated_name, **results}
+    if scored_metrics and results.get('duplicate') == 'identical':
+        # An explicit verdict rather than the infinite score of PSNR inf, which would count as "significantly better"
+        record['score'], record['summary'] = None, IDENTICAL_SUMMARY
+        return record
+    # Pairs missing a scored metric (e.g. VMAF could not be computed) or with a non-finite one (PSNR of
+    # pixel-identical images) keep their values but get no score
+    if scored_metrics and all(results.get(metric) is not None and math.isfinite(results[metric]) for metric in scored_metrics):
+        metrics_for_score = {metric: results[metric] for metric in scored_metrics}
+        with stage("score"):
+            record['score'], record['summary'] = evaluate_image_improvement(metrics_for_score, prompt=PAIR_PROMPT)
+        if AI_ASSISTED:
+            # Compiled once per prompt and model, then reused for every pair
+            with stage("score.ai_assisted"):
+                evaluate_image_improvement_v2 = get_ai_evaluation_function(PAIR_PROMPT)
+                record['score_v2'], record['summary_v2'] = evaluate_image_improvement_v2(metrics_for_score)
+    return record
+
+def run_statistics(results_path, summary, resamples):
+    """
+    Add bootstrap confidence intervals and paired significance over the results file's per-pair
+    values to the run summary, and print them. Skipped for Parquet results without pyarrow.
+    """
+    if not resamples or summary.get('records', 0) < 2:
+        return
+    try:
+        with stage("stats.bootstrap"):
+            statistics = bootstrap_statistics(read_columns(results_path), resamples=resamples)
+    except ImportError as e:
+        print(colored(f"Skipping bootstrap statistics: {e}", 'yellow'))
+        return
+    summary['bootstrap'] = statistics
+    report_bootstrap(statistics)
+
+def compare_all_images(reference_directory, generated_directory, workers=1, cache_path=None, cache_size_mb=512, ffmpeg_path=None, vmaf_model=None, batch_size=32, metrics=None,
+                       results_path=None, progress_interval=5.0, verbose=False, resume=False, shard=None, near_duplicate_threshold=None,
+                       profile_sample=0.0, profile_dir=None, trace_memory=False, resample=None, memory_bounded=False, max_pair_memory_mb=None,
+                       store_path=None, bootstrap_resamples=DEFAULT_RESAMPLES, reference_pattern=DEFAULT_REFERENCE_PATTERN,
+                       generated_pattern=DEFAULT_GENERATED_PATTERN, pair_manifest=None):
     print("Entered compare all_images ...")
+    reset_stats()
     if not os.path.exists(reference_directory) or not os.path.exists(generated_directory):
         print(f"Error: One or both of the directories {reference_directory} and {generated_directory} do not exist.")
         return
     print("Passed OS directory check for compare_all_images ...")
-    reference_images = sorted(os.listdir(reference_directory))
-    generated_images = sorted(os.listdir(generated_directory))
-
-    reference_dict = {img.split('_base')[0]: img for img in reference_images}
-    generated_dict = {img.split('_improved')[0]: img for img in generated_images}
-    print("Reference Dict Keys:", reference_dict.keys())
-    print("Generated Dict Keys:", generated_dict.keys())
-    print("Common Keys:", reference_dict.keys() & generated_dict.keys())
-    print("Generated dictionary properly ...")
-    # Initialize the dictionary to hold the sum of each metric
-    metric_sums = {
-        'mse': 0,
-        'ssim': 0,
-        'psnr': 0,
-        'brisque_diff': 0,
-        'hist_corr': 0,
-        'edge_mse': 0,
-        'entropy_diff': 0,
-        'fft_mse': 0,
-        'ms_ssim': 0,
-        'gsim': 0,
-        'vmaf': 0
-    }
-
-    num_comparisons = 0
-    print("Pre-entering key block ...")
-    for key in reference_dict.keys() & generated_dict.keys():
-        print("Entered key block of compare_all_images ...")
-        ref_img_path = os.path.join(reference_directory, reference_dict[key])
-        gen_img_path = os.path.join(generated_directory, generated_dict[key])
-
-        results = compare_images(ref_img_path, gen_img_path)
-        if results:
-            num_comparisons += 1
-            mse_value, ssim_value, psnr_value, brisque_value_image1, brisque_value_image2, hist_corr_value, colorfulness_image1, colorfulness_image2, edge_mse_value, entropy_image1, entropy_image2, fft_mse_value, brisque_diff, ms_ssim_value, gsim_value, vmaf_value = results
-            
-            # Print comparison details
-            print(f"Comparing {reference_dict[key]} and {generated_dict[key]}:")
-            print(f"  MSE: {mse_value}")
-            print(f"  SSIM: {ssim_value}")
-            print(f"  PSNR: {psnr_value}")
-            print(f"  BRISQUE Difference (Improved - Base): {brisque_diff}")
-            print(f"  Histogram Correlation: {hist_corr_value}")
-            print(f"  Colorfulness for {reference_dict[key]}: {colorfulness_image1}")
-            print(f"  Colorfulness for {generated_dict[key]}: {colorfulness_image2}")
-            print(f"  Edge MSE: {edge_mse_value}")
-            print(f"  Entropy for {reference_dict[key]}: {entropy_image1}")
-            print(f"  Entropy for {generated_dict[key]}: {entropy_image2}")
-            print(f"  FFT MSE: {fft_mse_value}")
-            print(f"  MS-SSIM: {ms_ssim_value}")
-            print(f"  GSIM: {gsim_value}")
-            print(f"  VMAF: {vmaf_value}")
-            
-            # Extract metrics and evaluate improvement
-            metrics = {
-                'mse': mse_value,
-                'ssim': ssim_value,
-                'psnr': psnr_value,
-                'brisque_diff': brisque_diff,
-                'hist_corr': hist_corr_value,
-                'edge_mse': edge_mse_value,
-                'entropy_diff': entropy_image2[0] - entropy_image1[0],  # Difference in entropy
-                'fft_mse': fft_mse_value,
-                'ms_ssim': ms_ssim_value,
-                'gsim': gsim_value,
-                'vmaf': vmaf_value
-            }
-
-            # Update metric_sums
-            for metric, value in metrics.items():
-                metric_sums[metric] += value
-            
-            score, summary = evaluate_image_improvement(metrics, prompt="Make a hyper realistic  beautiful spotted bengal cat with green eyes ")
-            # Initialize secondary, AI-altered computation score and summaries to None
-            score_v2 = None
-            summary_v2 = None
-            if AI_ASSISTED:
-                from ai_adjusted_eval_metric import evaluate_image_improvement_v2
-                score_v2, summary_v2 = evaluate_image_improvement_v2(metrics)
-                print("Updated evaluation metric used.")
-            # Print the summary in red
-            res_string_printed = f"{summary} (Score: {score:.16f})"
-            res_string_printed_v2 = f"AI-altered metric summary:\n\n {summary_v2} (Score: {score_v2:.16f})"
-            print(colored(res_string_printed, 'red'))
-            print(colored(res_string_printed_v2, 'green'))
-            print()
-            if num_comparisons > 0: # Alter to return running total averages only near the end
-                metric_averages = {metric: value / num_comparisons for metric, value in metric_sums.items()}
-                print(colored("RUNNING TOTAL AVERAGE ACROSS IMAGE DATASET", 'magenta'))
-                for metric, average in metric_averages.items():
-                    print(f"{metric.upper()}: {average:.16f}")
-
-                # Get the score and summary
-                score, summary = evaluate_image_improvement(metric_averages, prompt=DEFAULT_PLACEHOLDER_PROMPT)
-
-                # Format the score to four decimal places when printing
-                conclusion_str = f"Conclusion on running total average for images: {summary} (Score: {score:.16f})"
-                print(colored(conclusion_str, 'green'))
+    # Both trees are walked recursively; the manifest lets a rescan skip unchanged directories
+    pair_manifest = pair_manifest or pair_manifest_path(reference_directory, generated_directory, reference_pattern, generated_pattern)
+    index = PairIndex(reference_directory, generated_directory, reference_pattern, generated_pattern, manifest_path=pair_manifest)
+    pairs, common_keys = {}, []
+    for key, reference_path, generated_path in index.pairs():
+        common_keys.append(key)
+        # Each node of a sharded run evaluates only the keys that hash to its shard
+        if not shard or shard_of(key, shard[1]) == shard[0]:
+            pairs[key] = (reference_path, generated_path)
+    print("Common Keys:", len(common_keys))
+    index.report()
+    # Scored metrics this run computes
+    computed_outputs = {output for metric in resolve_metrics(metrics) for output in metric.outputs}
+    scored_metrics = [metric for metric in SCORED_METRICS if metric in computed_outputs]
+    # The improvement score weighs all scored metrics, so a metric subset only reports values
+    can_score = len(scored_metrics) == len(SCORED_METRICS)
+    if not can_score:
+        print(colored(f"Metric subset selected; skipping improvement scores (they need {', '.join(SCORED_METRICS)}).", 'yellow'))
+
+    if shard:
+        print(f"Shard {shard[0]}/{shard[1]}: {len(pairs)} pairs")
+    cache_size_bytes = int(cache_size_mb * 1024 * 1024)
+    options = EvaluationOptions(cache_path=cache_path, cache_size_bytes=cache_size_bytes, ffmpeg_path=ffmpeg_path, vmaf_model=vmaf_model, batch_size=batch_size, metrics=metrics,
+                                near_duplicate_threshold=near_duplicate_threshold, profile_sample=profile_sample,
+                                profile_dir=profile_dir or os.path.join("logs", "profiles"), trace_memory=trace_memory, resample=resample,
+                                memory_bounded=memory_bounded, max_pair_bytes=int(max_pair_memory_mb * 1024 * 1024) if max_pair_memory_mb else None)
+    shard_suffix = f"_shard{shard[0]}of{shard[1]}" if shard else ""
+    results_path = results_path or os.path.join("logs", f"results_{time.strftime('%Y%m%d-%H%M%S')}{shard_suffix}.jsonl")
+    aggregator = ResultsAggregator()
+
+    # The manifest pins what the run evaluates; the results file is its log of completed pairs
+    settings = run_settings(reference_directory, generated_directory, options, shard, (reference_pattern, generated_pattern))
+    previous = load_manifest(results_path) if resume else None
+    if resume:
+        try:
+            check_resumable(previous, settings)
+        except ValueError as e:
+            print(colored(f"Error: {e}", 'red'))
+            return
+        # Rebuild the aggregates from stored records and skip the pairs they cover; failed pairs are retried
+        for record in read_results(results_path):
+            if record['key'] in pairs and not record.get('error'):
+                aggregator.update(record)
+                del pairs[record['key']]
+        print(colored(f"Resuming: {aggregator.records} pairs already evaluated, {len(pairs)} remaining", 'yellow'))
+    manifest = dict(settings, results_path=results_path, total_pairs=aggregator.records + len(pairs), status='running',
+                    orphans={side: len(paths) for side, paths in index.orphans.items()},
+                    started_at=previous['started_at'] if previous else time.strftime('%Y-%m-%dT%H:%M:%S'))
+    write_manifest(results_path, manifest)
+
+    view = ConsoleView(len(pairs), interval=progress_interval, verbose=verbose, labels=METRIC_LABELS)
+    print(f"Writing per-pair results to {results_path}")
+    # The store receives the pairs this invocation evaluates, as one run
+    store = ResultsStore(store_path) if store_path else None
+    store_writer = store.writer(store.start_run(settings, results_path)) if store else None
+    try:
+        with open_results_writer(results_path, append=resume) as writer:
+            for key, results in evaluate_pairs(pairs, workers=workers, options=options):
+                # Records name the images by their path within each tree, which is the file name for flat directories
+                reference_name = os.path.relpath(pairs[key][0], reference_directory)
+                generated_name = os.path.relpath(pairs[key][1], generated_directory)
+                record = pair_record(key, reference_name, generated_name, results, scored_metrics if can_score else None)
+                writer.write(record)
+                # Failure records stay in the results file; the store only holds compared pairs
+                if store_writer and not record.get('error'):
+                    store_writer.write(record, *pairs[key])
+                aggregator.update(record)
+                mean_score = aggregator.stats['score'].mean if 'score' in aggregator.stats else None
+                view.pair(reference_name, generated_name, results, score=record.get('score'), summary=record.get('summary'), mean_score=mean_score)
+    except KeyboardInterrupt:
+        write_manifest(results_path, dict(manifest, status='interrupted', completed=aggregator.records))
+        print(colored(f"\nInterrupted after {aggregator.records} pairs; rerun with --resume --results {results_path} to continue.", 'yellow'))
+        return None
+    finally:
+        if store:
+            store_writer.close()
+            store.close()
+    write_manifest(results_path, dict(manifest, status='complete', completed=aggregator.records, failed=aggregator.failed))
+
+    summary = report_summary(aggregator)
+    # Whether the averages and verdict hold up, from every stored pair including resumed ones
+    run_statistics(results_path, summary, bootstrap_resamples)
 
+    summary_path = os.path.splitext(results_path)[0] + ".summary.json"
+    write_summary(summary_path, summary)
+    # Mergeable aggregate state, combined across shards by merge_shards.py, which checks the shards saw the same pair keys
+    write_json_atomic(os.path.splitext(results_path)[0] + ".partial.json",
+                      dict(settings, dataset=dataset_identity(common_keys), partial=aggregator.to_partial()))
+    print(f"Results: {results_path}, summary: {summary_path}")
+    if store_path:
+        print(f"Stored in {store_path}; query it with results_db.py")
+
+    # Where the time went, per metric and per decode / ffmpeg / LLM stage, across all workers
+    stages_path = os.path.splitext(results_path)[0] + ".stages.json"
+    print(colored("STAGE TIMINGS", 'magenta'))
+    print(format_stats_table())
+    dump_stats(stages_path)
+    print(f"Stage timings: {stages_path}")
+
+    if cache_path:
+        cache_stats = open_feature_cache(cache_path, max_size_bytes=cache_size_bytes).stats()
+        print(f"Feature cache: {cache_stats['entries']} entries, {cache_stats['size_bytes'] / (1024 * 1024):.1f} MB at {cache_path}")
     print("Completed compare_all_images ...")
+    return summary
+
 
+def watch_images(reference_directory, generated_directory, results_path=None, interval=2.0, settle_seconds=DEFAULT_SETTLE_SECONDS, workers=1,
+                 options=None, verbose=False, store_path=None, bootstrap_resamples=DEFAULT_RESAMPLES, reference_pattern=DEFAULT_REFERENCE_PATTERN,
+                 generated_pattern=DEFAULT_GENERATED_PATTERN):
+    """
+    Evaluate pairs as they appear, until interrupted with Ctrl-C.
+
+    New `*_base` / `*_improved` files are picked up by polling both directories every `interval`
+    seconds. Files that are still being written are skipped until they have not changed for
+    `settle_seconds`, and each completed pair is evaluated once. Records are appended to
+    `results_path`; pairs it already holds are skipped, so restarting the watcher carries on
+    where it stopped. The aggregates are updated with every pair, and `<name>.summary.json`
+    and `<name>.partial.json` are rewritten after each batch of new pairs.
+
+    Args:
+        reference_directory (str): Directory receiving base images.
+        generated_directory (str): Directory receiving improved images.
+        results_path (str, optional): JSONL or Parquet results file. Defaults to `logs/results_watch.jsonl`.
+        interval (float): Seconds between polls.
+        settle_seconds (float): Quiet period before a file counts as complete.
+        workers (int): Worker processes per batch of new pairs.
+        options (EvaluationOptions, optional): Cache, VMAF and metric settings.
+        verbose (bool): Print every pair's metrics.
+        store_path (str, optional): SQLite results store also receiving every record, as one run per watch session.
+        bootstrap_resamples (int): Resamples for the confidence intervals of the final report; 0 skips them.
+        reference_pattern (str): Key pattern for base image file names.
+        generated_pattern (str): Key pattern for improved image file names.
+    """
+    if not os.path.isdir(reference_directory) or not os.path.isdir(generated_directory):
+        print(f"Error: One or both of the directories {reference_directory} and {generated_directory} do not exist.")
+        return None
+    options = options or EvaluationOptions()
+    results_path = results_path or os.path.join("logs", "results_watch.jsonl")
+    computed_outputs = {output for metric in resolve_metrics(options.metrics) for output in metric.outputs}
+    can_score = all(metric in computed_outputs for metric in SCORED_METRICS)
+
+    # A previous watch session's records seed the aggregates, and their pairs are not evaluated again.
+    # Pairs that failed are retried
+    aggregator = ResultsAggregator()
+    if os.path.exists(results_path):
+        for record in read_results(results_path):
+            if not record.get('error'):
+                aggregator.update(record)
+    settings = run_settings(reference_directory, generated_directory, options, key_patterns=(reference_pattern, generated_pattern))
+    if aggregator.records:
+        try:
+            check_resumable(load_manifest(results_path), settings)
+        except ValueError as e:
+            print(colored(f"Error: {e}", 'red'))
+            return None
+    watcher = PairWatcher(reference_directory, generated_directory, settle_seconds=settle_seconds,
+                          done=(record['key'] for record in read_results(results_path) if not record.get('error')) if aggregator.records else None,
+                          reference_pattern=reference_pattern, generated_pattern=generated_pattern)
+    manifest = dict(settings, results_path=results_path, status='watching', started_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    write_manifest(results_path, dict(manifest, completed=aggregator.records))
+    print(colored(f"Watching {reference_directory} and {generated_directory} every {interval:g}s; {aggregator.records} pairs already in {results_path}. "
+                  f"Press Ctrl-C to stop.", 'blue'))
+
+    base = os.path.splitext(results_path)[0]
+    store = ResultsStore(store_path) if store_path else None
+    store_writer = store.writer(store.start_run(settings, results_path)) if store else None
+    try:
+        with open_results_writer(results_path, append=True) as writer:
+            while True:
+                pairs = watcher.poll()
+                if pairs:
+                    started = time.monotonic()
+                    view = ConsoleView(len(pairs), interval=0, verbose=True, labels=METRIC_LABELS) if verbose else None
+                    for key, results in evaluate_pairs(pairs, workers=workers, options=options):
+                        reference_path, generated_path = pairs[key]
+                        record = pair_record(key, os.path.relpath(reference_path, reference_directory), os.path.relpath(generated_path, generated_directory), results,
+                                             SCORED_METRICS if can_score else None)
+                        writer.write(record)
+                        if store_writer and not record.get('error'):
+                            store_writer.write(record, reference_path, generated_path)
+                        aggregator.update(record)
+                        if view:
+                            view.pair(record['reference'], record['generated'], results, score=record.get('score'), summary=record.get('summary'))
+                    if store_writer:
+                        store_writer.flush()
+                    write_summary(base + ".summary.json", aggregator.summary())
+                    write_json_atomic(base + ".partial.json", dict(settings, partial=aggregator.to_partial()))
+                    write_manifest(results_path, dict(manifest, completed=aggregator.records))
+                    line = f"{len(pairs)} new pairs in {time.monotonic() - started:.1f}s; {aggregator.records} total"
+                    if 'score' in aggregator.stats:
+                        line += f", mean score {aggregator.stats['score'].mean:.4f}"
+                    print(colored(line, 'blue'))
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        if store:
+            store_writer.close()
+            store.close()
+    write_manifest(results_path, dict(manifest, status='stopped', completed=aggregator.records))
+    if not aggregator.records:
+        return None
+    summary = report_summary(aggregator)
+    run_statistics(results_path, summary, bootstrap_resamples)
+    write_summary(base + ".summary.json", summary)
+    return summary
 
 def main():
+    parser = argparse.ArgumentParser(description="Compare base and improved DALLE-3 images across a dataset.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv('EVALUATION_WORKERS', 1)), help="Number of worker processes used to evaluate image pairs in parallel (default: 1, serial).")
+    parser.add_argument("--cache-path", default=os.getenv('FEATURE_CACHE_PATH', os.path.join(".cache", "features.sqlite")), help="SQLite file caching metric values by image content hash.")
+    parser.add_argument("--cache-size-mb", type=float, default=float(os.getenv('FEATURE_CACHE_SIZE_MB', 512)), help="Size limit of the feature cache; least recently used entries are evicted beyond it.")
+    parser.add_argument("--ffmpeg-path", default=os.getenv('FFMPEG_PATH'), help="ffmpeg binary built with libvmaf (default: $FFMPEG_PATH or /usr/local/bin/FFmpeg/ffmpeg).")
+    parser.add_argument("--vmaf-model", default=os.getenv('VMAF_MODEL'), help="libvmaf model option, e.g. version=vmaf_v0.6.1 (default: $VMAF_MODEL or libvmaf's default).")
+    parser.add_argument("--batch-size", type=int, default=32, help="Image pairs per batch; VMAF scores a whole batch with one ffmpeg run.")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every metric without reading or writing the feature cache.")
+    parser.add_argument("--metrics", default=os.getenv('EVALUATION_METRICS', 'all'), help=f"Comma-separated metrics to compute (default: all). Available: {', '.join(METRICS)}.")
+    parser.add_argument("--results", default=os.getenv('RESULTS_PATH'), help="File receiving one record per pair: .jsonl, or .parquet with pyarrow installed (default: logs/results_<timestamp>.jsonl).")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between console progress lines.")
+    parser.add_argument("--verbose", action="store_true", help="Also print every pair's metrics to the console.")
+    parser.add_argument("--near-duplicate-threshold", type=float, default=None, help="Flag pairs with equal pHash and thumbnail distance at or below this (0-2) as near duplicates in their `duplicate` field; their metrics are still computed (default: $NEAR_DUPLICATE_THRESHOLD or 0, off).")
+    parser.add_argument("--profile-sample", type=float, default=0.0, help="Fraction of pairs (0-1, chosen by key hash) to run under cProfile.")
+    parser.add_argument("--profile-dir", default=os.path.join("logs", "profiles"), help="Directory for the .prof files of profiled pairs.")
+    parser.add_argument("--trace-memory", action="store_true", help="Record tracemalloc allocation peaks per stage (slower).")
+    parser.add_argument("--resample", choices=RESAMPLE_POLICIES, default=os.getenv('RESAMPLE_POLICY') or None, help="Align base/improved pairs of different resolutions for the pair metrics: resize the improved image to the base image's size (reference), or both to the smaller or larger one (default: $RESAMPLE_POLICY, or leave them and fail).")
+    parser.add_argument("--memory-bounded", action="store_true", help="Compute metrics with float32 planes, half spectra and streaming reductions to lower peak memory per worker.")
+    parser.add_argument("--max-pair-memory-mb", type=float, default=None, help="Implies --memory-bounded. Downscale pairs whose estimated pair-metric working set exceeds this many MB.")
+    parser.add_argument("--bootstrap-resamples", type=int, default=int(os.getenv('BOOTSTRAP_RESAMPLES', DEFAULT_RESAMPLES)), help=f"Bootstrap resamples for the confidence intervals and paired significance of the final report; 0 skips them (default: $BOOTSTRAP_RESAMPLES or {DEFAULT_RESAMPLES}).")
+    parser.add_argument("--shard", help="Evaluate only shard i of N (e.g. 0/4) of the pairs, partitioned by a stable hash of the pair key. Combine the shards with merge_shards.py.")
+    parser.add_argument("--store", default=os.getenv('RESULTS_STORE_PATH') or None, help="SQLite results store that also receives every record, for queries across runs with results_db.py (default: $RESULTS_STORE_PATH, or none).")
+    parser.add_argument("--resume", action="store_true", help="Continue the interrupted run whose --results file is given, skipping pairs it already evaluated.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and evaluate new pairs as they appear in the directories, until Ctrl-C (results default to logs/results_watch.jsonl).")
+    parser.add_argument("--watch-interval", type=float, default=2.0, help="Seconds between directory polls in --watch mode.")
+    parser.add_argument("--settle-seconds", type=float, default=DEFAULT_SETTLE_SECONDS, help="In --watch mode, wait until a file has not changed for this long before evaluating it.")
+    parser.add_argument("--reference-pattern", default=os.getenv('REFERENCE_KEY_PATTERN') or DEFAULT_REFERENCE_PATTERN, help="Regular expression matching base image file names; its `key` group pairs them with improved images (default: $REFERENCE_KEY_PATTERN or `<key>_base`).")
+    parser.add_argument("--generated-pattern", default=os.getenv('GENERATED_KEY_PATTERN') or DEFAULT_GENERATED_PATTERN, help="Regular expression matching improved image file names, with a `key` group (default: $GENERATED_KEY_PATTERN or `<key>_improved`).")
+    parser.add_argument("--pair-manifest", default=os.getenv('PAIR_MANIFEST_PATH') or None, help="JSON file keeping the directory scan between runs, so rescans only stat what changed (default: under .cache/pairs/).")
+    parser.add_argument("--reference-directory", help="Reference (base) images directory; skips the interactive prompt.")
+    parser.add_argument("--generated-directory", help="Generated (improved) images directory; skips the interactive prompt.")
+    args = parser.parse_args()
+    if args.resume and not args.results:
+        parser.error("--resume needs the --results file of the run to continue")
+    if args.watch and args.shard:
+        parser.error("--watch evaluates every new pair; it cannot be combined with --shard")
+    try:
+        metrics = parse_metric_list(args.metrics)
+        shard = parse_shard(args.shard) if args.shard else None
+        compile_key_pattern(args.reference_pattern)
+        compile_key_pattern(args.generated_pattern)
+    except (ValueError, re.error) as e:
+        parser.error(str(e))
+
     default_reference_directory = os.path.join(os.getcwd(), "src/resources/base")
     default_generated_directory = os.path.join(os.getcwd(), "src/resources/improved")
     default_generated_text_prompts = os.path.join(os.getcwd(), "src/resources/prompt_keys")
 
-    reference_directory = input(f"Enter the path to your reference images directory (default: {default_reference_directory}): ") or default_reference_directory
-    generated_directory = input(f"Enter the path to your generated images directory (default: {default_generated_directory}): ") or default_generated_directory
-    default_generated_text_prompts = input(f"Enter the path to your prompts directory (default: {default_generated_text_prompts}): ") or default_generated_text_prompts
+    if args.reference_directory or args.generated_directory:
+        reference_directory = args.reference_directory or default_reference_directory
+        generated_directory = args.generated_directory or default_generated_directory
+    else:
+        reference_directory = input(f"Enter the path to your reference images directory (default: {default_reference_directory}): ") or default_reference_directory
+        generated_directory = input(f"Enter the path to your generated images directory (default: {default_generated_directory}): ") or default_generated_directory
+        default_generated_text_prompts = input(f"Enter the path to your prompts directory (default: {default_generated_text_prompts}): ") or default_generated_text_prompts
+
+    if args.watch:
+        max_pair_bytes = int(args.max_pair_memory_mb * 1024 * 1024) if args.max_pair_memory_mb else None
+        cache_path = None if args.no_cache else args.cache_path
+        options = EvaluationOptions(cache_path=cache_path, cache_size_bytes=int(args.cache_size_mb * 1024 * 1024), ffmpeg_path=args.ffmpeg_path,
+                                    vmaf_model=args.vmaf_model, batch_size=args.batch_size, metrics=metrics,
+                                    near_duplicate_threshold=args.near_duplicate_threshold, profile_sample=args.profile_sample,
+                                    profile_dir=args.profile_dir, trace_memory=args.trace_memory, resample=args.resample,
+                                    memory_bounded=args.memory_bounded or max_pair_bytes is not None, max_pair_bytes=max_pair_bytes)
+        watch_images(reference_directory, generated_directory, results_path=args.results, interval=args.watch_interval,
+                     settle_seconds=args.settle_seconds, workers=args.workers, options=options, verbose=args.verbose, store_path=args.store,
+                     bootstrap_resamples=args.bootstrap_resamples, reference_pattern=args.reference_pattern, generated_pattern=args.generated_pattern)
+        return
 
-    compare_all_images(reference_directory, generated_directory)
+    compare_all_images(reference_directory, generated_directory, workers=args.workers,
+                       cache_path=None if args.no_cache else args.cache_path, cache_size_mb=args.cache_size_mb,
+                       ffmpeg_path=args.ffmpeg_path, vmaf_model=args.vmaf_model, batch_size=args.batch_size, metrics=metrics,
+                       results_path=args.results, progress_interval=args.progress_interval, verbose=args.verbose, resume=args.resume, shard=shard,
+                       near_duplicate_threshold=args.near_duplicate_threshold, profile_sample=args.profile_sample,
+                       profile_dir=args.profile_dir, trace_memory=args.trace_memory, resample=args.resample,
+                       memory_bounded=args.memory_bounded or args.max_pair_memory_mb is not None, max_pair_memory_mb=args.max_pair_memory_mb,
+                       store_path=args.store, bootstrap_resamples=args.bootstrap_resamples, reference_pattern=args.reference_pattern,
+                       generated_pattern=args.generated_pattern, pair_manifest=args.pair_manifest)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+# Combines the outputs of a sharded `main.py --shard i/N` run into one summary
+import argparse
+import glob
+import json
+import os
+
+from termcolor import colored
+
+from src.results import ResultsAggregator, report_summary, write_summary
+
+# Settings every shard of one run must share. Directory paths are not among them: nodes may mount
+# the same data at different paths, so shards are matched by their `dataset` identity instead
+SHARED_SETTINGS = ('metrics', 'metrics_version', 'resample', 'memory_bounded', 'key_patterns', 'dataset')
+
+
+def load_partials(paths):
+    partials = []
+    for path in paths:
+        with open(path) as file:
+            partials.append((path, json.load(file)))
+    return partials
+
+
+def merge_partials(partials):
+    """
+    Merge shard partial aggregates into one ResultsAggregator.
+
+    Raises ValueError when the shards come from different runs (other settings, or another set of
+    pair keys), disagree on the shard count, or a shard is present twice. Missing shards only
+    produce a warning, so a partial night can still be summarized.
+    """
+    if not partials:
+        raise ValueError("No shard partials to merge.")
+    first_path, first = partials[0]
+    seen = set()
+    count = None
+    for path, partial in partials:
+        differing = [name for name in SHARED_SETTINGS if partial.get(name) != first.get(name)]
+        if differing:
+            raise ValueError(f"{path} differs from {first_path} in {', '.join(differing)}; shards must come from the same run.")
+        shard = tuple(partial['shard']) if partial.get('shard') else (0, 1)
+        if count is not None and shard[1] != count:
+            raise ValueError(f"{path} is shard {shard[0]}/{shard[1]}, but other shards are out of {count}.")
+        if shard in seen:
+            raise ValueError(f"Shard {shard[0]}/{shard[1]} appears more than once.")
+        count = shard[1]
+        seen.add(shard)
+
+    missing = sorted(set(range(count)) - {index for index, _ in seen})
+    if missing:
+        print(colored(f"Warning: shards {', '.join(map(str, missing))} of {count} are missing; the summary covers only the shards given.", 'yellow'))
+
+    aggregator = ResultsAggregator()
+    for _, partial in partials:
+        aggregator.merge(ResultsAggregator.from_partial(partial['partial']))
+    return aggregator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the partial aggregates of a sharded evaluation into final averages and a verdict.")
+    parser.add_argument("partials", nargs="+", help="Shard `.partial.json` files written next to each shard's results, or glob patterns for them.")
+    parser.add_argument("--output", default=os.path.join("logs", "merged.summary.json"), help="Where to write the merged summary JSON.")
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.partials for path in (glob.glob(pattern) or [pattern])})
+    try:
+        aggregator = merge_partials(load_partials(paths))
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Merged {len(paths)} shard partials")
+    summary = report_summary(aggregator)
+    write_summary(args.output, summary)
+    print(f"Merged summary: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
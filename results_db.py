@@ -0,0 +1,122 @@
+# Loads results files into the SQLite results store and aggregates stored metrics without recomputing them
+import argparse
+import glob
+import os
+import time
+
+from termcolor import colored
+
+from src.results import ResultsStore, load_manifest, parse_since, read_results
+
+DEFAULT_STORE_PATH = os.getenv('RESULTS_STORE_PATH') or os.path.join("logs", "results.sqlite")
+
+
+def import_results(store, results_path, batch_size=1000):
+    """
+    Store the records of a JSONL results file as one run.
+
+    The run takes its settings and start time from the file's manifest when there is one.
+    Image hashes and sizes are stored for the images still found in the manifest's directories.
+
+    Returns:
+        tuple: (run id, number of records stored).
+    """
+    manifest = load_manifest(results_path) or {}
+    settings = {name: value for name, value in manifest.items() if name not in ('status', 'completed', 'started_at', 'results_path')}
+    started_at = None
+    if manifest.get('started_at'):
+        started_at = time.mktime(time.strptime(manifest['started_at'], '%Y-%m-%dT%H:%M:%S'))
+    run_id = store.start_run(settings, results_path=os.path.abspath(results_path), started_at=started_at)
+
+    def image_path(directory, name):
+        path = os.path.join(directory, name) if directory and name else None
+        return path if path and os.path.isfile(path) else None
+
+    count = 0
+    # Pairs are dated by the run's start, so time filters select them by when they were evaluated
+    with store.writer(run_id, batch_size=batch_size, created_at=started_at) as writer:
+        for record in read_results(results_path, repair=False):
+            # Failure records carry no values to store
+            if record.get('error'):
+                continue
+            writer.write(record, image_path(manifest.get('reference_directory'), record.get('reference')),
+                         image_path(manifest.get('generated_directory'), record.get('generated')))
+            count += 1
+    return run_id, count
+
+
+def format_value(value):
+    return f"{value:.6f}" if isinstance(value, float) else str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store evaluation results in SQLite and query them across runs.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="SQLite results store (default: $RESULTS_STORE_PATH or logs/results.sqlite).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="Store JSONL results files, one run each.")
+    load.add_argument("results", nargs="+", help="JSONL results files written by main.py, or glob patterns for them.")
+    load.add_argument("--batch-size", type=int, default=1000, help="Records per insert transaction.")
+
+    query = commands.add_parser("query", help="Aggregate one metric over the stored pairs.")
+    query.add_argument("metric", help="Stored metric, e.g. ssim, vmaf or score.")
+    query.add_argument("--key", help="Shell-style pattern on the prompt key, e.g. '*cat*' (case-sensitive).")
+    query.add_argument("--since", help="Only pairs stored since this age (7d, 12h, 1w) or date (2024-05-01).")
+    query.add_argument("--until", help="Only pairs stored before this age or date.")
+    query.add_argument("--run", type=int, help="Only this run's pairs (see the runs command).")
+    query.add_argument("--group-by", choices=("key", "run", "day"), help="One row per prompt key, run or day.")
+
+    commands.add_parser("runs", help="List the stored runs.")
+    commands.add_parser("metrics", help="List the stored metrics.")
+    args = parser.parse_args()
+
+    if args.command != "import" and not os.path.exists(args.store):
+        parser.error(f"No results store at {args.store}; add results with the import command or main.py --store.")
+
+    with ResultsStore(args.store) as store:
+        if args.command == "import":
+            paths = sorted({path for pattern in args.results for path in (glob.glob(pattern) or [pattern])})
+            for path in paths:
+                if not os.path.isfile(path):
+                    print(colored(f"Skipping {path}: no such file.", 'yellow'))
+                    continue
+                if path.endswith(".parquet"):
+                    print(colored(f"Skipping {path}: only JSONL results can be imported.", 'yellow'))
+                    continue
+                started = time.perf_counter()
+                run_id, count = import_results(store, path, batch_size=args.batch_size)
+                print(f"Run {run_id}: {count} pairs from {path} in {time.perf_counter() - started:.1f}s")
+
+        elif args.command == "query":
+            try:
+                since = parse_since(args.since) if args.since else None
+                until = parse_since(args.until) if args.until else None
+            except ValueError as e:
+                parser.error(str(e))
+            if args.metric not in store.metrics():
+                parser.error(f"No stored metric '{args.metric}'. Stored: {', '.join(store.metrics())}")
+            started = time.perf_counter()
+            rows = store.aggregate(args.metric, key_pattern=args.key, since=since, until=until, run_id=args.run, group_by=args.group_by)
+            elapsed = time.perf_counter() - started
+            if not rows:
+                print(colored("No stored pairs match.", 'yellow'))
+                return
+            columns = list(rows[0])
+            print("  ".join(f"{column:>14}" for column in columns))
+            for row in rows:
+                print("  ".join(f"{format_value(row[column]):>14}" for column in columns))
+            non_finite = sum(row['non_finite'] for row in rows)
+            excluded = f" ({non_finite} non-finite values excluded)" if non_finite else ""
+            print(colored(f"{sum(row['count'] for row in rows)} values of {args.metric}{excluded} in {elapsed * 1000:.0f} ms", 'blue'))
+
+        elif args.command == "runs":
+            for run in store.runs():
+                started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['started_at']))
+                print(f"{run['id']:>5}  {started}  {run['pairs']:>8} pairs  {run['results_path'] or ''}")
+
+        elif args.command == "metrics":
+            print("\n".join(store.metrics()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,62 @@
-# To Be Implemented for Integrity of Comparisons of Images
\ No newline at end of file
+# Ranks images by similarity to a reference image using a perceptual-hash / thumbnail index
+import argparse
+import json
+import os
+import sys
+
+from termcolor import colored
+
+from src.metrics.similarity_index import DISTANCES, SimilarityIndex
+
+
+def sort_by_similarity(reference, directory, index_path, top_k=None, by='combined'):
+    """
+    Rank the images under `directory` by similarity to `reference`.
+
+    The index at `index_path` is updated first, so only new or modified images are decoded.
+
+    Args:
+        reference (str): Path of the reference image.
+        directory (str): Directory of images to rank, searched recursively.
+        index_path (str): Location of the on-disk signature index.
+        top_k (int, optional): Return only the `top_k` nearest images. None returns the full order.
+        by (str): Distance to rank by: `combined`, `phash`, `dhash` or `vector`.
+
+    Returns:
+        list: `(path, distance)` tuples, most similar first.
+    """
+    index = SimilarityIndex(index_path)
+    added, removed = index.update(directory)
+    if added or removed:
+        index.save()
+    print(colored(f"Similarity index: {len(index)} images ({added} added or changed, {removed} removed) at {index_path}", 'blue'), file=sys.stderr)
+
+    signature = index.signature(reference)
+    if top_k:
+        return index.nearest(signature, k=top_k, by=by, directory=directory)
+    return index.sorted_by_distance(signature, by=by, directory=directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank images by similarity to a reference image.")
+    parser.add_argument("reference", help="Reference image to rank against.")
+    parser.add_argument("directory", help="Directory of images to rank, searched recursively.")
+    parser.add_argument("--index", default=os.getenv('SIMILARITY_INDEX_PATH', os.path.join(".cache", "similarity_index.npz")), help="On-disk signature index, updated incrementally.")
+    parser.add_argument("--top-k", type=int, help="Show only the K most similar images instead of the full order.")
+    parser.add_argument("--by", choices=DISTANCES, default='combined', help="Distance to rank by (default: combined pHash and thumbnail distance).")
+    parser.add_argument("--json", action="store_true", help="Print the ranking as JSON lines instead of a table.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.reference) or not os.path.isdir(args.directory):
+        parser.error("the reference image and the directory must both exist")
+
+    ranking = sort_by_similarity(args.reference, args.directory, args.index, top_k=args.top_k, by=args.by)
+    for rank, (path, distance) in enumerate(ranking, start=1):
+        if args.json:
+            print(json.dumps({'rank': rank, 'path': path, 'distance': distance}))
+        else:
+            print(f"{rank:6d}  {distance:10.4f}  {path}")
+
+
+if __name__ == "__main__":
+    main()
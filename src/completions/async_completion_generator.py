@@ -0,0 +1,208 @@
+import asyncio
+import os
+import random
+import time
+from typing import List, Optional
+
+import aiohttp
+import openai
+from dotenv import load_dotenv
+from termcolor import colored
+
+from src.utils.instrumentation import stage
+
+from .completion_generator import open_completion_cache, request_key
+
+current_env = load_dotenv()
+openai_key = os.getenv('OPENAI_API_KEY')
+chosen_model = os.getenv('MODEL')
+openai_api_base = os.getenv('OPENAI_API_BASE')
+
+# Errors worth retrying: rate limits, timeouts and transient server or connection failures
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    openai.error.APIError,
+)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`, holding at most `capacity` tokens.
+
+    Used both for requests per minute (one token per request) and tokens per minute
+    (the estimated prompt plus completion tokens of each request).
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # Created on first use, inside the running event loop
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1):
+        # A request larger than the bucket would wait forever; let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def estimate_tokens(messages: List[dict], max_tokens: int) -> int:
+    # Roughly four characters per token, plus the completion budget the request reserves
+    return sum(len(message.get('content', '')) for message in messages) // 4 + max_tokens
+
+
+class AsyncChatCompletionGenerator:
+    def __init__(self, temperature: Optional[float] = 0.1, openai_api_key: Optional[str] = openai_key, model: Optional[str] = chosen_model,
+                 max_concurrency: int = 8, requests_per_minute: float = 3500, tokens_per_minute: float = 180000,
+                 max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0, max_tokens: int = 4000,
+                 api_base: Optional[str] = openai_api_base, use_cache: bool = True):
+        """
+        asyncio counterpart of ChatCompletionGenerator for fanning out many completions at once.
+
+        Requests share one aiohttp session, run at most `max_concurrency` at a time, are paced by
+        request- and token-per-minute buckets, retry transient failures with jittered exponential
+        backoff, and identical requests already in flight are coalesced into a single API call.
+        Use it as an async context manager so the shared session is opened and closed.
+
+        Args:
+            temperature (float, optional): Default sampling temperature.
+            openai_api_key (str, optional): The API key for OpenAI.
+            model (str, optional): Default model.
+            max_concurrency (int): Maximum simultaneous requests.
+            requests_per_minute (float): Request rate limit.
+            tokens_per_minute (float): Estimated token rate limit.
+            max_retries (int): Retries per request after the first attempt.
+            base_delay (float): First backoff delay in seconds, doubled on every retry.
+            max_delay (float): Upper bound of a single backoff delay.
+            max_tokens (int): Completion budget per request.
+            api_base (str, optional): Alternative API endpoint, e.g. a local mock server.
+            use_cache (bool): Serve repeated requests from the on-disk response cache shared with
+                ChatCompletionGenerator.
+        """
+        self.openai_api_key = openai_api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.api_base = api_base
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._request_bucket = TokenBucket(requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute)
+        self._in_flight = {}
+        self._session = None
+        self.api_calls = 0
+        self.coalesced = 0
+        self.cache = open_completion_cache() if use_cache else None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession()
+        openai.aiosession.set(self._session)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        openai.aiosession.set(None)
+        await self._session.close()
+        self._session = None
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = getattr(error, 'headers', None) or {}
+        retry_after = retry_after.get('retry-after') if hasattr(retry_after, 'get') else None
+        if retry_after:
+            try:
+                # Honour the server's delay, but never let it hold a worker longer than max_delay
+                return min(max(float(retry_after), 0.0), self.max_delay)
+            except ValueError:
+                pass
+        # Full jitter: a random delay up to the exponential bound spreads out synchronized retries
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _create(self, messages: List[dict], temperature: float, model: str) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        for attempt in range(self.max_retries + 1):
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(estimate_tokens(messages, self.max_tokens))
+            try:
+                # Only the request itself holds a concurrency slot, not the backoff sleep
+                async with self._semaphore:
+                    self.api_calls += 1
+                    # Requests overlap, so only this stage's wall time is meaningful per call
+                    with stage("llm.async_completion"):
+                        response = await openai.ChatCompletion.acreate(
+                            model=model,
+                            messages=messages,
+                            max_tokens=self.max_tokens,
+                            temperature=temperature,
+                            api_key=self.openai_api_key,
+                            api_base=self.api_base,
+                        )
+                return response['choices'][0]['message']['content']
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                print(colored(f"Completion attempt {attempt + 1} failed ({type(e).__name__}); retrying in {delay:.1f}s", 'yellow'))
+                await asyncio.sleep(delay)
+
+    async def _create_and_cache(self, key: str, messages: List[dict], temperature: float, model: str) -> str:
+        content = await self._create(messages, temperature, model)
+        if self.cache is not None:
+            self.cache.set(key, content)
+        return content
+
+    async def generate_completion(self, messages: List[dict], temperature: Optional[float] = None, model: Optional[str] = "gpt-3.5-turbo-16k-0613") -> str:
+        """
+        Generates a completion using OpenAI's ChatCompletion API without blocking the event loop.
+
+        Args:
+            messages (List[dict]): A list of messages to start the completion. Each message is a dictionary containing 'role' and 'content' keys.
+            temperature (float, optional): Sampling temperature, defaulting to the generator's.
+            model (str, optional): The model to use for the completion.
+
+        Returns:
+            str: The content of the completion generated by the model.
+        """
+        temperature = self.temperature if temperature is None else temperature
+        model = model or self.model
+        key = request_key(model, messages, temperature, self.max_tokens)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._create_and_cache(key, messages, temperature, model))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shield so one cancelled waiter does not cancel the request for everyone sharing it
+        return await asyncio.shield(task)
+
+    async def generate_completions(self, message_lists: List[List[dict]], temperature: Optional[float] = None, model: Optional[str] = "gpt-3.5-turbo-16k-0613", return_exceptions: bool = False) -> list:
+        """Run many completions concurrently, returning their contents in input order."""
+        return await asyncio.gather(
+            *(self.generate_completion(messages, temperature=temperature, model=model) for messages in message_lists),
+            return_exceptions=return_exceptions,
+        )
@@ -1,16 +1,44 @@
 from typing import Optional, List
-import openai
+import hashlib
+import json
 from dotenv import load_dotenv
 from termcolor import colored
 import os
+from src.utils.disk_cache import DiskCache
+from src.utils.instrumentation import stage
 
 current_env = load_dotenv()
 openai_key = os.getenv('OPENAI_API_KEY')
 chosen_model = os.getenv('MODEL')
+completion_cache_path = os.getenv('COMPLETION_CACHE_PATH', os.path.join(".cache", "completions.sqlite"))
+completion_cache_ttl = float(os.getenv('COMPLETION_CACHE_TTL_HOURS', 24 * 7)) * 3600
+completion_cache_size = int(float(os.getenv('COMPLETION_CACHE_SIZE_MB', 256)) * 1024 * 1024)
+
+# Response caches shared by every generator in this process, keyed by path
+_completion_caches = {}
+
+
+def request_key(model: str, messages: List[dict], temperature: float, max_tokens: int) -> str:
+    """Stable hash of everything that determines a completion request."""
+    payload = json.dumps({'model': model, 'messages': messages, 'temperature': temperature, 'max_tokens': max_tokens}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def open_completion_cache(path: Optional[str] = completion_cache_path, ttl_seconds: Optional[float] = completion_cache_ttl,
+                          max_size_bytes: Optional[int] = completion_cache_size) -> Optional[DiskCache]:
+    """
+    Response cache for chat completions: compressed entries, expiring after `ttl_seconds`, with
+    least recently used entries evicted beyond `max_size_bytes`. None or an empty path disables it.
+    """
+    if not path:
+        return None
+    if path not in _completion_caches:
+        _completion_caches[path] = DiskCache(path, max_size_bytes=max_size_bytes, ttl_seconds=ttl_seconds, compress=True)
+    return _completion_caches[path]
 
 
 class ChatCompletionGenerator:
-    def __init__(self, temperature: Optional[float]=0.33, openai_api_key: Optional[str] = openai_key, model: Optional[str] = chosen_model):
+    def __init__(self, temperature: Optional[float]=0.33, openai_api_key: Optional[str] = openai_key, model: Optional[str] = chosen_model, use_cache: bool = True):
         """
         Constructor for the SystemMessageMaker class.
         
@@ -18,11 +46,21 @@ class ChatCompletionGenerator:
             openai_api_key (str, optional): The API key for OpenAI. Defaults to None.
             model (str, optional): The model for OpenAI. Defaults to None.
             super_charged (str, optional): The super charged mode for GPT-4. Defaults to None.
+            use_cache (bool, optional): Serve repeated requests (same model, messages and sampling
+                parameters) from the on-disk response cache. Defaults to True.
         """
         self.openai_api_key = openai_key
         self.model = chosen_model
+        # openai is slow to import, so it is only loaded once a generator is actually created
+        import openai
         openai.api_key = self.openai_api_key
         self.temperature = temperature
+        self.max_tokens = 4000
+        self.cache = open_completion_cache() if use_cache else None
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of the response cache for this process."""
+        return self.cache.stats() if self.cache is not None else {'hits': 0, 'misses': 0, 'entries': 0, 'size_bytes': 0}
 
     def generate_completion(self, messages: List[dict], temperature: Optional[float]=0.1, model: Optional[str] = "gpt-3.5-turbo-16k-0613") -> str:
         print(f"MODEL ACTUALLY BEING USED: {model}")
@@ -37,13 +75,25 @@ class ChatCompletionGenerator:
         Returns:
             str: The content of the completion generated by the model.
         """
+        key = request_key(model, messages, temperature, self.max_tokens)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                print(colored("--Served completion from response cache--\n", 'blue'))
+                return cached
+
         print(colored("\nGenerating completion with model ...\n", 'magenta'))
 
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages = messages,
-            max_tokens = 4000,
-            temperature = temperature
-        )
+        import openai
+        with stage("llm.completion"):
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages = messages,
+                max_tokens = self.max_tokens,
+                temperature = temperature
+            )
         print(colored("--Successfully completed last API call--\n", 'blue'))
-        return response['choices'][0]['message']['content']
\ No newline at end of file
+        content = response['choices'][0]['message']['content']
+        if self.cache is not None:
+            self.cache.set(key, content)
+        return content
\ No newline at end of file
@@ -5,33 +5,210 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 
 
 import argparse
+import asyncio
+import json
+from typing import Iterable, Iterator, Optional, TextIO, Tuple
 from src.utils.constants_for_prompt_enhancement import *
 from src.completions.completion_generator import ChatCompletionGenerator
 from src.utils.helpers import update_message_with_new_prompt
 from dotenv import load_dotenv
 from termcolor import colored
 
+ENHANCEMENT_MODEL = "gpt-3.5-turbo-16k-0613"
+
+def enhancement_messages(prompt: str) -> list:
+    user_defined_input = update_message_with_new_prompt(USER_INPUT_FOR_ENHANCEMENT, prompt)
+    return [{"role": "system", "content": SYSTEM_MESSAGE_OPTIMIZER},
+            {"role": "user", "content": STATIC_USER_QUESTION_INPUT},
+            {"role": "assistant", "content": LLM_RESPONSE_FOR_CONTEXT},
+            {"role": "user", "content": user_defined_input}]
+
 def main(prompt: str) -> str:
     imported_env = load_dotenv()
     openai_api_key = os.getenv('OPENAI_API_KEY')
 
-    generator = ChatCompletionGenerator(temperature=0.1, openai_api_key=openai_api_key, model="gpt-3.5-turbo-16k-0613")
-
-    user_defined_input = update_message_with_new_prompt(USER_INPUT_FOR_ENHANCEMENT, prompt)
+    generator = ChatCompletionGenerator(temperature=0.1, openai_api_key=openai_api_key, model=ENHANCEMENT_MODEL)
 
-    prompt_optimizer_list_and_dict = [{"role": "system", "content": SYSTEM_MESSAGE_OPTIMIZER},
-                                      {"role": "user", "content": STATIC_USER_QUESTION_INPUT},
-                                      {"role": "assistant", "content": LLM_RESPONSE_FOR_CONTEXT},
-                                      {"role": "user", "content": user_defined_input}]
+    prompt_optimizer_list_and_dict = enhancement_messages(prompt)
     optimized_prompt = generator.generate_completion(prompt_optimizer_list_and_dict)
     print(colored("Optimized prompt:\n\n", 'magenta'))
     print(colored(optimized_prompt, 'green'))
     return optimized_prompt
 
+def read_prompts(lines: Iterable[str]) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """
+    Yield `(id, prompt, error)` for every non-blank line of a prompt catalogue.
+
+    Lines starting with `{` are parsed as JSON objects with a `prompt` field and an optional `id`;
+    any other line is a plain-text prompt. Prompts without an id are numbered by their position
+    among the prompts, so resuming relies on the catalogue not being reordered in between.
+    A malformed JSON line is not fatal: it is yielded with the raw line as its prompt and the
+    parse error as `error`, which is None for every valid line.
+    """
+    index = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        prompt_id, prompt, error = str(index), line, None
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+                    raise ValueError("expected an object with a string `prompt` field")
+                prompt_id, prompt = str(record.get("id", index)), record["prompt"]
+            except ValueError as e:
+                error = f"Malformed line: {type(e).__name__}: {e}"
+        index += 1
+        yield prompt_id, prompt, error
+
+def load_checkpoint(path: str) -> set:
+    """
+    Ids already enhanced in an earlier run's output file. A line cut short by an interruption is
+    truncated away so appended results start on a fresh line. Failed prompts are not counted and
+    will be retried.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb") as file:
+        content = file.read()
+    complete = content[:content.rfind(b"\n") + 1]
+    if len(complete) != len(content):
+        with open(path, "r+b") as file:
+            file.truncate(len(complete))
+    done = set()
+    for line in complete.decode().splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "enhanced" in record:
+            done.add(str(record["id"]))
+    return done
+
+async def enhance_batch(prompts: Iterable[Tuple[str, str, Optional[str]]], output: TextIO, done: Optional[set] = None, concurrency: int = 8,
+                        order: str = "input", model: str = ENHANCEMENT_MODEL, window: Optional[int] = None) -> dict:
+    """
+    Enhance `(id, prompt, error)` items concurrently, writing one JSON line per prompt to `output`.
+
+    At most `concurrency` prompts are in flight, and prompts are read from the iterable only as
+    slots free up, so arbitrarily long catalogues stream through in bounded memory. With
+    `order="input"` results are written in the order the prompts were read, holding back
+    results that finish ahead of a slower earlier prompt; at most `window` prompts (default
+    four times `concurrency`) are read past the oldest unwritten one, so a slow or retrying
+    prompt pauses reading instead of letting held-back results pile up. `order="completion"`
+    writes each result as soon as it arrives. Prompts whose id is in `done` are skipped, and
+    items with an `error` (malformed input lines) are recorded as failed without being sent.
+    Each line is `{"id", "prompt", "enhanced"}`, or `{"id", "prompt", "error"}` for a prompt that failed.
+
+    Returns:
+        dict: Counts of `enhanced`, `failed` and `skipped` prompts.
+    """
+    from src.completions.async_completion_generator import AsyncChatCompletionGenerator
+
+    done = done or set()
+    window = max(1, window or 4 * concurrency)
+    counts = {'enhanced': 0, 'failed': 0, 'skipped': 0}
+    pending = {}
+    next_to_write = 0
+    position = 0
+    written = asyncio.Condition()
+
+    def write(record):
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+    def queued():
+        nonlocal position
+        for prompt_id, prompt, error in prompts:
+            if prompt_id in done:
+                counts['skipped'] += 1
+                continue
+            position += 1
+            yield position - 1, prompt_id, prompt, error
+
+    async def worker(generator, queue):
+        nonlocal next_to_write
+        while True:
+            if order == "input":
+                # Backpressure: wait for the oldest unwritten result before reading past the window
+                async with written:
+                    await written.wait_for(lambda: position - next_to_write < window)
+            # Workers share one iterator; it is only advanced between awaits, so no locking is needed
+            item = next(queue, None)
+            if item is None:
+                return
+            index, prompt_id, prompt, error = item
+            record = {"id": prompt_id, "prompt": prompt}
+            if error:
+                record["error"] = error
+                counts['failed'] += 1
+            else:
+                try:
+                    record["enhanced"] = await generator.generate_completion(enhancement_messages(prompt), model=model)
+                    counts['enhanced'] += 1
+                except Exception as e:
+                    record["error"] = f"{type(e).__name__}: {e}"
+                    counts['failed'] += 1
+            if order == "completion":
+                write(record)
+                continue
+            pending[index] = record
+            if next_to_write in pending:
+                while next_to_write in pending:
+                    write(pending.pop(next_to_write))
+                    next_to_write += 1
+                async with written:
+                    written.notify_all()
+
+    async with AsyncChatCompletionGenerator(temperature=0.1, model=model, max_concurrency=concurrency) as generator:
+        queue = queued()
+        await asyncio.gather(*(worker(generator, queue) for _ in range(concurrency)))
+    return counts
+
+def run_batch(source: str, output_path: Optional[str] = None, concurrency: int = 8, order: str = "input",
+              resume: bool = True, model: str = ENHANCEMENT_MODEL, window: Optional[int] = None) -> dict:
+    """
+    Enhance every prompt in `source` (a file path, or `-` for stdin) and stream the results as JSONL
+    to `output_path`, or stdout. The output file doubles as the checkpoint: with `resume`, prompts
+    it already holds a result for are not sent again and new results are appended. Malformed input
+    lines are written as failed prompts, and retried on resume like any other failure.
+    """
+    load_dotenv()
+    done = load_checkpoint(output_path) if output_path and resume else set()
+    if done:
+        print(colored(f"Resuming: {len(done)} prompts already enhanced in {output_path}", 'yellow'), file=sys.stderr)
+
+    input_file = sys.stdin if source == "-" else open(source, "r")
+    output_file = open(output_path, "a" if resume else "w") if output_path else sys.stdout
+    try:
+        counts = asyncio.run(enhance_batch(read_prompts(input_file), output_file, done=done, concurrency=concurrency, order=order, model=model,
+                                           window=window))
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    print(colored(f"Enhanced {counts['enhanced']} prompts, {counts['failed']} failed, {counts['skipped']} skipped", 'green'), file=sys.stderr)
+    return counts
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate a vastly improved prompt using your basal prompt as input.")
-    parser.add_argument("prompt", type=str, help="The user-defined prompt for completion generation. This is the pre-optimized version.")
-    
+    parser.add_argument("prompt", type=str, nargs="?", help="The user-defined prompt for completion generation. This is the pre-optimized version.")
+    parser.add_argument("--batch", metavar="FILE", help="Enhance every prompt in FILE (plain text, one prompt per line, or JSONL with a `prompt` field); `-` reads stdin.")
+    parser.add_argument("--output", help="JSONL file for batch results, also used as the checkpoint to resume from. Defaults to stdout.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum prompts enhanced at once in batch mode.")
+    parser.add_argument("--order", choices=["input", "completion"], default="input", help="Write batch results in input order or as they complete.")
+    parser.add_argument("--window", type=int, default=None, help="With --order input, read at most this many prompts past the oldest unwritten result (default: 4x concurrency).")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite the output file instead of resuming from it.")
+    parser.add_argument("--model", default=ENHANCEMENT_MODEL, help="Model used for enhancement in batch mode.")
+
     args = parser.parse_args()
-    
-    main(args.prompt)
+
+    if args.batch:
+        run_batch(args.batch, output_path=args.output, concurrency=args.concurrency, order=args.order, resume=not args.no_resume, model=args.model,
+                  window=args.window)
+    elif args.prompt:
+        main(args.prompt)
+    else:
+        parser.error("provide a prompt, or --batch FILE")
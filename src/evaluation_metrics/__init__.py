@@ -1,5 +1,21 @@
 from .evaluation_metrics import (
     normalize_metric,
     evaluate_image_improvement,
-    compare_images
-)
\ No newline at end of file
+    compare_images,
+    SCORED_METRICS
+)
+from .batch_scoring import (
+    SCORING_TABLE,
+    TOTAL_WEIGHT,
+    SUMMARIES,
+    IDENTICAL_SUMMARY,
+    metrics_to_columns,
+    score_batch,
+    summary_bucket,
+    summarize_buckets
+)
+from .ai_evaluation import (
+    AI_EVALUATION_MODEL,
+    compile_evaluation_function,
+    get_ai_evaluation_function
+)
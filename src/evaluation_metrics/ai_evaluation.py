@@ -0,0 +1,107 @@
+import hashlib
+import os
+import re
+from typing import Callable, Optional
+
+from termcolor import colored
+
+from src.utils.constants import AI_FILE_IMPORTS, STATIC_CODE
+from src.utils.disk_cache import DiskCache
+
+AI_EVALUATION_MODEL = "gpt-3.5-turbo-16k-0613"
+AI_EVALUATION_MODULE = "ai_adjusted_eval_metric.py"
+DEFAULT_CACHE_PATH = os.path.join(".cache", "ai_evaluation.sqlite")
+
+# Compiled evaluation functions for this process, keyed like the disk cache
+_compiled_functions = {}
+_disk_caches = {}
+
+
+def _cache_key(prompt: str, model: str) -> str:
+    digest = hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+    return f"ai_eval:{model}:{digest}"
+
+
+def generated_module_path(prompt: str, model: str, cache_path: str) -> str:
+    """Where freshly generated code for `prompt` is written for inspection: next to the cache, one file per prompt and model."""
+    digest = _cache_key(prompt, model).rsplit(":", 1)[1][:12]
+    name, extension = os.path.splitext(AI_EVALUATION_MODULE)
+    return os.path.join(os.path.dirname(os.path.abspath(cache_path)), f"{name}_{digest}{extension}")
+
+
+def _disk_cache(path: Optional[str]):
+    if path is None:
+        return None
+    if path not in _disk_caches:
+        _disk_caches[path] = DiskCache(path, max_size_bytes=None)
+    return _disk_caches[path]
+
+
+def extract_code(text: str) -> str:
+    """Strip the markdown fences the model sometimes wraps its code in."""
+    fenced = re.search(r"```(?:py|python)?\s*\n(.*?)```", text, re.DOTALL)
+    return fenced.group(1) if fenced else text
+
+
+def compile_evaluation_function(code: str) -> Callable:
+    """
+    Compile generated code into its scoring function, without importing it from disk.
+
+    The function is the first top-level callable named `evaluate_image_improvement*`,
+    preferring `evaluate_image_improvement_v2`.
+    """
+    namespace = {}
+    exec(compile(AI_FILE_IMPORTS + extract_code(code), AI_EVALUATION_MODULE, "exec"), namespace)
+    if callable(namespace.get('evaluate_image_improvement_v2')):
+        return namespace['evaluate_image_improvement_v2']
+    for name, value in namespace.items():
+        if name.startswith('evaluate_image_improvement') and callable(value):
+            return value
+    raise ValueError("Generated code does not define an evaluate_image_improvement function.")
+
+
+def get_ai_evaluation_function(prompt: str, model: str = AI_EVALUATION_MODEL, cache_path: Optional[str] = None) -> Callable:
+    """
+    Return the AI-adjusted evaluation function for `prompt`, generating it at most once.
+
+    Lookups go through an in-process dict of compiled callables, then a disk cache of the
+    generated source keyed by prompt hash and model, and only then to `analyze_prompt`
+    (two chat completions). Freshly generated source is also written next to the cache, to
+    `ai_adjusted_eval_metric_<hash>.py` (see `generated_module_path`), for inspection; scoring
+    never re-imports that file.
+
+    Args:
+        prompt (str): The text prompt the images were generated from.
+        model (str): Model used to tailor the evaluation function.
+        cache_path (str, optional): SQLite cache of generated code. Defaults to
+            `$AI_EVALUATION_CACHE_PATH`, then `.cache/ai_evaluation.sqlite`.
+    """
+    key = _cache_key(prompt, model)
+    if key in _compiled_functions:
+        return _compiled_functions[key]
+
+    cache_path = cache_path or os.getenv('AI_EVALUATION_CACHE_PATH', DEFAULT_CACHE_PATH)
+    cache = _disk_cache(cache_path)
+    code = cache.get(key)
+    generated = code is None
+    if generated:
+        from src.utils.helpers import analyze_prompt
+        print(colored("Entered AI adaptive metric alterations block", 'red'))
+        code = analyze_prompt(model=model, prompt=prompt)
+        module_path = generated_module_path(prompt, model, cache_path)
+        with open(module_path, 'w') as file:
+            file.write(AI_FILE_IMPORTS + extract_code(code))
+        print(colored(f"RESULTANT CODE GENERATED, written to {module_path}", 'magenta'))
+
+    try:
+        function = compile_evaluation_function(code)
+    except Exception as e:
+        # Fall back to the static evaluation function rather than failing the whole run
+        print(colored(f"Generated evaluation function is unusable ({e}); falling back to the static one.", 'red'))
+        function = compile_evaluation_function(STATIC_CODE)
+    else:
+        if generated:
+            cache.set(key, code)
+
+    _compiled_functions[key] = function
+    return function
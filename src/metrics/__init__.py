@@ -11,5 +11,14 @@ from .metric_calculations import (
     calculate_brisque,
     calculate_psnr,
     calculate_colorfulness,
-    compare_images
-)
\ No newline at end of file
+    compare_images,
+    get_brisque
+)
+from .image_context import ImageContext, ImagePairContext, RESAMPLE_POLICIES
+from .feature_cache import FeatureCache, open_feature_cache, METRICS_VERSION
+from .vmaf import VmafEngine
+from .registry import METRICS, Metric, register_metric, resolve_metrics, required_planes, parse_metric_list
+from .perceptual_hash import phash, dhash, thumbnail_vector, image_signature, hamming_distances, l2_distances
+from .similarity_index import SimilarityIndex
+from .structural import STRUCTURAL_METRICS, structural_similarity_batch
+from .brisque_native import BrisqueModel, brisque_features
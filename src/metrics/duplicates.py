@@ -0,0 +1,31 @@
+import os
+from typing import Optional
+
+from .perceptual_hash import hamming_distances, l2_distances
+
+# L2 distance between the unit-norm thumbnail vectors of two images (0-2) at or below which
+# they count as near duplicates. 0 disables the near-duplicate check; byte-identical images
+# are always detected.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0))
+
+# Values of the `duplicate` field compare_images reports
+DUPLICATE_KINDS = ('distinct', 'identical', 'near')
+
+
+def duplicate_kind(pair, near_threshold: Optional[float] = None) -> str:
+    """
+    Classify an ImagePairContext as `identical` (same file contents), `near` (same pHash and
+    thumbnails within `near_threshold`) or `distinct`.
+
+    The identical check only compares content hashes, which are needed for cache keys anyway.
+    The near check decodes both images, so it only runs when a threshold is set.
+    """
+    if pair.image1.content_hash == pair.image2.content_hash:
+        return 'identical'
+    near_threshold = NEAR_DUPLICATE_THRESHOLD if near_threshold is None else near_threshold
+    if near_threshold > 0:
+        signature1, signature2 = pair.image1.perceptual_signature, pair.image2.perceptual_signature
+        if (hamming_distances(signature1['phash'], signature2['phash']) == 0
+                and l2_distances(signature1['vector'], signature2['vector']) <= near_threshold):
+            return 'near'
+    return 'distinct'
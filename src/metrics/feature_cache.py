@@ -0,0 +1,86 @@
+import hashlib
+from typing import Optional
+
+import numpy as np
+
+from src.utils.disk_cache import DiskCache
+
+# Bump whenever a metric implementation changes so previously cached values are not reused
+METRICS_VERSION = 3
+
+# One open cache per path and process, so pool workers reuse their connection across pairs
+_open_caches = {}
+
+
+def _encode(value):
+    if isinstance(value, np.ndarray):
+        return {'array': value.tolist()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and 'array' in value:
+        return np.array(value['array'])
+    return value
+
+
+class FeatureCache:
+    """
+    Content-addressed cache of per-image and per-pair metric values.
+
+    Images are keyed by the hash of their file contents, so renamed or moved files still
+    hit, and any edit to an image invalidates only the entries that depend on it. Pair
+    entries hold VMAF too, so they are also keyed by the VMAF engine that scored them.
+
+    Args:
+        path (str): Location of the SQLite file.
+        max_size_bytes (int): Size budget of the cache.
+        version (int): Metrics version the entries belong to.
+        vmaf_identity (str, optional): `VmafEngine.identity` of the run, e.g. its ffmpeg binary and model.
+    """
+
+    def __init__(self, path: str, max_size_bytes=512 * 1024 * 1024, version: int = METRICS_VERSION, vmaf_identity: Optional[str] = None):
+        self.store = DiskCache(path, max_size_bytes=max_size_bytes)
+        self.version = version
+        self.vmaf_identity = vmaf_identity
+        self._vmaf_key = f":vmaf-{hashlib.sha256(vmaf_identity.encode()).hexdigest()[:12]}" if vmaf_identity else ""
+
+    def _image_key(self, image):
+        return f"image:v{self.version}:{image.content_hash}"
+
+    def _pair_key(self, pair):
+        # Resampled or memory-bounded values are stored apart from the default ones
+        variant = f":{pair.variant}" if pair.variant else ""
+        return f"pair:v{self.version}:{pair.image1.content_hash}:{pair.image2.content_hash}{variant}{self._vmaf_key}"
+
+    def get_image(self, image):
+        values = self.store.get(self._image_key(image))
+        return None if values is None else {name: _decode(value) for name, value in values.items()}
+
+    def set_image(self, image, values):
+        self.store.set(self._image_key(image), {name: _encode(value) for name, value in values.items()})
+
+    def get_pair(self, pair):
+        values = self.store.get(self._pair_key(pair))
+        return None if values is None else {name: _decode(value) for name, value in values.items()}
+
+    def set_pair(self, pair, values):
+        self.store.set(self._pair_key(pair), {name: _encode(value) for name, value in values.items()})
+
+    def flush(self):
+        """Write queued access-time refreshes; called once per evaluated batch."""
+        self.store.flush()
+
+    def stats(self):
+        return self.store.stats()
+
+
+def open_feature_cache(path, max_size_bytes=512 * 1024 * 1024, vmaf_identity=None):
+    """Return the FeatureCache for `path` and VMAF engine, opening it once per process."""
+    if path is None:
+        return None
+    if (path, vmaf_identity) not in _open_caches:
+        _open_caches[path, vmaf_identity] = FeatureCache(path, max_size_bytes=max_size_bytes, vmaf_identity=vmaf_identity)
+    return _open_caches[path, vmaf_identity]
@@ -0,0 +1,231 @@
+import hashlib
+import io
+import math
+import os
+from functools import cached_property
+
+import numpy as np
+from PIL import Image
+
+from src.utils.instrumentation import stage
+
+# How mismatched base/improved resolutions are aligned before pair metrics: resize the improved
+# image to the base image's size, or both to the smaller or the larger of the two
+RESAMPLE_POLICIES = ('reference', 'smaller', 'larger')
+
+# Estimated peak working set of the pair metrics per pixel in memory-bounded mode, dominated by
+# the float32 SSIM/GSIM local moments and their temporaries
+PAIR_BYTES_PER_PIXEL = 96
+
+# Memoized full-size planes that `release` drops; the hash, histogram and feature vectors are small and kept
+_RELEASABLE_PLANES = ('data', 'image', 'array', 'gray', 'gray_float32', 'brisque_gray', 'edges', 'fft_magnitude', 'rfft_magnitude')
+
+
+class ImageContext:
+    """
+    A single image decoded once, with derived planes computed lazily and memoized.
+
+    Every `calculate_*` function accepts an ImageContext in place of a raw array, so
+    several metrics working on the same image share one decode and one grayscale,
+    histogram, edge or FFT computation instead of redoing it.
+
+    Args:
+        path (str, optional): Path of the image on disk. Decoded on first access.
+        image (PIL.Image.Image, optional): An already opened image, used instead of `path`.
+        memory_bounded (bool): Have metrics use float32 planes, half spectra and streaming
+            reductions instead of full float64 copies.
+    """
+
+    def __init__(self, path=None, image=None, memory_bounded=False):
+        if path is None and image is None:
+            raise ValueError("ImageContext needs either a path or an image.")
+        self.path = path
+        self.memory_bounded = memory_bounded
+        if image is not None:
+            self.__dict__['image'] = image
+
+    @cached_property
+    def data(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    @cached_property
+    def content_hash(self):
+        if self.path is None:
+            return hashlib.sha256(self.array.tobytes()).hexdigest()
+        return hashlib.sha256(self.data).hexdigest()
+
+    @cached_property
+    def image(self):
+        # Decode from the bytes already read for hashing, so the file is only read once
+        with stage("decode"):
+            image = Image.open(io.BytesIO(self.data))
+            image.load()
+        return image
+
+    @cached_property
+    def array(self):
+        # Full-channel array (RGB or RGBA), as used by colorfulness
+        return np.array(self.image)
+
+    @cached_property
+    def gray(self):
+        return np.array(self.image.convert("L"))
+
+    @cached_property
+    def gray_float32(self):
+        return self.gray.astype(np.float32)
+
+    @cached_property
+    def histogram(self):
+        import cv2
+        return cv2.calcHist([self.gray], [0], None, [256], [0, 256])
+
+    @cached_property
+    def edges(self):
+        import cv2
+        return cv2.Canny(self.gray, 100, 200)
+
+    @cached_property
+    def fft_magnitude(self):
+        return np.abs(np.fft.fftshift(np.fft.fft2(self.gray)))
+
+    @cached_property
+    def rfft_magnitude(self):
+        # Half spectrum of the real-input FFT in float32; the other half mirrors it
+        from scipy.fft import rfft2
+        return np.abs(rfft2(self.gray_float32))
+
+    @cached_property
+    def brisque_gray(self):
+        # BRISQUE has always scored `cv2.imread(path, IMREAD_GRAYSCALE)`, whose luma differs from
+        # PIL's "L" by one level on many pixels; decode the same bytes the same way so scores stay put
+        import cv2
+        gray = None
+        if self.path is not None:
+            gray = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            gray = cv2.cvtColor(np.array(self.image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+        return gray
+
+    @cached_property
+    def brisque_features(self):
+        from .brisque_native import brisque_features
+        return brisque_features(self.brisque_gray)
+
+    @cached_property
+    def perceptual_signature(self):
+        # pHash, dHash and thumbnail vector, for similarity and near-duplicate checks
+        from .perceptual_hash import image_signature
+        return image_signature(self)
+
+    @property
+    def name(self):
+        return os.path.basename(self.path) if self.path else "<in-memory image>"
+
+    def release(self):
+        """
+        Drop the file bytes, decoded image and full-size planes, keeping the content hash and small
+        memoized values (histogram, BRISQUE features, perceptual signature). Anything dropped is
+        recomputed from the file on next access; in-memory images keep their image.
+        """
+        for plane in _RELEASABLE_PLANES:
+            if plane != 'image' or self.path is not None:
+                self.__dict__.pop(plane, None)
+
+    def resized(self, size):
+        """A new context holding this image resampled to `size` (width, height)."""
+        return ImageContext(image=self.image.resize(size, Image.LANCZOS), memory_bounded=self.memory_bounded)
+
+
+class ImagePairContext:
+    """
+    A base/improved image pair sharing decoded images and derived planes across metrics.
+
+    Args:
+        image1_path (str): Path of the base (reference) image.
+        image2_path (str): Path of the improved (generated) image.
+        resample (str, optional): One of RESAMPLE_POLICIES, aligning pairs of different resolutions
+            for the pair metrics. None leaves them as they are, and metrics that need equal sizes fail.
+        memory_bounded (bool): Compute pair metrics with float32 planes and streaming reductions.
+        max_pair_bytes (int, optional): In memory-bounded mode, downscale both images for the pair
+            metrics until their estimated working set fits. Per-image metrics still see the originals.
+    """
+
+    def __init__(self, image1_path, image2_path, resample=None, memory_bounded=False, max_pair_bytes=None):
+        if resample is not None and resample not in RESAMPLE_POLICIES:
+            raise ValueError(f"Unknown resample policy '{resample}'. Available policies: {', '.join(RESAMPLE_POLICIES)}")
+        self.image1 = image1_path if isinstance(image1_path, ImageContext) else ImageContext(image1_path, memory_bounded=memory_bounded)
+        self.image2 = image2_path if isinstance(image2_path, ImageContext) else ImageContext(image2_path, memory_bounded=memory_bounded)
+        self.resample = resample
+        self.memory_bounded = memory_bounded
+        self.max_pair_bytes = max_pair_bytes if memory_bounded else None
+
+    @property
+    def image1_path(self):
+        return self.image1.path
+
+    @property
+    def image2_path(self):
+        return self.image2.path
+
+    @property
+    def variant(self):
+        """Settings that change pair metric values, for cache keys; empty with the defaults."""
+        parts = []
+        if self.memory_bounded:
+            parts.append(f"bounded{self.max_pair_bytes or ''}")
+        if self.resample:
+            parts.append(f"resample-{self.resample}")
+        return ",".join(parts)
+
+    def _target_size(self):
+        size1, size2 = self.image1.image.size, self.image2.image.size
+        target = size1
+        if size1 != size2 and self.resample == 'smaller':
+            target = min(size1, size2, key=lambda size: size[0] * size[1])
+        elif size1 != size2 and self.resample == 'larger':
+            target = max(size1, size2, key=lambda size: size[0] * size[1])
+        if self.max_pair_bytes and target[0] * target[1] * PAIR_BYTES_PER_PIXEL > self.max_pair_bytes:
+            scale = math.sqrt(self.max_pair_bytes / (target[0] * target[1] * PAIR_BYTES_PER_PIXEL))
+            target = (max(7, int(target[0] * scale)), max(7, int(target[1] * scale)))
+        return target
+
+    def release(self):
+        """Drop both images' full-size planes and any resampled copies, once the pair's metrics are done."""
+        self.image1.release()
+        self.image2.release()
+        self.__dict__.pop('aligned', None)
+
+    @cached_property
+    def aligned(self):
+        """
+        The two contexts the pair metrics read: the originals, or both resampled to one size under
+        the resample policy and the memory cap. Without a policy, mismatched sizes are left alone.
+        """
+        if self.resample is None and self.max_pair_bytes is None:
+            return self.image1, self.image2
+        target = self._target_size()
+        if self.resample is None and self.image1.image.size != self.image2.image.size:
+            return self.image1, self.image2
+        with stage("resample"):
+            return tuple(image if image.image.size == target else image.resized(target) for image in (self.image1, self.image2))
+
+
+def resolve_plane(image, plane="gray"):
+    """Return `plane` of an ImageContext, or the array itself when a raw array is given."""
+    if isinstance(image, ImageContext):
+        return getattr(image, plane)
+    return image
+
+
+def resolve_pair(image1, image2=None, plane="gray"):
+    """
+    Normalize the arguments of a two-image metric into a pair of arrays.
+
+    Accepts an ImagePairContext as the only argument, two ImageContexts, or two arrays.
+    """
+    if isinstance(image1, ImagePairContext):
+        aligned1, aligned2 = image1.aligned
+        return getattr(aligned1, plane), getattr(aligned2, plane)
+    return resolve_plane(image1, plane), resolve_plane(image2, plane)
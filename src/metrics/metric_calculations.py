@@ -1,99 +1,201 @@
-import torch
-import subprocess
 import math
-from brisque import BRISQUE
-import cv2
 import numpy as np
-from PIL import Image
-from skimage.metrics import structural_similarity as ssim
-from skimage.metrics import mean_squared_error as mse
-from scipy.stats import entropy
-from pytorch_msssim import ms_ssim
 import os
+from .image_context import ImageContext, ImagePairContext, resolve_plane, resolve_pair
+from .vmaf import VmafEngine
+from .registry import register_metric, resolve_metrics
+from .duplicates import duplicate_kind
+from src.utils.instrumentation import stage
 
-# Initialize BRISQUE
-brisq = BRISQUE()
+# torch, cv2, scikit-image, scipy and pytorch_msssim take seconds to import, so each is
+# imported inside the metric that needs it and only costs anything once that metric runs.
 
-def calculate_ms_ssim(image1_np, image2_np):
+# BRISQUE model, built on first use
+_brisque = None
+
+def get_brisque():
+    """Return this process's BRISQUE model (a NumPy BrisqueModel), loading it on first call."""
+    global _brisque
+    if _brisque is None:
+        from .brisque_native import BrisqueModel
+        _brisque = BrisqueModel()
+    return _brisque
+
+def calculate_ms_ssim(image1_np, image2_np=None):
+    import torch
+    from pytorch_msssim import ms_ssim
+    image1_np, image2_np = resolve_pair(image1_np, image2_np)
     # Convert the 2D NumPy arrays to 4D tensors
     image1_tensor = torch.tensor(image1_np).unsqueeze(0).unsqueeze(0).float()
     image2_tensor = torch.tensor(image2_np).unsqueeze(0).unsqueeze(0).float()
 
     return ms_ssim(image1_tensor, image2_tensor).item()
 
-def calculate_gsim(image1_np, image2_np):
+def calculate_gsim(image1_np, image2_np=None):
+    from skimage.metrics import structural_similarity as ssim
+    if _is_bounded(image1_np):
+        # float32 planes make scikit-image compute in float32 too
+        image1_np, image2_np = resolve_pair(image1_np, image2_np, plane="gray_float32")
+        _, gsim = ssim(image1_np, image2_np, gradient=True, data_range=255)
+        return gsim.mean(dtype=np.float64)
+    image1_np, image2_np = resolve_pair(image1_np, image2_np)
     _, gsim = ssim(image1_np, image2_np, gradient=True)
     return gsim.mean()
 
-def calculate_vmaf(reference_image, distorted_image):
-    # Path to thex  FFmpeg binary
-    ffmpeg_path = "/usr/local/bin/FFmpeg/ffmpeg"
-
-    # Construct the command
-    command = [
-        ffmpeg_path,
-        "-i", reference_image,
-        "-i", distorted_image,
-        "-filter_complex", "libvmaf",
-        "-an", "-f", "null", "-"
-    ]
-    print(command)
-
-    try:
-        # Run the command and capture the output
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        for line in result.stderr.split('\n'):
-            if "VMAF score" in line:
-                return float(line.split()[-1])
-    except subprocess.CalledProcessError as e:
-        print(f"Error calculating VMAF: {e}")
-        return 0
-    
+def calculate_vmaf(reference_image, distorted_image=None, engine=None):
+    # ffmpeg decodes from disk, so contexts are resolved back to their paths
+    if isinstance(reference_image, ImagePairContext):
+        reference_image, distorted_image = reference_image.image2_path, reference_image.image1_path
+    reference_image = reference_image.path if isinstance(reference_image, ImageContext) else reference_image
+    distorted_image = distorted_image.path if isinstance(distorted_image, ImageContext) else distorted_image
+
+    # The ffmpeg binary and VMAF model come from FFMPEG_PATH / VMAF_MODEL unless an engine is given.
+    # Prefer VmafEngine.score_pairs directly when scoring many pairs: it shares one ffmpeg run per batch.
+    engine = engine or VmafEngine()
+    return engine.score_pairs([(reference_image, distorted_image)])[0]
+
 # Calculation section
-def calculate_histogram_correlation(img1_np, img2_np):
-    hist1 = cv2.calcHist([img1_np], [0], None, [256], [0, 256])
-    hist2 = cv2.calcHist([img2_np], [0], None, [256], [0, 256])
+def _histogram(img):
+    if isinstance(img, ImageContext):
+        return img.histogram
+    import cv2
+    return cv2.calcHist([img], [0], None, [256], [0, 256])
+
+def calculate_histogram_correlation(img1_np, img2_np=None):
+    import cv2
+    if isinstance(img1_np, ImagePairContext):
+        img1_np, img2_np = img1_np.image1, img1_np.image2
+    hist1 = _histogram(img1_np)
+    hist2 = _histogram(img2_np)
     corr = cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
     return corr
 
 def calculate_entropy(img_np):
-    hist = cv2.calcHist([img_np], [0], None, [256], [0, 256])
+    from scipy.stats import entropy
+    # Copy so the memoized context histogram is not normalized in place
+    hist = _histogram(img_np).copy()
     hist /= hist.sum()
     return entropy(hist)
 
-def calculate_mse(image1_np, image2_np):
+def _is_bounded(image):
+    return isinstance(image, (ImageContext, ImagePairContext)) and image.memory_bounded
+
+def _streaming_mse(image1_np, image2_np, rows=256):
+    """Mean squared error summed over blocks of rows, instead of over full-size float64 copies of both images."""
+    if image1_np.shape != image2_np.shape:
+        raise ValueError('Input images must have the same dimensions.')
+    total = 0.0
+    for start in range(0, image1_np.shape[0], rows):
+        difference = image1_np[start:start + rows].astype(np.float32) - image2_np[start:start + rows]
+        total += float(np.square(difference).sum(dtype=np.float64))
+    return total / image1_np.size
+
+def _half_spectrum_mse(half1, half2, width):
+    """MSE of two full FFT magnitude spectra, from the half spectra of their real-input FFTs."""
+    if half1.shape != half2.shape:
+        raise ValueError('Input images must have the same dimensions.')
+    # Interior columns also stand for their mirror image in the full spectrum; the zero-frequency
+    # column, and the Nyquist column of an even width, appear once
+    weights = np.full(half1.shape[1], 2.0)
+    weights[0] = 1.0
+    if width % 2 == 0:
+        weights[-1] = 1.0
+    column_sums = np.zeros(half1.shape[1])
+    for start in range(0, half1.shape[0], 256):
+        column_sums += np.square(half1[start:start + 256] - half2[start:start + 256]).sum(axis=0, dtype=np.float64)
+    return float(column_sums @ weights) / (half1.shape[0] * width)
+
+def calculate_mse(image1_np, image2_np=None):
+    from skimage.metrics import mean_squared_error as mse
+    bounded = _is_bounded(image1_np)
+    image1_np, image2_np = resolve_pair(image1_np, image2_np)
+    if bounded:
+        return _streaming_mse(image1_np, image2_np)
     return mse(image1_np, image2_np)
 
-def calculate_edge_mse(img1_np, img2_np):
-    edges1 = cv2.Canny(img1_np, 100, 200)
-    edges2 = cv2.Canny(img2_np, 100, 200)
+def _edges(img_np):
+    if isinstance(img_np, ImageContext):
+        return img_np.edges
+    import cv2
+    return cv2.Canny(img_np, 100, 200)
+
+def calculate_edge_mse(img1_np, img2_np=None):
+    from skimage.metrics import mean_squared_error as mse
+    bounded = _is_bounded(img1_np)
+    if isinstance(img1_np, ImagePairContext):
+        img1_np, img2_np = img1_np.aligned
+    edges1 = _edges(img1_np)
+    edges2 = _edges(img2_np)
+    if bounded:
+        return _streaming_mse(edges1, edges2)
     return mse(edges1, edges2)
 
-def calculate_fft_mse(img1_np, img2_np):
-    f1 = np.fft.fft2(img1_np)
-    fshift1 = np.fft.fftshift(f1)
-    magnitude_spectrum1 = np.abs(fshift1)
-    
-    f2 = np.fft.fft2(img2_np)
-    fshift2 = np.fft.fftshift(f2)
-    magnitude_spectrum2 = np.abs(fshift2)
-    
+def _fft_magnitude(img_np):
+    if isinstance(img_np, ImageContext):
+        return img_np.fft_magnitude
+    f = np.fft.fft2(img_np)
+    fshift = np.fft.fftshift(f)
+    return np.abs(fshift)
+
+def calculate_fft_mse(img1_np, img2_np=None):
+    from skimage.metrics import mean_squared_error as mse
+    if isinstance(img1_np, ImagePairContext):
+        img1_np, img2_np = img1_np.aligned
+    if _is_bounded(img1_np) and _is_bounded(img2_np):
+        # float32 half spectra: a quarter of the memory of two complex128 full spectra, same value
+        return _half_spectrum_mse(img1_np.rfft_magnitude, img2_np.rfft_magnitude, img1_np.gray.shape[1])
+    magnitude_spectrum1 = _fft_magnitude(img1_np)
+    magnitude_spectrum2 = _fft_magnitude(img2_np)
     return mse(magnitude_spectrum1, magnitude_spectrum2)
 
-def calculate_ssim(image1_np, image2_np):
+def calculate_ssim(image1_np, image2_np=None):
+    from skimage.metrics import structural_similarity as ssim
+    if _is_bounded(image1_np):
+        image1_np, image2_np = resolve_pair(image1_np, image2_np, plane="gray_float32")
+        return ssim(image1_np, image2_np, data_range=255)
+    image1_np, image2_np = resolve_pair(image1_np, image2_np)
     return ssim(image1_np, image2_np)
 
 def calculate_brisque(image_path):
-    return brisq.get_score(image_path)
+    from .brisque_native import brisque_features
+    # A context reuses its decoded grayscale plane and memoized feature vector instead of re-reading the file
+    if isinstance(image_path, str):
+        image_path = ImageContext(image_path)
+    features = image_path.brisque_features if isinstance(image_path, ImageContext) else brisque_features(image_path)
+    return float(get_brisque().predict(features)[0])
 
-def calculate_psnr(image1_np, image2_np):
-    mse_value = mse(image1_np, image2_np)
+def calculate_psnr(image1_np, image2_np=None):
+    from skimage.metrics import mean_squared_error as mse
+    bounded = _is_bounded(image1_np)
+    image1_np, image2_np = resolve_pair(image1_np, image2_np)
+    mse_value = _streaming_mse(image1_np, image2_np) if bounded else mse(image1_np, image2_np)
     if mse_value == 0:
         return float('inf')
     max_pixel_value = 255.0
     return 20 * math.log10(max_pixel_value / math.sqrt(mse_value))
 
+def _streaming_colorfulness(img_np, rows=256):
+    """Colorfulness from running float64 sums over float32 blocks of rows, rather than float64 copies of every channel."""
+    count = 0
+    sums = np.zeros(4)  # rg, rg^2, yb, yb^2
+    for start in range(0, img_np.shape[0], rows):
+        block = img_np[start:start + rows, :, :3].astype(np.float32)
+        # Channels in the same order cv2.split gives calculate_colorfulness
+        B, G, R = block[:, :, 0], block[:, :, 1], block[:, :, 2]
+        rg = R - G
+        yb = 0.5 * (R + G) - B
+        sums += [rg.sum(dtype=np.float64), np.square(rg).sum(dtype=np.float64), yb.sum(dtype=np.float64), np.square(yb).sum(dtype=np.float64)]
+        count += rg.size
+    mean_rg, mean_yb = sums[0] / count, sums[2] / count
+    variance_rg = max(sums[1] / count - mean_rg ** 2, 0.0)
+    variance_yb = max(sums[3] / count - mean_yb ** 2, 0.0)
+    return math.sqrt(variance_rg + variance_yb) + 0.3 * (mean_rg + mean_yb)
+
 def calculate_colorfulness(img_np):
+    import cv2
+    if _is_bounded(img_np):
+        return _streaming_colorfulness(img_np.array)
+    img_np = resolve_plane(img_np, "array")
     if img_np.shape[2] > 3:  # Check if image has more than 3 channels
         img_np = img_np[:, :, :3]  # Keep only the first three channels
     (B, G, R) = cv2.split(img_np.astype("float"))
@@ -107,43 +209,129 @@ def calculate_colorfulness(img_np):
     return colorfulness
 # End metric calculation section
 
+# Metric registry: every metric compare_images can report, with the planes it reads and,
+# for pair metrics, the value two identical images get without computing anything
+register_metric('mse', requires=('gray',), identical=0.0)(calculate_mse)
+register_metric('ssim', requires=('gray',), identical=1.0)(calculate_ssim)
+register_metric('psnr', requires=('gray',), identical=float('inf'))(calculate_psnr)
+register_metric('hist_corr', requires=('histogram',), identical=1.0)(calculate_histogram_correlation)
+register_metric('edge_mse', requires=('edges',), identical=0.0)(calculate_edge_mse)
+register_metric('fft_mse', requires=('fft_magnitude',), identical=0.0)(calculate_fft_mse)
+register_metric('ms_ssim', requires=('gray',), identical=1.0)(calculate_ms_ssim)
+register_metric('gsim', requires=('gray',), identical=0.0)(calculate_gsim)
+# VMAF has no closed form for identical frames, so identical pairs leave it None rather than skew its mean
+register_metric('vmaf', requires=('path',), skip_identical=True)(calculate_vmaf)
+register_metric('brisque', requires=('brisque_features',), scope='image')(calculate_brisque)
+register_metric('colorfulness', requires=('array',), scope='image')(calculate_colorfulness)
+
+@register_metric('entropy', requires=('histogram',), scope='image')
+def _entropy_value(image):
+    # scipy returns a 1-element array or a scalar depending on its version; report a plain float
+    return float(np.ravel(calculate_entropy(image))[0])
+
+@register_metric('brisque_diff', depends_on=('brisque',), scope='derived')
+def _brisque_diff(results):
+    return results['brisque_image2'] - results['brisque_image1']
+
+@register_metric('entropy_diff', depends_on=('entropy',), scope='derived')
+def _entropy_diff(results):
+    return results['entropy_image2'] - results['entropy_image1']
+
+def _timed(metric, target):
+    with stage(f"metric.{metric.name}"):
+        return metric.compute(target)
+
+def _cached_values(cache, scope, target, metrics, compute):
+    """Look up `metrics` for one image or pair in the cache and compute whatever is missing."""
+    values = None
+    if cache:
+        values = cache.get_image(target) if scope == 'image' else cache.get_pair(target)
+    values = values or {}
+    missing = [metric for metric in metrics if metric.name not in values]
+    for metric in missing:
+        values[metric.name] = compute(metric)
+    if cache and missing:
+        # Values that could not be computed this time (e.g. VMAF of mismatched sizes) are not cached
+        stored = {name: value for name, value in values.items() if value is not None}
+        if scope == 'image':
+            cache.set_image(target, stored)
+        else:
+            cache.set_pair(target, stored)
+    return values
+
 # Direct comparison between two images
-def compare_images(image1_path, image2_path):
-    # Check if files exist
-    if not os.path.exists(image1_path) or not os.path.exists(image2_path):
-        print(f"Error: One or both of the images {image1_path} and {image2_path} do not exist.")
+def compare_images(image1_path, image2_path, metrics=None, cache=None, precomputed=None, near_duplicate_threshold=None,
+                   resample=None, memory_bounded=False, max_pair_bytes=None):
+    """
+    Compare a base image against its improved version.
+
+    Args:
+        image1_path (str): Path of the base image.
+        image2_path (str): Path of the improved image.
+        metrics (list, optional): Registry names of the metrics to compute, e.g. `['mse', 'ssim']`.
+            Dependencies are added automatically. None computes every registered metric.
+        cache (FeatureCache, optional): Reuse per-image and per-pair values computed on earlier runs
+            for images with the same content.
+        precomputed (dict, optional): Values already computed elsewhere, such as VMAF scores from a batched
+            `VmafEngine` run, keyed by metric name, or by output name (`brisque_image1`) for per-image
+            metrics. These are used as-is instead of being recomputed.
+        near_duplicate_threshold (float, optional): Thumbnail distance below which a pair is flagged as a
+            near duplicate. Defaults to `$NEAR_DUPLICATE_THRESHOLD`; 0 only detects identical files.
+        resample (str, optional): How pair metrics align images of different resolutions: `reference`,
+            `smaller` or `larger`. None keeps the sizes, so metrics needing equal sizes fail on such pairs.
+        memory_bounded (bool): Use float32 planes, half spectra and streaming reductions. Values match
+            the default mode to float32 rounding.
+        max_pair_bytes (int, optional): In memory-bounded mode, downscale the pair for the pair metrics
+            until their estimated working set fits in this many bytes.
+
+    Byte-identical pairs skip the pair metrics: they get each metric's closed-form value for
+    identical images (MSE 0, SSIM 1, PSNR inf, ...), or None for metrics without one (VMAF).
+    Per-image metrics are still computed, once for both images. Near duplicates, when a threshold
+    is set, are only flagged: those values would be wrong for images that differ at all, so their
+    metrics are computed as usual. The `duplicate` field of the results says which case applied.
+
+    Either path may also be an ImageContext that has already been hashed or decoded.
+
+    Returns:
+        dict: Result values keyed by output name (`mse`, `brisque_image1`, `brisque_diff`, ...),
+        plus `duplicate` (`distinct`, `identical` or `near`), or None if either image does not exist.
+    """
+    # Decode each image once; grayscale, histograms, edges and spectra are shared across metrics.
+    # Decoding is lazy, so fully cached pairs are only hashed, never decoded.
+    pair = ImagePairContext(image1_path, image2_path, resample=resample, memory_bounded=memory_bounded, max_pair_bytes=max_pair_bytes)
+
+    # Check if files exist; in-memory images have no file to check
+    if any(path is not None and not os.path.exists(path) for path in (pair.image1_path, pair.image2_path)):
+        print(f"Error: One or both of the images {pair.image1_path} and {pair.image2_path} do not exist.")
         return None
 
-    # Load images without converting to grayscale
-    image1 = Image.open(image1_path)
-    image2 = Image.open(image2_path)
-
-    # Convert to grayscale for metrics that require grayscale
-    image1_gray = image1.convert("L")
-    image2_gray = image2.convert("L")
-
-    image1_np_gray = np.array(image1_gray)
-    image2_np_gray = np.array(image2_gray)
-    
-    # Calculate metrics
-    mse_value = calculate_mse(image1_np_gray, image2_np_gray)
-    ssim_value = calculate_ssim(image1_np_gray, image2_np_gray)
-    psnr_value = calculate_psnr(image1_np_gray, image2_np_gray)
-    brisque_value_image1 = calculate_brisque(image1_path)
-    brisque_value_image2 = calculate_brisque(image2_path)
-    brisque_diff = brisque_value_image2 - brisque_value_image1
-
-    # Calculate new metrics
-    hist_corr_value = calculate_histogram_correlation(image1_np_gray, image2_np_gray)
-    colorfulness_image1 = calculate_colorfulness(np.array(image1))
-    colorfulness_image2 = calculate_colorfulness(np.array(image2))
-    edge_mse_value = calculate_edge_mse(image1_np_gray, image2_np_gray)
-    entropy_image1 = calculate_entropy(image1_np_gray)
-    entropy_image2 = calculate_entropy(image2_np_gray)
-    fft_mse_value = calculate_fft_mse(image1_np_gray, image2_np_gray)
-
-    ms_ssim_value = calculate_ms_ssim(image1_np_gray, image2_np_gray)
-    gsim_value = calculate_gsim(image1_np_gray, image2_np_gray)
-    vmaf_value = calculate_vmaf(image2_path, image1_path)
-
-    return mse_value, ssim_value, psnr_value, brisque_value_image1, brisque_value_image2, hist_corr_value, colorfulness_image1, colorfulness_image2, edge_mse_value, entropy_image1, entropy_image2, fft_mse_value, brisque_diff, ms_ssim_value, gsim_value, vmaf_value
\ No newline at end of file
+    selected = resolve_metrics(metrics)
+    precomputed = precomputed or {}
+    image_metrics = [metric for metric in selected if metric.scope == 'image']
+    pair_metrics = [metric for metric in selected if metric.scope == 'pair']
+
+    duplicate = duplicate_kind(pair, near_duplicate_threshold)
+
+    results = {}
+    if image_metrics:
+        for image, suffix in ((pair.image1, '_image1'), (pair.image2, '_image2')):
+            if duplicate == 'identical' and suffix == '_image2':
+                # Same bytes, same values
+                values = {metric.name: results[metric.name + '_image1'] for metric in image_metrics}
+            else:
+                values = _cached_values(cache, 'image', image, image_metrics,
+                                        lambda metric: precomputed[metric.name + suffix] if metric.name + suffix in precomputed else _timed(metric, image))
+            results.update({metric.name + suffix: values[metric.name] for metric in image_metrics})
+    if duplicate == 'identical':
+        results.update({metric.name: None if metric.skip_identical else metric.identical
+                        for metric in pair_metrics if metric.skip_identical or metric.identical is not None})
+        pair_metrics = [metric for metric in pair_metrics if metric.identical is None and not metric.skip_identical]
+    if pair_metrics:
+        values = _cached_values(cache, 'pair', pair, pair_metrics,
+                                lambda metric: precomputed[metric.name] if metric.name in precomputed else _timed(metric, pair))
+        results.update({metric.name: values[metric.name] for metric in pair_metrics})
+    for metric in selected:
+        if metric.scope == 'derived':
+            results[metric.name] = _timed(metric, results)
+    results['duplicate'] = duplicate
+    return results
@@ -0,0 +1,76 @@
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from .image_context import ImageContext
+
+# Popcount of every byte value, for Hamming distances over packed hash bits
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def _gray_image(image) -> Image.Image:
+    """A grayscale PIL image from an ImageContext, a PIL image, a path or a 2D array."""
+    if isinstance(image, ImageContext):
+        return Image.fromarray(image.gray)
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image).convert("L")
+    if isinstance(image, str):
+        image = Image.open(image)
+        # JPEG can decode straight at a reduced scale, far cheaper than a full decode for a thumbnail
+        image.draft("L", (64, 64))
+    return image.convert("L")
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(size: int) -> np.ndarray:
+    # Orthonormal DCT-II basis; a 2D DCT is then two small matrix products
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def phash(image, hash_size: int = 8, highfreq_factor: int = 4) -> np.ndarray:
+    """
+    Perceptual hash: the signs of the low-frequency DCT coefficients of a downscaled image
+    relative to their median. Returns `hash_size**2` bits packed into a uint8 array.
+    """
+    size = hash_size * highfreq_factor
+    pixels = np.asarray(_gray_image(image).resize((size, size), Image.LANCZOS), dtype=np.float64)
+    dct = _dct_matrix(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return np.packbits(low > np.median(low))
+
+
+def dhash(image, hash_size: int = 8) -> np.ndarray:
+    """Difference hash: whether each pixel of a downscaled image is brighter than its right neighbour."""
+    pixels = np.asarray(_gray_image(image).resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1])
+
+
+def thumbnail_vector(image, size: int = 16) -> np.ndarray:
+    """
+    A `size x size` grayscale thumbnail as a zero-mean, unit-norm float32 vector, so L2 distances
+    between vectors compare structure independently of overall brightness and contrast.
+    """
+    pixels = np.asarray(_gray_image(image).resize((size, size), Image.BOX), dtype=np.float32).ravel()
+    pixels -= pixels.mean()
+    norm = np.linalg.norm(pixels)
+    return pixels / norm if norm > 0 else pixels
+
+
+def image_signature(image, hash_size: int = 8, vector_size: int = 16) -> dict:
+    """pHash, dHash and thumbnail vector of one image, decoding it only once."""
+    gray = _gray_image(image)
+    return {'phash': phash(gray, hash_size), 'dhash': dhash(gray, hash_size), 'vector': thumbnail_vector(gray, vector_size)}
+
+
+def hamming_distances(query: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    """Hamming distance between one packed hash and each row of an `(N, bytes)` array of packed hashes."""
+    return POPCOUNT[np.bitwise_xor(hashes, query)].sum(axis=-1, dtype=np.int64)
+
+
+def l2_distances(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Euclidean distance between one vector and each row of an `(N, D)` array."""
+    return np.sqrt(np.maximum(((vectors - query) ** 2).sum(axis=-1), 0))
@@ -0,0 +1,100 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+IMAGE_SUFFIXES = ('_image1', '_image2')
+
+
+class Metric:
+    """
+    A named metric and what it needs.
+
+    Args:
+        name (str): Registry name, used on the command line and as the result key.
+        compute (callable): Takes an ImagePairContext (pair metrics), an ImageContext
+            (per-image metrics), or the results computed so far (derived metrics).
+        requires (tuple): Context planes the metric reads, e.g. `gray`, `edges`, `fft_magnitude`.
+            Planes are memoized on the context, so metrics sharing a plane compute it once.
+        depends_on (tuple): Other metrics whose results a derived metric combines.
+        scope (str): `pair`, `image` (computed once per image, reported as `<name>_image1`
+            and `<name>_image2`) or `derived`.
+        identical (float, optional): Closed-form value of a pair metric for two identical images,
+            used instead of computing it for duplicate pairs. None means it is always computed.
+        skip_identical (bool): For a pair metric without a closed form, leave it None for identical
+            pairs instead of computing it or making up a value.
+    """
+
+    def __init__(self, name: str, compute: Callable, requires: Tuple[str, ...] = (), depends_on: Tuple[str, ...] = (), scope: str = 'pair',
+                 identical: Optional[float] = None, skip_identical: bool = False):
+        self.name = name
+        self.compute = compute
+        self.requires = tuple(requires)
+        self.depends_on = tuple(depends_on)
+        self.scope = scope
+        self.identical = identical
+        self.skip_identical = skip_identical
+
+    @property
+    def outputs(self) -> Tuple[str, ...]:
+        if self.scope == 'image':
+            return tuple(self.name + suffix for suffix in IMAGE_SUFFIXES)
+        return (self.name,)
+
+    def __repr__(self):
+        return f"Metric({self.name!r}, scope={self.scope!r}, requires={self.requires}, depends_on={self.depends_on})"
+
+
+METRICS: Dict[str, Metric] = {}
+
+
+def register_metric(name: str, requires=(), depends_on=(), scope: str = 'pair', identical: Optional[float] = None, skip_identical: bool = False):
+    """Decorator adding a compute function to the metric registry under `name`."""
+    def decorator(compute):
+        METRICS[name] = Metric(name, compute, requires=requires, depends_on=depends_on, scope=scope, identical=identical,
+                               skip_identical=skip_identical)
+        return compute
+    return decorator
+
+
+def resolve_metrics(names: Optional[Iterable[str]] = None) -> List[Metric]:
+    """
+    Expand requested metric names with their dependencies, in an order where every metric
+    comes after the metrics it depends on. None selects every registered metric.
+    """
+    if names is None:
+        names = list(METRICS)
+    ordered = []
+    visiting = set()
+
+    def visit(name):
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric '{name}'. Available metrics: {', '.join(METRICS)}")
+        metric = METRICS[name]
+        if metric in ordered:
+            return
+        if name in visiting:
+            raise ValueError(f"Metric '{name}' has a circular dependency.")
+        visiting.add(name)
+        for dependency in metric.depends_on:
+            visit(dependency)
+        visiting.discard(name)
+        ordered.append(metric)
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+def required_planes(names: Optional[Iterable[str]] = None) -> List[str]:
+    """Context planes that computing `names` will touch."""
+    planes = []
+    for metric in resolve_metrics(names):
+        planes.extend(plane for plane in metric.requires if plane not in planes)
+    return planes
+
+
+def parse_metric_list(value: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated `--metrics` value. Empty or `all` selects every metric."""
+    if not value or value.strip().lower() == 'all':
+        return None
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    resolve_metrics(names)
+    return names
@@ -0,0 +1,160 @@
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from termcolor import colored
+
+from .perceptual_hash import hamming_distances, image_signature, l2_distances
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+# Bump when signatures are computed differently so stale indexes are rebuilt
+INDEX_VERSION = 1
+
+# Distances the index can rank by
+DISTANCES = ('combined', 'phash', 'dhash', 'vector')
+
+
+class SimilarityIndex:
+    """
+    On-disk index of compact per-image signatures for fast similarity ranking.
+
+    Every image gets a 64-bit pHash, a 64-bit dHash and a small thumbnail vector. Queries
+    compare one signature against all rows at once with vectorized Hamming and L2 distances,
+    which is far cheaper than running the full metric suite on every pair.
+
+    The index is an `.npz` file. `update` only decodes files that are new or whose size
+    or modification time changed since they were indexed, and drops files that are gone.
+
+    Args:
+        path (str): Location of the index file.
+        hash_size (int): Side of the hash grid; hashes have `hash_size**2` bits.
+        vector_size (int): Side of the thumbnail behind each vector.
+    """
+
+    def __init__(self, path: str, hash_size: int = 8, vector_size: int = 16):
+        self.path = path
+        self.hash_size = hash_size
+        self.vector_size = vector_size
+        hash_bytes = hash_size * hash_size // 8
+        self.paths = np.array([], dtype=str)
+        self.stamps = np.empty((0, 2), dtype=np.int64)
+        self.phashes = np.empty((0, hash_bytes), dtype=np.uint8)
+        self.dhashes = np.empty((0, hash_bytes), dtype=np.uint8)
+        self.vectors = np.empty((0, vector_size * vector_size), dtype=np.float32)
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with np.load(self.path) as data:
+            parameters = (int(data['version']), int(data['hash_size']), int(data['vector_size']))
+            if parameters != (INDEX_VERSION, self.hash_size, self.vector_size):
+                print(colored(f"Similarity index {self.path} was built with other settings; rebuilding it.", 'yellow'))
+                return
+            self.paths = data['paths']
+            self.stamps = data['stamps']
+            self.phashes = data['phashes']
+            self.dhashes = data['dhashes']
+            self.vectors = data['vectors']
+
+    def save(self):
+        """Write the index atomically, so an interrupted save leaves the previous index intact."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary_path = self.path + ".tmp"
+        # Passing a file object keeps numpy from appending `.npz` to the temporary name
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, version=INDEX_VERSION, hash_size=self.hash_size, vector_size=self.vector_size, paths=self.paths,
+                     stamps=self.stamps, phashes=self.phashes, dhashes=self.dhashes, vectors=self.vectors)
+        os.replace(temporary_path, self.path)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def signature(self, image) -> dict:
+        return image_signature(image, hash_size=self.hash_size, vector_size=self.vector_size)
+
+    def update(self, directory: str) -> Tuple[int, int]:
+        """
+        Bring the index in line with the images under `directory`.
+
+        Returns:
+            tuple: `(added_or_changed, removed)` file counts.
+        """
+        current = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.abspath(os.path.join(root, name))
+                    stat = os.stat(path)
+                    current[path] = (stat.st_size, stat.st_mtime_ns)
+
+        indexed = {path: tuple(stamp) for path, stamp in zip(self.paths.tolist(), self.stamps.tolist())}
+        in_directory = [path for path in indexed if path.startswith(os.path.abspath(directory) + os.sep)]
+        removed = {path for path in in_directory if path not in current}
+        changed = [path for path, stamp in current.items() if indexed.get(path) != stamp]
+        keep = np.array([path not in removed and path not in changed for path in self.paths.tolist()], dtype=bool)
+
+        signatures = []
+        for path in changed:
+            try:
+                signatures.append((path, current[path], self.signature(path)))
+            except OSError as e:
+                print(colored(f"Skipping unreadable image {path}: {e}", 'yellow'))
+
+        self.paths = np.concatenate([self.paths[keep], np.array([path for path, _, _ in signatures], dtype=str)])
+        self.stamps = np.concatenate([self.stamps[keep], np.array([stamp for _, stamp, _ in signatures], dtype=np.int64).reshape(-1, 2)])
+        for field, attribute in (('phash', 'phashes'), ('dhash', 'dhashes'), ('vector', 'vectors')):
+            existing = getattr(self, attribute)
+            added = np.array([signature[field] for _, _, signature in signatures], dtype=existing.dtype).reshape(-1, existing.shape[1])
+            setattr(self, attribute, np.concatenate([existing[keep], added]))
+        return len(signatures), len(removed)
+
+    def distances(self, signature: dict, by: str = 'combined', subset: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Distance from `signature` to every indexed image, or to the rows selected by `subset`.
+
+        `phash` and `dhash` are Hamming distances in bits and `vector` is the L2 distance
+        between thumbnail vectors (0 to 2). `combined` averages the pHash distance as a fraction
+        of its bits with half the vector distance, so both count on a 0-1 scale.
+        """
+        rows = slice(None) if subset is None else subset
+        if by == 'phash':
+            return hamming_distances(signature['phash'], self.phashes[rows]).astype(np.float64)
+        if by == 'dhash':
+            return hamming_distances(signature['dhash'], self.dhashes[rows]).astype(np.float64)
+        if by == 'vector':
+            return l2_distances(signature['vector'], self.vectors[rows]).astype(np.float64)
+        if by == 'combined':
+            bits = self.hash_size * self.hash_size
+            return (hamming_distances(signature['phash'], self.phashes[rows]) / bits
+                    + l2_distances(signature['vector'], self.vectors[rows]) / 2) / 2
+        raise ValueError(f"Unknown distance {by!r}; choose one of {', '.join(DISTANCES)}")
+
+    def _within(self, directory: Optional[str]) -> Optional[np.ndarray]:
+        if directory is None:
+            return None
+        prefix = os.path.abspath(directory) + os.sep
+        return np.flatnonzero(np.char.startswith(self.paths.astype(str), prefix))
+
+    def nearest(self, signature: dict, k: int = 10, by: str = 'combined', directory: Optional[str] = None) -> List[Tuple[str, float]]:
+        """The `k` indexed images closest to `signature`, nearest first, optionally only those under `directory`."""
+        rows = self._within(directory)
+        distances = self.distances(signature, by, rows)
+        paths = self.paths if rows is None else self.paths[rows]
+        k = min(k, len(distances))
+        if k == 0:
+            return []
+        # Partial selection of the k-th smallest distance, then a sort of just the images up to it. Every
+        # image tied with the k-th is kept for the sort, so ties are broken by path as in `sorted_by_distance`
+        kth = distances[np.argpartition(distances, k - 1)[k - 1]]
+        candidates = np.flatnonzero(distances <= kth)
+        candidates = candidates[np.lexsort((paths[candidates], distances[candidates]))][:k]
+        return [(str(paths[i]), float(distances[i])) for i in candidates]
+
+    def sorted_by_distance(self, signature: dict, by: str = 'combined', directory: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Every indexed image ordered from most to least similar to `signature`; ties are broken by path."""
+        rows = self._within(directory)
+        distances = self.distances(signature, by, rows)
+        paths = self.paths if rows is None else self.paths[rows]
+        order = np.lexsort((paths, distances))
+        return [(str(paths[i]), float(distances[i])) for i in order]
@@ -0,0 +1,123 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from termcolor import colored
+
+from src.utils.instrumentation import stage
+
+# Pair metrics the batched engine computes, with the same values as their calculate_* functions
+STRUCTURAL_METRICS = ('ssim', 'ms_ssim', 'gsim')
+
+# scikit-image's structural_similarity defaults for 8-bit grayscale: 7x7 uniform window,
+# sample covariance, data range 255
+_WIN_SIZE = 7
+_DATA_RANGE = 255.0
+_C1 = (0.01 * _DATA_RANGE) ** 2
+_C2 = (0.03 * _DATA_RANGE) ** 2
+
+
+def _uniform_filter(images: np.ndarray) -> np.ndarray:
+    """`scipy.ndimage.uniform_filter(size=7)` applied to each plane of an NxHxW stack."""
+    from scipy.ndimage import uniform_filter1d
+    return uniform_filter1d(uniform_filter1d(images, _WIN_SIZE, axis=-1), _WIN_SIZE, axis=-2)
+
+
+def _ssim_and_gsim(x: np.ndarray, y: np.ndarray, with_gradient: bool):
+    """
+    Mean SSIM and mean SSIM gradient (GSIM) of every pair in the NxHxW float64 stacks `x` and `y`,
+    following scikit-image's `structural_similarity`. The local moments are computed once and
+    shared by both values, where calculate_ssim and calculate_gsim each compute them again.
+    """
+    height, width = x.shape[1:]
+    pad = (_WIN_SIZE - 1) // 2
+    cov_norm = _WIN_SIZE ** 2 / (_WIN_SIZE ** 2 - 1)
+    ux, uy = _uniform_filter(x), _uniform_filter(y)
+    vx = cov_norm * (_uniform_filter(x * x) - ux * ux)
+    vy = cov_norm * (_uniform_filter(y * y) - uy * uy)
+    vxy = cov_norm * (_uniform_filter(x * y) - ux * uy)
+
+    a1, a2 = 2 * ux * uy + _C1, 2 * vxy + _C2
+    b1, b2 = ux ** 2 + uy ** 2 + _C1, vx + vy + _C2
+    d = b1 * b2
+    s = a1 * a2 / d
+    ssim = s[:, pad:height - pad, pad:width - pad].mean(axis=(1, 2))
+    if not with_gradient:
+        return ssim, None
+
+    # Eqs. 7-8 of Avanaki 2009, as in scikit-image
+    gradient = _uniform_filter(a1 / d) * x
+    gradient += _uniform_filter(-s / b2) * y
+    gradient += _uniform_filter((ux * (a2 - a1) - uy * (b2 - b1) * s) / d)
+    gradient *= 2 / (height * width)
+    return ssim, gradient.mean(axis=(1, 2))
+
+
+def _score_group(images1: np.ndarray, images2: np.ndarray, metrics: Sequence[str], dtype) -> Dict[str, np.ndarray]:
+    values = {}
+    if 'ssim' in metrics or 'gsim' in metrics:
+        # float64 like scikit-image by default, so the values match calculate_ssim and calculate_gsim
+        ssim, gsim = _ssim_and_gsim(images1.astype(dtype), images2.astype(dtype), with_gradient='gsim' in metrics)
+        if 'ssim' in metrics:
+            values['ssim'] = ssim
+        if 'gsim' in metrics:
+            values['gsim'] = gsim
+    if 'ms_ssim' in metrics:
+        import torch
+        from pytorch_msssim import ms_ssim
+        # One Nx1xHxW float32 tensor, where calculate_ms_ssim builds a 1x1xHxW tensor per pair
+        x = torch.from_numpy(images1).float().unsqueeze(1)
+        y = torch.from_numpy(images2).float().unsqueeze(1)
+        values['ms_ssim'] = ms_ssim(x, y, size_average=False).numpy()
+    return values
+
+
+def structural_similarity_batch(pairs: Sequence[Tuple[np.ndarray, np.ndarray]], metrics: Sequence[str] = STRUCTURAL_METRICS,
+                                chunk_size: int = 4, dtype=np.float64) -> List[Optional[Dict[str, float]]]:
+    """
+    SSIM, MS-SSIM and GSIM for many grayscale pairs in vectorized passes.
+
+    Pairs of the same size are stacked, `chunk_size` pairs at a time to bound memory. MS-SSIM
+    runs as one NxCxHxW torch tensor on torch's intra-op CPU threads (one per pool worker, see
+    `init_worker`). SSIM and GSIM share one set of local means and variances instead of running
+    scikit-image twice per pair; they use scipy's separable running-sum filter over the whole
+    stack, which is faster on CPU than torch's pooling or convolution for a 7x7 box window.
+    Values match `calculate_ssim`, `calculate_ms_ssim` and `calculate_gsim` to floating-point
+    rounding.
+
+    Args:
+        pairs (list): `(base, improved)` 2D uint8 arrays, or ImagePairContexts.
+        metrics (list): Which of `ssim`, `ms_ssim` and `gsim` to compute.
+        chunk_size (int): Maximum number of pairs per tensor.
+        dtype: Float type of the SSIM and GSIM planes; float32 halves their memory, as in memory-bounded mode.
+
+    Returns:
+        list: Per pair, a dict of the requested values, or None where the pair could not be
+        batched (mismatched sizes, or too small for MS-SSIM) and must be computed pair by pair.
+    """
+    from .image_context import resolve_pair
+    metrics = [name for name in STRUCTURAL_METRICS if name in metrics]
+    arrays = [resolve_pair(*pair) if isinstance(pair, tuple) else resolve_pair(pair) for pair in pairs]
+    results: List[Optional[Dict[str, float]]] = [None] * len(arrays)
+    if not metrics:
+        return results
+
+    groups = {}
+    for index, (image1, image2) in enumerate(arrays):
+        if image1.shape == image2.shape and image1.ndim == 2:
+            groups.setdefault(image1.shape, []).append(index)
+
+    for shape, indices in groups.items():
+        # pytorch_msssim downsamples four times and needs the smaller side above 160 pixels
+        if 'ms_ssim' in metrics and min(shape) <= (11 - 1) * 2 ** 4:
+            continue
+        for start in range(0, len(indices), max(1, chunk_size)):
+            chunk = indices[start:start + max(1, chunk_size)]
+            try:
+                with stage("metric.structural_batch"):
+                    values = _score_group(np.stack([arrays[i][0] for i in chunk]), np.stack([arrays[i][1] for i in chunk]), metrics, dtype)
+            except (RuntimeError, ValueError, AssertionError) as e:
+                print(colored(f"Batched SSIM failed for {len(chunk)} pairs of size {shape}, computing them pair by pair: {e}", 'yellow'))
+                continue
+            for position, index in enumerate(chunk):
+                results[index] = {name: float(values[name][position]) for name in metrics}
+    return results
@@ -0,0 +1,142 @@
+import json
+import os
+import subprocess
+import tempfile
+from typing import List, Optional, Sequence, Tuple
+
+from PIL import Image
+from termcolor import colored
+
+from src.utils.instrumentation import stage
+
+DEFAULT_FFMPEG_PATH = "/usr/local/bin/FFmpeg/ffmpeg"
+
+
+def _concat_list(paths):
+    # Every image becomes one frame of a 1 fps stream, so frame N of both lists is pair N
+    lines = ["ffconcat version 1.0"]
+    for path in paths:
+        escaped = os.path.abspath(path).replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+        lines.append("duration 1")
+    return "\n".join(lines) + "\n"
+
+
+def _frame_scores(log):
+    scores = {}
+    for position, frame in enumerate(log.get('frames', [])):
+        index = frame.get('frameNum', position)
+        metrics = frame.get('metrics', {})
+        # libvmaf 2.x logs `metrics.vmaf`, the 1.x log format used `VMAF_score`
+        score = metrics.get('vmaf', frame.get('VMAF_score'))
+        if score is not None:
+            scores[index] = float(score)
+    return scores
+
+
+class VmafEngine:
+    """
+    Scores many image pairs per ffmpeg invocation.
+
+    Pairs are packed as consecutive frames of two concat streams and libvmaf writes one
+    score per frame to a JSON log, so process startup and model loading are paid once per
+    batch instead of once per pair. libvmaf needs every frame of both streams at a single
+    resolution, so pairs are grouped by size before batching, and pairs whose two images differ
+    in size are not scored.
+
+    Args:
+        ffmpeg_path (str, optional): ffmpeg binary built with `--enable-libvmaf`. Defaults to
+            `$FFMPEG_PATH`, then the historical `/usr/local/bin/FFmpeg/ffmpeg`.
+        model (str, optional): libvmaf model option, e.g. `version=vmaf_v0.6.1` or
+            `path=/models/vmaf_v0.6.1.json`. Defaults to `$VMAF_MODEL`, then libvmaf's default.
+        batch_size (int): Maximum number of pairs scored by one ffmpeg process.
+        threads (int, optional): libvmaf worker threads per invocation.
+    """
+
+    def __init__(self, ffmpeg_path: Optional[str] = None, model: Optional[str] = None, batch_size: int = 64, threads: Optional[int] = None):
+        self.ffmpeg_path = ffmpeg_path or os.getenv('FFMPEG_PATH', DEFAULT_FFMPEG_PATH)
+        self.model = model or os.getenv('VMAF_MODEL') or None
+        self.batch_size = max(1, batch_size)
+        self.threads = threads
+
+    @property
+    def identity(self) -> str:
+        """The ffmpeg binary and libvmaf model scoring with this engine, so cached VMAF values are tied to both."""
+        return f"{os.path.realpath(self.ffmpeg_path)}|{self.model or 'default'}"
+
+    def _filter(self, log_path):
+        options = ["log_fmt=json", f"log_path='{log_path}'"]
+        if self.model:
+            options.append(f"model='{self.model}'")
+        if self.threads:
+            options.append(f"n_threads={self.threads}")
+        return "libvmaf=" + ":".join(options)
+
+    def _score_batch(self, pairs: Sequence[Tuple[str, str]]) -> List[Optional[float]]:
+        with tempfile.TemporaryDirectory(prefix="vmaf_") as workdir:
+            reference_list = os.path.join(workdir, "reference.ffconcat")
+            distorted_list = os.path.join(workdir, "distorted.ffconcat")
+            log_path = os.path.join(workdir, "vmaf.json")
+            with open(reference_list, 'w') as file:
+                file.write(_concat_list([reference for reference, _ in pairs]))
+            with open(distorted_list, 'w') as file:
+                file.write(_concat_list([distorted for _, distorted in pairs]))
+
+            command = [
+                self.ffmpeg_path,
+                "-nostdin", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", reference_list,
+                "-f", "concat", "-safe", "0", "-i", distorted_list,
+                "-filter_complex", self._filter(log_path),
+                "-an", "-f", "null", "-"
+            ]
+            try:
+                with stage("ffmpeg.vmaf"):
+                    subprocess.run(command, capture_output=True, text=True, check=True)
+                with open(log_path) as file:
+                    scores = _frame_scores(json.load(file))
+            except subprocess.CalledProcessError as e:
+                print(colored(f"Error calculating VMAF for a batch of {len(pairs)} pairs: {e}\n{e.stderr}", 'red'))
+                return self._score_separately(pairs)
+            except (OSError, ValueError) as e:
+                print(colored(f"Error calculating VMAF for a batch of {len(pairs)} pairs: {e}", 'red'))
+                return self._score_separately(pairs)
+        return [scores.get(index) for index in range(len(pairs))]
+
+    def _score_separately(self, pairs: Sequence[Tuple[str, str]]) -> List[Optional[float]]:
+        # One unreadable file fails its whole ffmpeg run, so a failed batch is retried pair by
+        # pair and only the pairs that fail on their own go unscored
+        if len(pairs) == 1:
+            return [None]
+        return [self._score_batch([pair])[0] for pair in pairs]
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> List[Optional[float]]:
+        """
+        Score `(reference_image, distorted_image)` path pairs, in the input order that
+        `calculate_vmaf` passes them to ffmpeg. Pairs that cannot be scored, such as pairs of
+        differently sized images or unreadable files, get None rather than a score.
+        """
+        pairs = list(pairs)
+        groups = {}
+        for index, (reference, distorted) in enumerate(pairs):
+            try:
+                with Image.open(reference) as image:
+                    reference_size = image.size
+                with Image.open(distorted) as image:
+                    distorted_size = image.size
+            except OSError as e:
+                print(colored(f"Error calculating VMAF for {reference} and {distorted}: {e}", 'red'))
+                continue
+            if reference_size != distorted_size:
+                print(colored(f"Skipping VMAF for {reference} and {distorted}: sizes differ ({reference_size[0]}x{reference_size[1]} and "
+                              f"{distorted_size[0]}x{distorted_size[1]})", 'yellow'))
+                continue
+            groups.setdefault((reference_size, distorted_size), []).append(index)
+
+        scores = [None] * len(pairs)
+        for indices in groups.values():
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start:start + self.batch_size]
+                for index, score in zip(batch, self._score_batch([pairs[i] for i in batch])):
+                    scores[index] = score
+        return scores
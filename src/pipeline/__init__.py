@@ -0,0 +1,19 @@
+from .parallel import (
+    EvaluationOptions,
+    init_worker,
+    evaluate_batch,
+    evaluate_pairs
+)
+from .sharding import dataset_identity, parse_shard, shard_of, select_shard
+from .watch import DEFAULT_SETTLE_SECONDS, PairWatcher
+from .pairing import (
+    DEFAULT_GENERATED_PATTERN,
+    DEFAULT_REFERENCE_PATTERN,
+    DirectoryScan,
+    PairIndex,
+    compile_key_pattern,
+    match_key,
+    pair_manifest_path,
+    relative_key,
+    scan_entries
+)
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from termcolor import colored
+
+# Bump when the manifest layout changes so stale manifests are rebuilt
+PAIR_MANIFEST_VERSION = 1
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+# File name patterns whose `key` group pairs a base image with its improved version. The key is
+# everything before the last `_base` / `_improved` that ends the stem or is followed by a
+# separator, so `my_baseball_base.png` has the key `my_baseball`, where splitting on `_base` gave `my`.
+DEFAULT_REFERENCE_PATTERN = r"^(?P<key>.+)_base(?:[._-].*)?$"
+DEFAULT_GENERATED_PATTERN = r"^(?P<key>.+)_improved(?:[._-].*)?$"
+
+
+def compile_key_pattern(pattern: str) -> "re.Pattern":
+    """Compile a key pattern, which must have a named `key` group or exactly one group."""
+    compiled = re.compile(pattern)
+    if 'key' not in compiled.groupindex and compiled.groups != 1:
+        raise ValueError(f"Key pattern {pattern!r} needs a (?P<key>...) group or exactly one group.")
+    return compiled
+
+
+def match_key(pattern: "re.Pattern", name: str) -> Optional[str]:
+    """The pair key in file name `name`, or None when the name does not match `pattern`."""
+    match = pattern.match(name)
+    if not match:
+        return None
+    return match.group('key') if 'key' in pattern.groupindex else match.group(1)
+
+
+def relative_key(relative_directory: str, key: str) -> str:
+    """The key of a file in a subdirectory, e.g. `cats/img3`. Uses `/` on every platform, so keys are stable across machines."""
+    return f"{relative_directory.replace(os.sep, '/')}/{key}" if relative_directory else key
+
+
+def scan_entries(directory: str, relative: str = "") -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    Every visible image file under `directory`, recursively, as `(path relative to directory, entry)`.
+    Entries stream from `os.scandir`, so nothing is listed up front and no file is stat-ed.
+    """
+    with os.scandir(os.path.join(directory, relative)) as entries:
+        subdirectories = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                subdirectories.append(entry.name)
+            elif entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(relative, entry.name), entry
+    for name in sorted(subdirectories):
+        yield from scan_entries(directory, os.path.join(relative, name))
+
+
+class DirectoryScan:
+    """
+    Pair keys of the images under one directory tree, kept up to date incrementally.
+
+    The state remembers, per directory, its modification time, its subdirectories and each
+    image's key, size, modification time and inode. A rescan stats every directory, but lists
+    only those whose modification time changed (a file was added, removed or renamed in them).
+    In those it stats only files that are new or were replaced, which the inode that directory
+    listings report without a stat call tells apart. Unchanged directories are served from the
+    state without touching their files, which keeps rescans of 100k-file trees to a few hundred
+    stat calls.
+
+    Args:
+        directory (str): Root of the tree.
+        pattern (str): Key pattern applied to file names (see `compile_key_pattern`).
+        state (dict, optional): State from an earlier scan, as returned by `to_dict`.
+    """
+
+    def __init__(self, directory: str, pattern: str, state: Optional[dict] = None):
+        self.directory = os.path.abspath(directory)
+        self.pattern = pattern
+        self._compiled = compile_key_pattern(pattern)
+        state = state if state and state.get('directory') == self.directory and state.get('pattern') == pattern else {}
+        # relative directory -> [mtime_ns, [subdirectory names], {file name: [key or None, size, mtime_ns, inode]}]
+        self.directories: Dict[str, list] = state.get('directories', {})
+        self.stats = {'listed_directories': 0, 'stat_files': 0}
+        # Whether the last scan found anything the state did not already hold
+        self.changed = not state
+
+    def unmatched(self) -> List[str]:
+        """Images of the last scan whose names do not match the key pattern."""
+        return sorted(os.path.join(self.directory, relative, name) for relative, (_, _, files) in self.directories.items()
+                      for name, record in files.items() if record[0] is None)
+
+    def to_dict(self) -> dict:
+        return {'directory': self.directory, 'pattern': self.pattern, 'directories': self.directories}
+
+    def _list(self, relative: str, mtime: int) -> list:
+        """List one directory, stat-ing only its new or replaced files."""
+        self.stats['listed_directories'] += 1
+        known = self.directories.get(relative, [None, [], {}])[2]
+        subdirectories, files = [], {}
+        with os.scandir(os.path.join(self.directory, relative)) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    subdirectories.append(entry.name)
+                elif entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    record = known.get(entry.name)
+                    if not record or record[3] != entry.inode():
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        self.stats['stat_files'] += 1
+                        record = [match_key(self._compiled, entry.name), stat.st_size, stat.st_mtime_ns, stat.st_ino]
+                    files[entry.name] = record
+        return [mtime, sorted(subdirectories), files]
+
+    def scan(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yield `(key, path)` for every matching image while walking the tree, and bring the state
+        up to date once the walk is complete. Keys include the subdirectory, e.g. `cats/img3`.
+        """
+        directories = {}
+        pending = [""]
+        while pending:
+            relative = pending.pop()
+            try:
+                mtime = os.stat(os.path.join(self.directory, relative)).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            previous = self.directories.get(relative)
+            entry = previous if previous and previous[0] == mtime else self._list(relative, mtime)
+            directories[relative] = entry
+            _, subdirectories, files = entry
+            pending.extend(os.path.join(relative, name) for name in reversed(subdirectories))
+            # Plain concatenation: os.path.join per file is most of a rescan's time on large trees
+            prefix = os.path.join(self.directory, relative, "")
+            for name in sorted(files):
+                key = files[name][0]
+                if key is not None:
+                    yield relative_key(relative, key), prefix + name
+        self.changed = bool(self.stats['listed_directories']) or directories.keys() != self.directories.keys()
+        self.directories = directories
+
+
+class PairIndex:
+    """
+    Streams matched base/improved pairs from two directory trees, and reports orphans.
+
+    The reference tree is scanned first into a key -> path map; the generated tree is then
+    streamed and every key found in both is yielded as soon as its improved image is seen.
+    Files whose names do not match their pattern are ignored, and when two files give the same
+    key the first (in path order) is kept. Both scans' states are persisted to a JSON manifest
+    recording each file's key, path, size and modification time, so the next scan only stats
+    what changed.
+
+    Args:
+        reference_directory (str): Directory tree of base images.
+        generated_directory (str): Directory tree of improved images.
+        reference_pattern (str): Key pattern for base image file names.
+        generated_pattern (str): Key pattern for improved image file names.
+        manifest_path (str, optional): Where the scan state is kept. None keeps nothing between scans.
+    """
+
+    def __init__(self, reference_directory: str, generated_directory: str, reference_pattern: str = DEFAULT_REFERENCE_PATTERN,
+                 generated_pattern: str = DEFAULT_GENERATED_PATTERN, manifest_path: Optional[str] = None):
+        self.manifest_path = manifest_path
+        state = self._load()
+        self.reference = DirectoryScan(reference_directory, reference_pattern, state.get('reference'))
+        self.generated = DirectoryScan(generated_directory, generated_pattern, state.get('generated'))
+        self.orphans: Dict[str, List[str]] = {'reference': [], 'generated': []}
+        self.duplicates: List[str] = []
+        self.unmatched: List[str] = []
+
+    def _load(self) -> dict:
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path) as file:
+                state = json.load(file)
+        except (OSError, ValueError) as e:
+            print(colored(f"Ignoring unreadable pair manifest {self.manifest_path}: {e}", 'yellow'))
+            return {}
+        return state if state.get('version') == PAIR_MANIFEST_VERSION else {}
+
+    def save(self):
+        """Write the manifest atomically when a scan changed it. Compact JSON, which is several times faster to write for large trees."""
+        if not self.manifest_path or not (self.reference.changed or self.generated.changed):
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        temporary_path = self.manifest_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            file.write(json.dumps({'version': PAIR_MANIFEST_VERSION, 'reference': self.reference.to_dict(),
+                                   'generated': self.generated.to_dict()}, separators=(",", ":")))
+        os.replace(temporary_path, self.manifest_path)
+
+    def pairs(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        Yield `(key, reference_path, generated_path)` for every matched pair. Once exhausted,
+        `orphans` and `duplicates` describe what was left unpaired, and the manifest is saved.
+        """
+        references = {}
+        duplicates = []
+        for key, path in self.reference.scan():
+            if key in references:
+                duplicates.append(path)
+            else:
+                references[key] = path
+        matched = set()
+        generated_orphans = []
+        for key, path in self.generated.scan():
+            if key in matched:
+                duplicates.append(path)
+            elif key in references:
+                matched.add(key)
+                yield key, references[key], path
+            else:
+                generated_orphans.append(path)
+        self.orphans = {'reference': sorted(path for key, path in references.items() if key not in matched),
+                        'generated': sorted(generated_orphans)}
+        self.duplicates = duplicates
+        self.unmatched = self.reference.unmatched() + self.generated.unmatched()
+        self.save()
+
+    def report(self, limit: int = 5):
+        """Print the orphans, duplicate keys and unmatched file names of the last scan, with a few examples of each."""
+        problems = (("base images without an improved image", self.orphans['reference']),
+                    ("improved images without a base image", self.orphans['generated']),
+                    ("images repeating another image's key (ignored)", self.duplicates),
+                    ("images not matching the key pattern (ignored)", self.unmatched))
+        for description, paths in problems:
+            if paths:
+                examples = ", ".join(os.path.basename(path) for path in paths[:limit])
+                more = f" and {len(paths) - limit} more" if len(paths) > limit else ""
+                print(colored(f"{len(paths)} {description}: {examples}{more}", 'yellow'))
+
+
+def pair_manifest_path(reference_directory: str, generated_directory: str, reference_pattern: str, generated_pattern: str,
+                       directory: str = os.path.join(".cache", "pairs")) -> str:
+    """Manifest location for one combination of directories and patterns, under `.cache/pairs/`."""
+    identity = "\n".join([os.path.abspath(reference_directory), os.path.abspath(generated_directory), reference_pattern, generated_pattern])
+    return os.path.join(directory, hashlib.sha256(identity.encode()).hexdigest()[:16] + ".json")
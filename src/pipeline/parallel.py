@@ -0,0 +1,246 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+from termcolor import colored
+
+from src.utils.instrumentation import enable_memory_tracing, get_stats, merge_stats, profile_if_sampled, reset_stats, stage
+
+
+@dataclass
+class EvaluationOptions:
+    """
+    Settings shared by every pair of a run. Picklable, so it is sent to pool workers as-is.
+
+    Args:
+        cache_path (str, optional): SQLite feature cache shared by all workers. None disables caching.
+        cache_size_bytes (int, optional): Size budget of the feature cache.
+        ffmpeg_path (str, optional): ffmpeg binary with libvmaf. Defaults to `$FFMPEG_PATH`.
+        vmaf_model (str, optional): libvmaf model option. Defaults to `$VMAF_MODEL`.
+        batch_size (int): Pairs evaluated per batch, and so per ffmpeg invocation. Only paths, hashes and
+            results are held for the whole batch, so it does not scale peak memory.
+        metrics (list, optional): Registry names of the metrics to compute. None computes all of them.
+        near_duplicate_threshold (float, optional): Thumbnail distance for near-duplicate short-circuiting.
+        profile_sample (float): Fraction of pairs, chosen by key hash, evaluated under cProfile.
+        profile_dir (str, optional): Directory receiving one `.prof` file per profiled pair.
+        trace_memory (bool): Record tracemalloc allocation peaks per stage.
+        resample (str, optional): Resample policy aligning pairs of different resolutions (`reference`,
+            `smaller` or `larger`). None leaves them mismatched.
+        memory_bounded (bool): Compute metrics with float32 planes and streaming reductions.
+        max_pair_bytes (int, optional): Memory-bounded working-set cap per pair; larger pairs are
+            downscaled for the pair metrics.
+    """
+    cache_path: Optional[str] = None
+    cache_size_bytes: Optional[int] = None
+    ffmpeg_path: Optional[str] = None
+    vmaf_model: Optional[str] = None
+    batch_size: int = 32
+    metrics: Optional[List[str]] = None
+    near_duplicate_threshold: Optional[float] = None
+    profile_sample: float = 0.0
+    profile_dir: Optional[str] = None
+    trace_memory: bool = False
+    resample: Optional[str] = None
+    memory_bounded: bool = False
+    max_pair_bytes: Optional[int] = None
+
+
+def init_worker(torch_threads: int = 1):
+    """
+    Process pool initializer. Loads the heavy models once per worker process so that
+    every pair the worker evaluates afterwards reuses them.
+    """
+    import torch
+    # One intra-op thread per worker, otherwise N workers each spin up a full thread pool
+    torch.set_num_threads(torch_threads)
+    # Build the BRISQUE SVM for this process up front rather than inside the first pair
+    from src.metrics.metric_calculations import get_brisque
+    get_brisque()
+
+
+def _batched(description, items, compute):
+    """
+    `compute(items)` for a batch pre-pass, falling back to one item at a time if the batch fails,
+    so one bad pair does not cost the whole batch its values. Items that fail on their own get
+    None and are left to `compare_images`, which isolates their errors per pair.
+    """
+    try:
+        return list(compute(items))
+    except Exception as e:
+        if len(items) == 1:
+            return [None]
+        print(colored(f"Batched {description} failed for {len(items)} items ({e}); computing them one by one", 'yellow'))
+    values = []
+    for item in items:
+        try:
+            values.extend(compute([item]))
+        except Exception:
+            values.append(None)
+    return values
+
+
+def failure(error) -> dict:
+    """The results of a pair that could not be compared: just the `error` that stopped it, as text."""
+    return {'error': error if isinstance(error, str) else f"{type(error).__name__}: {error}"}
+
+
+def evaluate_batch(batch, options: EvaluationOptions):
+    """
+    Evaluate a batch of `(key, reference_path, generated_path)` items.
+
+    VMAF for every pair in the batch that is not already cached is scored by a single
+    ffmpeg invocation, which only needs the paths. The pairs are then evaluated a few at a time
+    (four, or one in memory-bounded mode): SSIM, MS-SSIM and GSIM by stacked passes over those
+    pairs, BRISQUE by one SVR prediction for their images, and the remaining metrics pair by
+    pair. Each pair's decoded images and planes are released once it is scored, so peak memory
+    follows those few pairs rather than the batch size; across the batch only hashes, feature
+    vectors and results are kept. A pair that fails only fails itself: batch pre-passes fall
+    back to per-pair computation, and each pair's `compare_images` runs on its own.
+
+    Returns:
+        list: `(key, results)` tuples for every pair of the batch, with `failure` results (an
+        `error` message) for pairs that could not be compared.
+    """
+    from src.metrics import (STRUCTURAL_METRICS, ImagePairContext, VmafEngine, compare_images, get_brisque, open_feature_cache, resolve_metrics,
+                             structural_similarity_batch)
+    from src.metrics.duplicates import duplicate_kind
+
+    if options.trace_memory:
+        enable_memory_tracing()
+    engine = VmafEngine(ffmpeg_path=options.ffmpeg_path, model=options.vmaf_model, batch_size=options.batch_size)
+    cache = open_feature_cache(options.cache_path, max_size_bytes=options.cache_size_bytes, vmaf_identity=engine.identity)
+
+    # Only pairs the cache cannot answer need VMAF or the structural metrics, and identical pairs get
+    # their closed-form values (or no VMAF) instead. Pairs whose files cannot be hashed skip the pre-passes.
+    selected = [metric.name for metric in resolve_metrics(options.metrics)]
+    pairs, kinds, cached = {}, {}, {}
+    for key, reference_path, generated_path in batch:
+        if not (os.path.exists(reference_path) and os.path.exists(generated_path)):
+            continue
+        try:
+            pair = ImagePairContext(reference_path, generated_path, resample=options.resample, memory_bounded=options.memory_bounded,
+                                    max_pair_bytes=options.max_pair_bytes)
+            kinds[key] = duplicate_kind(pair, options.near_duplicate_threshold)
+            if kinds[key] != 'identical':
+                cached[key] = (cache.get_pair(pair) or {}) if cache is not None else {}
+        except Exception:
+            continue
+        # Keep the hashes, not the file bytes or the planes the near-duplicate check decoded
+        pair.release()
+        pairs[key] = pair
+    precomputed = {key: {} for key in pairs}
+
+    # ffmpeg gets (improved, base) like calculate_vmaf. Pairs it cannot score get None
+    pending = [key for key in pairs if kinds[key] != 'identical' and 'vmaf' not in cached[key]] if 'vmaf' in selected else []
+    if pending:
+        scores = _batched("VMAF", [(pairs[key].image2_path, pairs[key].image1_path) for key in pending], engine.score_pairs)
+        for key, score in zip(pending, scores):
+            precomputed[key]['vmaf'] = score
+
+    structural = [name for name in STRUCTURAL_METRICS if name in selected]
+    # Memory-bounded runs hold and stack one pair at a time in float32
+    window, dtype = (1, 'float32') if options.memory_bounded else (4, 'float64')
+    results = []
+    for start in range(0, len(batch), window):
+        items = batch[start:start + window]
+        keys = [key for key, _, _ in items if key in pairs]
+
+        # SSIM, MS-SSIM and GSIM for the window's pairs in stacked passes rather than three calls per pair
+        pending = [key for key in keys if kinds[key] != 'identical' and any(name not in cached[key] for name in structural)]
+        if pending:
+            values = _batched("SSIM, MS-SSIM and GSIM", [pairs[key] for key in pending],
+                              lambda items: structural_similarity_batch(items, structural, chunk_size=window, dtype=dtype))
+            for key, pair_values in zip(pending, values):
+                precomputed[key].update(pair_values or {})
+
+        # BRISQUE features per image, then one SVR prediction for the window's images.
+        # compare_images copies image1's values to image2 of identical pairs
+        if 'brisque' in selected:
+            pending = [(key, suffix, image) for key in keys for suffix, image in (('_image1', pairs[key].image1), ('_image2', pairs[key].image2))
+                       if not (suffix == '_image2' and kinds[key] == 'identical')
+                       and (cache is None or 'brisque' not in (cache.get_image(image) or {}))]
+            if pending:
+                with stage("metric.brisque"):
+                    scores = _batched("BRISQUE", [image for _, _, image in pending],
+                                      lambda images: get_brisque().predict(np.stack([image.brisque_features for image in images])))
+                    for (key, suffix, _), score in zip(pending, scores):
+                        if score is not None:
+                            precomputed[key]['brisque' + suffix] = float(score)
+
+        for key, reference_path, generated_path in items:
+            try:
+                if key not in pairs:
+                    values = compare_images(reference_path, generated_path, metrics=options.metrics, resample=options.resample,
+                                            memory_bounded=options.memory_bounded, max_pair_bytes=options.max_pair_bytes)
+                    results.append((key, values if values is not None else failure("One or both images do not exist")))
+                    continue
+                pair = pairs[key]
+                with profile_if_sampled(key, options.profile_sample, options.profile_dir):
+                    values = compare_images(pair.image1, pair.image2, metrics=options.metrics, cache=cache, precomputed=precomputed.pop(key),
+                                            near_duplicate_threshold=options.near_duplicate_threshold, resample=options.resample,
+                                            memory_bounded=options.memory_bounded, max_pair_bytes=options.max_pair_bytes)
+                if values is None:
+                    values = failure("One or both images do not exist")
+                else:
+                    # Recorded so the results store need not read and hash the images again
+                    values.update(reference_hash=pair.image1.content_hash, generated_hash=pair.image2.content_hash)
+                results.append((key, values))
+            except Exception as e:
+                print(colored(f"Error comparing {reference_path} and {generated_path}: {e!r}", 'red'))
+                results.append((key, failure(e)))
+            finally:
+                # Nothing of the pair but its results outlives it
+                pairs.pop(key, None)
+    if cache is not None:
+        cache.flush()
+    return results
+
+
+def _evaluate_batch_in_worker(batch, options: EvaluationOptions):
+    # Stage stats of a worker are shipped back with its results and merged into the parent's
+    reset_stats()
+    results = evaluate_batch(batch, options)
+    return results, get_stats()
+
+
+def evaluate_pairs(pairs, workers: int = 1, options: Optional[EvaluationOptions] = None):
+    """
+    Evaluate image pairs, yielding `(key, results)` as each batch of pairs finishes.
+
+    Args:
+        pairs (dict): Maps a pair key to its `(reference_path, generated_path)`.
+        workers (int): Number of worker processes. 1 evaluates in-process, in order.
+        options (EvaluationOptions, optional): Cache and VMAF settings for the run.
+
+    Yields:
+        tuple: The pair key and the `compare_images` results, or `failure` results with the
+        `error` if the pair could not be compared.
+    """
+    options = options or EvaluationOptions()
+    items = [(key, reference_path, generated_path) for key, (reference_path, generated_path) in pairs.items()]
+    # Small datasets are split so that every worker still gets a share
+    batch_size = max(1, min(options.batch_size, math.ceil(len(items) / max(1, workers))))
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+    if workers <= 1:
+        for batch in batches:
+            yield from evaluate_batch(batch, options)
+        return
+
+    print(f"Evaluating {len(pairs)} pairs across {workers} worker processes ...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        futures = {executor.submit(_evaluate_batch_in_worker, batch, options): batch for batch in batches}
+        # Results stream back in completion order, not submission order
+        for future in as_completed(futures):
+            try:
+                results, stats = future.result()
+                merge_stats(stats)
+                yield from results
+            except Exception as e:
+                batch = futures[future]
+                print(colored(f"Error evaluating {len(batch)} pairs starting at {batch[0][0]}: {e}", 'red'))
+                for key, _, _ in batch:
+                    yield key, failure(e)
@@ -0,0 +1,35 @@
+import hashlib
+from typing import Iterable, List, Tuple
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse an `i/N` shard spec into `(index, count)`, with 0 <= index < count."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, e.g. 0/4, not {value!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must be in 0..{count - 1} for {count} shards, not {index}")
+    return index, count
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    Shard a pair key belongs to. Based on a hash of the key alone, so every node computes the
+    same partition regardless of directory listing order, Python hash seed or platform.
+    """
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], 'big') % count
+
+
+def select_shard(keys: Iterable[str], index: int, count: int) -> List[str]:
+    return [key for key in keys if shard_of(key, count) == index]
+
+
+def dataset_identity(keys: Iterable[str]) -> dict:
+    """
+    What a sharded run evaluates, independent of where each node mounts the data: the number of
+    pair keys and a hash of the sorted keys. Every shard of a run sees the same keys before
+    selecting its own, so their identities match even when their directory paths differ.
+    """
+    keys = sorted(keys)
+    return {'pairs': len(keys), 'keys_sha256': hashlib.sha256("\n".join(keys).encode()).hexdigest()}
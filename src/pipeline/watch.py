@@ -0,0 +1,82 @@
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from .pairing import DEFAULT_GENERATED_PATTERN, DEFAULT_REFERENCE_PATTERN, compile_key_pattern, match_key, relative_key, scan_entries
+
+# Seconds a file's size and modification time must stay unchanged before it counts as fully written
+DEFAULT_SETTLE_SECONDS = 2.0
+
+
+class PairWatcher:
+    """
+    Detects base/improved pairs that newly appeared in two directories, for watch mode.
+
+    Every `poll` walks both directory trees with `os.scandir` and stats only the images of pairs
+    not evaluated yet. Files are keyed by the same patterns as `PairIndex`, so keys match those
+    of batch runs and of the results file a session resumes from. A file still
+    being written is debounced: it only counts once its size and modification time have
+    stayed the same for `settle_seconds`. A pair is reported once, when both of its files
+    have settled.
+
+    Args:
+        reference_directory (str): Directory tree receiving base images.
+        generated_directory (str): Directory tree receiving improved images.
+        settle_seconds (float): Quiet period before a file is considered complete.
+        done (iterable, optional): Keys already evaluated, e.g. from a resumed results file.
+        reference_pattern (str): Key pattern for base image file names.
+        generated_pattern (str): Key pattern for improved image file names.
+    """
+
+    def __init__(self, reference_directory: str, generated_directory: str, settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+                 done: Optional[Iterable[str]] = None, reference_pattern: str = DEFAULT_REFERENCE_PATTERN,
+                 generated_pattern: str = DEFAULT_GENERATED_PATTERN):
+        self.reference_directory = reference_directory
+        self.generated_directory = generated_directory
+        self.settle_seconds = settle_seconds
+        self.reference_pattern = compile_key_pattern(reference_pattern)
+        self.generated_pattern = compile_key_pattern(generated_pattern)
+        self.done = set(done or ())
+        # path -> ((size, mtime_ns), monotonic time that stamp was first seen)
+        self._stamps: Dict[str, Tuple[Tuple[int, int], float]] = {}
+
+    def _settled_files(self, directory: str, pattern, now: float, seen: set) -> Dict[str, str]:
+        files = {}
+        for relative, entry in scan_entries(directory):
+            seen.add(entry.path)
+            key = match_key(pattern, entry.name)
+            if key is None:
+                continue
+            key = relative_key(os.path.dirname(relative), key)
+            if key in self.done or key in files:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            previous = self._stamps.get(entry.path)
+            if previous is None or previous[0] != stamp:
+                # New or still changing: restart its quiet period, unless it was last modified long ago
+                age = time.time() - stat.st_mtime_ns / 1e9
+                self._stamps[entry.path] = (stamp, now - max(0.0, age))
+                previous = self._stamps[entry.path]
+            if stat.st_size > 0 and now - previous[1] >= self.settle_seconds:
+                files[key] = entry.path
+        return files
+
+    def poll(self) -> Dict[str, Tuple[str, str]]:
+        """
+        New complete pairs since the last poll, as `{key: (reference_path, generated_path)}`.
+        Returned keys are marked done and not reported again.
+        """
+        now = time.monotonic()
+        seen = set()
+        references = self._settled_files(self.reference_directory, self.reference_pattern, now, seen)
+        generated = self._settled_files(self.generated_directory, self.generated_pattern, now, seen)
+        pairs = {key: (references[key], generated[key]) for key in sorted(references.keys() & generated.keys())}
+        self.done.update(pairs)
+        # Only files still waiting for their partner keep a stamp; paired and deleted files are dropped
+        paired = {path for paths in pairs.values() for path in paths}
+        self._stamps = {path: stamp for path, stamp in self._stamps.items() if path in seen and path not in paired}
+        return pairs
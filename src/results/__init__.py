@@ -0,0 +1,8 @@
+from .sketch import QuantileSketch
+from .stats import RunningStats, ResultsAggregator, is_scored
+from .writers import JsonlResultsWriter, ParquetResultsWriter, open_results_writer, read_results, read_columns, write_json_atomic, write_summary
+from .manifest import manifest_path, load_manifest, write_manifest, check_resumable
+from .report import report_summary, report_bootstrap
+from .bootstrap import DEFAULT_RESAMPLES, bootstrap_means, bootstrap_statistics, paired_differences, sign_flip_pvalues
+from .view import ConsoleView
+from .store import ResultsStore, RunWriter, file_fingerprint, parse_since
@@ -0,0 +1,38 @@
+import json
+import os
+import time
+from typing import Optional
+
+from .writers import write_json_atomic
+
+
+def manifest_path(results_path: str) -> str:
+    """The manifest lives next to the results file: `results.jsonl` -> `results.manifest.json`."""
+    return os.path.splitext(results_path)[0] + ".manifest.json"
+
+
+def load_manifest(results_path: str) -> Optional[dict]:
+    path = manifest_path(results_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_manifest(results_path: str, manifest: dict):
+    """Replace the run manifest atomically, stamping when it was last updated."""
+    manifest = dict(manifest, updated_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    write_json_atomic(manifest_path(results_path), manifest)
+
+
+def check_resumable(manifest: Optional[dict], settings: dict):
+    """
+    Raise ValueError when a run cannot be resumed with `settings`: there is no manifest, or it
+    was started on other directories or with a different metric selection, whose stored
+    results would not be comparable with the pairs still to evaluate.
+    """
+    if manifest is None:
+        raise ValueError("No run manifest found next to the results file; start a new run without --resume.")
+    changed = [name for name, value in settings.items() if manifest.get(name) != value]
+    if changed:
+        raise ValueError(f"Cannot resume: {', '.join(changed)} differ from the interrupted run.")
@@ -0,0 +1,68 @@
+from termcolor import colored
+
+from src.evaluation_metrics import SCORED_METRICS, evaluate_image_improvement
+from src.utils.constants import DEFAULT_PLACEHOLDER_PROMPT
+
+from .stats import ResultsAggregator
+
+
+def report_summary(aggregator: ResultsAggregator) -> dict:
+    """
+    Print the end-of-run averages, verdict and score distribution, and return them as the
+    JSON-serializable run summary. Works the same for a single run and for merged shards.
+    """
+    summary = aggregator.summary()
+    if aggregator.failed:
+        print(colored(f"{aggregator.failed} image pairs could not be compared; their errors are in the results file", 'red'))
+    if not aggregator.records:
+        print(colored("No image pairs were evaluated.", 'yellow'))
+        return summary
+
+    print(colored(f"AVERAGES ACROSS {aggregator.records} IMAGE PAIRS", 'magenta'))
+    for metric, stats in summary['metrics'].items():
+        if stats['count']:
+            std = f" (std {stats['std']:.6f})" if stats['std'] is not None else ""
+            # Means only cover pairs with a finite value; say so when that is not every pair
+            coverage = ""
+            if stats['count'] != aggregator.records:
+                coverage = f"  [over {stats['count']} of {aggregator.records} pairs"
+                coverage += f"; {stats['skipped']} non-finite skipped]" if stats['skipped'] else "]"
+            print(f"{metric.upper()}: {stats['mean']:.16f}{std}{coverage}")
+
+    skipped = summary['skipped_duplicates']
+    if skipped['identical'] or skipped['near']:
+        print(colored(f"Short-circuited {skipped['identical']} identical pairs (verdict: identical, not scored); "
+                      f"flagged {skipped['near']} near-duplicate pairs", 'blue'))
+
+    # The verdict, the score distribution and its buckets all cover the scored pairs: those with a
+    # finite score and finite scored metrics. Runs over a metric subset store no scores
+    if aggregator.scored and all(metric in aggregator.scored_stats for metric in SCORED_METRICS):
+        means = aggregator.scored_means()
+        score, conclusion = evaluate_image_improvement({metric: means[metric] for metric in SCORED_METRICS}, prompt=DEFAULT_PLACEHOLDER_PROMPT)
+        summary['conclusion'] = {'score': score, 'summary': conclusion, 'pairs': aggregator.scored}
+        unscored = aggregator.records - aggregator.scored
+        if unscored:
+            print(colored(f"Verdict over {aggregator.scored} of {aggregator.records} pairs; {unscored} without a finite score or scored metrics are left out", 'yellow'))
+        print(colored(f"Conclusion on average metrics for images: {conclusion} (Score: {score:.16f})", 'green'))
+        score_stats = aggregator.scored_stats['score']
+        print(colored(f"PER-PAIR SCORE DISTRIBUTION OVER {aggregator.scored} PAIRS (mean {score_stats.mean:.4f}, min {score_stats.min:.4f}, "
+                      f"max {score_stats.max:.4f})", 'magenta'))
+        for bucket, count in summary['score_distribution'].items():
+            print(f"  {count:6d}  {bucket}")
+    return summary
+
+
+def report_bootstrap(statistics: dict):
+    """Print the confidence intervals, paired significance and verdict confidence of `bootstrap_statistics`."""
+    if not statistics['metrics']:
+        return
+    level = f"{100 * statistics['confidence']:g}%"
+    print(colored(f"BOOTSTRAP {level} CONFIDENCE INTERVALS ({statistics['resamples']} resamples of {statistics['pairs']} pairs)", 'magenta'))
+    for metric, entry in statistics['metrics'].items():
+        significance = f"  paired p = {entry['p_value']:.4f}" if 'p_value' in entry else ""
+        print(f"{metric.upper()}: {entry['mean']:.6g} [{entry['ci_low']:.6g}, {entry['ci_high']:.6g}]{significance}")
+    if 'score' in statistics:
+        score = statistics['score']
+        print(colored(f"Dataset score over {score['pairs']} pairs {score['score']:.4f} [{score['ci_low']:.4f}, {score['ci_high']:.4f}]; "
+                      f"{100 * score['verdict_confidence']:.1f}% of resamples reach the same verdict, "
+                      f"p(no clear improvement) = {score['p_no_improvement']:.4f}", 'green'))
@@ -0,0 +1,84 @@
+import math
+from collections import Counter
+from typing import Optional
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with bounded relative error, in the style of DDSketch.
+
+    Values are counted in logarithmically sized buckets, so any quantile is estimated within
+    `relative_accuracy` of the true value while memory grows only with the logarithm of the
+    value range. Two sketches with the same accuracy merge exactly by adding bucket counts,
+    which makes quantiles from merged shards identical to quantiles from a single run.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = Counter()
+        self.negative = Counter()
+        self.zero_count = 0
+        self.count = 0
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # Midpoint of the bucket in relative terms, which bounds the error on both sides
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value: float):
+        if value > 0:
+            self.positive[self._index(value)] += 1
+        elif value < 0:
+            self.negative[self._index(-value)] += 1
+        else:
+            self.zero_count += 1
+        self.count += 1
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged.")
+        self.positive.update(other.positive)
+        self.negative.update(other.negative)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the `q`-quantile (0 <= q <= 1); None for an empty sketch."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # Negative values, from the most negative (largest magnitude) up
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.positive))
+
+    def to_dict(self) -> dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'positive': {str(index): count for index, count in self.positive.items()},
+            'negative': {str(index): count for index, count in self.negative.items()},
+            'zero_count': self.zero_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data['relative_accuracy'])
+        sketch.positive = Counter({int(index): count for index, count in data['positive'].items()})
+        sketch.negative = Counter({int(index): count for index, count in data['negative'].items()})
+        sketch.zero_count = data['zero_count']
+        sketch.count = sum(sketch.positive.values()) + sum(sketch.negative.values()) + sketch.zero_count
+        return sketch
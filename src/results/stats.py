@@ -0,0 +1,202 @@
+import math
+from collections import Counter
+from typing import Dict
+
+from src.evaluation_metrics.batch_scoring import SCORING_TABLE, SUMMARIES, summary_bucket
+
+from .sketch import QuantileSketch
+
+
+class RunningStats:
+    """
+    Count, mean, variance, minimum, maximum and quantiles of a stream of values in O(1) memory.
+
+    Uses Welford's update, which stays numerically stable over long runs where naively
+    accumulating sums of squares would cancel catastrophically. Quantiles come from a
+    QuantileSketch. Stats from separate runs or shards combine with `merge`. Infinite and NaN
+    values (e.g. PSNR of identical images) are left out of every statistic and counted in
+    `skipped`, so a mean's denominator is always `count`.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.skipped = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def update(self, value: float):
+        value = float(value)
+        # Infinite values (e.g. PSNR of identical images) or NaN would poison the mean and variance
+        if not math.isfinite(value):
+            self.skipped += 1
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.sum += value
+        self.sum_sq += value * value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other: "RunningStats"):
+        """Fold in the stats of another stream, as if its values had been added here."""
+        self.skipped += other.skipped
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        # Chan et al.'s pairwise combination of Welford states
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def to_partial(self) -> dict:
+        """
+        Mergeable state. Count, sum and sum of squares are included for consumers that only need
+        totals; merging uses the mean/M2 form, which avoids the cancellation of sums of squares.
+        """
+        return {'count': self.count, 'skipped': self.skipped, 'sum': self.sum, 'sum_sq': self.sum_sq, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min if self.count else None, 'max': self.max if self.count else None,
+                'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_partial(cls, partial: dict) -> "RunningStats":
+        stats = cls()
+        stats.count = partial['count']
+        stats.skipped = partial.get('skipped', 0)
+        stats.sum, stats.sum_sq = partial['sum'], partial['sum_sq']
+        stats.mean, stats.m2 = partial['mean'], partial['m2']
+        if stats.count:
+            stats.min, stats.max = partial['min'], partial['max']
+        stats.sketch = QuantileSketch.from_dict(partial['sketch'])
+        return stats
+
+    @property
+    def variance(self) -> float:
+        """Sample variance; NaN with fewer than two values."""
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance) if self.count > 1 else math.nan
+
+    def to_dict(self) -> dict:
+        if not self.count:
+            return {'count': 0, 'skipped': self.skipped}
+        return {'count': self.count, 'skipped': self.skipped, 'mean': self.mean, 'std': self.std if self.count > 1 else None, 'min': self.min, 'max': self.max,
+                'p50': self.sketch.quantile(0.5), 'p90': self.sketch.quantile(0.9), 'p99': self.sketch.quantile(0.99)}
+
+
+def is_scored(record: dict) -> bool:
+    """
+    Whether a record counts towards the run's verdict and score distribution: it has a finite
+    score and every scored metric is finite. Pairs with an infinite PSNR, a missing VMAF or no
+    score at all (identical pairs, metric subsets) are left out of both alike.
+    """
+    values = [record.get('score')] + [record.get(name) for name in SCORING_TABLE]
+    return all(isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) for value in values)
+
+
+class ResultsAggregator:
+    """
+    Incremental per-metric statistics and score distribution over the records of a run.
+
+    Every numeric field of a record gets its own RunningStats. Scored records (see `is_scored`)
+    also feed a second set of stats for the score and scored metrics, and are counted into their
+    summary bucket, so the verdict, the score distribution and its bucket counts all cover the
+    same pairs. Failure records (pairs that could not be compared, with an `error` instead of
+    values) are only counted, in `failed`. The end-of-run summary never needs the individual
+    records again.
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, RunningStats] = {}
+        # Score and scored metrics over the scored records only
+        self.scored_stats: Dict[str, RunningStats] = {}
+        self.bucket_counts = [0] * len(SUMMARIES)
+        self.records = 0
+        self.failed = 0
+        # Identical pairs (short-circuited, not scored) and flagged near duplicates
+        self.duplicates = Counter()
+
+    @property
+    def scored(self) -> int:
+        return self.scored_stats['score'].count if 'score' in self.scored_stats else 0
+
+    def update(self, record: dict):
+        if record.get('error'):
+            self.failed += 1
+            return
+        # Results files store non-finite values as strings; a resumed run reads them back as such
+        record = {name: float(value) if isinstance(value, str) and value in ('inf', '-inf', 'nan') else value
+                  for name, value in record.items()}
+        self.records += 1
+        for name, value in record.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            self.stats.setdefault(name, RunningStats()).update(value)
+        if is_scored(record):
+            for name in ('score',) + tuple(SCORING_TABLE):
+                self.scored_stats.setdefault(name, RunningStats()).update(record[name])
+            self.bucket_counts[int(summary_bucket(record['score']))] += 1
+        if record.get('duplicate') in ('identical', 'near'):
+            self.duplicates[record['duplicate']] += 1
+
+    def merge(self, other: "ResultsAggregator"):
+        self.records += other.records
+        self.failed += other.failed
+        self.bucket_counts = [mine + theirs for mine, theirs in zip(self.bucket_counts, other.bucket_counts)]
+        self.duplicates.update(other.duplicates)
+        for name, stats in other.stats.items():
+            self.stats.setdefault(name, RunningStats()).merge(stats)
+        for name, stats in other.scored_stats.items():
+            self.scored_stats.setdefault(name, RunningStats()).merge(stats)
+
+    def to_partial(self) -> dict:
+        """JSON-serializable state that `from_partial` restores and `merge` combines across shards."""
+        return {'records': self.records, 'failed': self.failed, 'bucket_counts': self.bucket_counts, 'duplicates': dict(self.duplicates),
+                'stats': {name: stats.to_partial() for name, stats in self.stats.items()},
+                'scored_stats': {name: stats.to_partial() for name, stats in self.scored_stats.items()}}
+
+    @classmethod
+    def from_partial(cls, partial: dict) -> "ResultsAggregator":
+        aggregator = cls()
+        aggregator.records = partial['records']
+        aggregator.failed = partial.get('failed', 0)
+        aggregator.bucket_counts = list(partial['bucket_counts'])
+        aggregator.duplicates = Counter(partial.get('duplicates', {}))
+        aggregator.stats = {name: RunningStats.from_partial(stats) for name, stats in partial['stats'].items()}
+        aggregator.scored_stats = {name: RunningStats.from_partial(stats) for name, stats in partial.get('scored_stats', {}).items()}
+        return aggregator
+
+    def means(self, names=None) -> Dict[str, float]:
+        names = self.stats if names is None else names
+        return {name: self.stats[name].mean for name in names if name in self.stats and self.stats[name].count}
+
+    def scored_means(self) -> Dict[str, float]:
+        """Means of the score and every scored metric over the scored records, the inputs of the run's verdict."""
+        return {name: stats.mean for name, stats in self.scored_stats.items() if stats.count}
+
+    def summary(self) -> dict:
+        """
+        JSON-serializable summary: record count, count of `failed` pairs, per-field statistics (with
+        `skipped` non-finite values), the scored record count and the summary bucket counts of those records.
+        """
+        summary = {'records': self.records, 'failed': self.failed, 'metrics': {name: stats.to_dict() for name, stats in self.stats.items()}}
+        summary['skipped_duplicates'] = {'identical': self.duplicates['identical'], 'near': self.duplicates['near']}
+        if self.scored:
+            summary['scored_records'] = self.scored
+            summary['score_distribution'] = dict(zip(SUMMARIES, self.bucket_counts))
+        return summary
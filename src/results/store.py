@@ -0,0 +1,334 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Record fields that describe the pair rather than measure it
+_PAIR_FIELDS = ('key', 'reference', 'generated', 'summary', 'summary_v2', 'reference_hash', 'generated_hash')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    results_path TEXT,
+    settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    size_bytes INTEGER,
+    width INTEGER,
+    height INTEGER
+);
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    key TEXT NOT NULL,
+    reference TEXT,
+    generated TEXT,
+    reference_image_id INTEGER REFERENCES images (id),
+    generated_image_id INTEGER REFERENCES images (id),
+    summary TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+-- Clustered by metric: one metric's values over any set of pairs are a contiguous range
+CREATE TABLE IF NOT EXISTS metric_values (
+    metric_id INTEGER NOT NULL REFERENCES metrics (id),
+    pair_id INTEGER NOT NULL REFERENCES pairs (id),
+    value REAL,
+    PRIMARY KEY (metric_id, pair_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pairs_key ON pairs (key);
+CREATE INDEX IF NOT EXISTS pairs_run ON pairs (run_id, key);
+CREATE INDEX IF NOT EXISTS pairs_created_at ON pairs (created_at);
+"""
+
+# The finite stored values. Infinite values (identical images' PSNR) are kept in the table but, as in
+# the run report, left out of aggregates; NaN is stored as NULL, which aggregates skip anyway
+_FINITE = f"CASE WHEN v.value BETWEEN {-sys.float_info.max!r} AND {sys.float_info.max!r} THEN v.value END"
+
+# Aggregates a query can ask for, as SQL over the selected finite metric values
+AGGREGATES = {'count': f"COUNT({_FINITE})", 'mean': f"AVG({_FINITE})", 'min': f"MIN({_FINITE})", 'max': f"MAX({_FINITE})", 'sum': f"SUM({_FINITE})"}
+# Always reported next to the aggregates: stored values they leave out
+_NON_FINITE = f"COUNT(*) - COUNT({_FINITE})"
+
+# How query results can be grouped: one row per prompt key, run or UTC day
+GROUP_BY = {'key': "p.key", 'run': "p.run_id", 'day': "date(p.created_at, 'unixepoch')"}
+
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)\s*([smhdw])$")
+_DURATION_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+
+def parse_since(value: str, now: Optional[float] = None) -> float:
+    """
+    A timestamp from a relative age like `7d`, `12h` or `1w`, or from an ISO date or datetime
+    like `2024-05-01` (local time). Raises ValueError for anything else.
+    """
+    match = _DURATION.match(value.strip())
+    if match:
+        return (now if now is not None else time.time()) - float(match.group(1)) * _DURATION_SECONDS[match.group(2)]
+    for layout in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return time.mktime(time.strptime(value.strip(), layout))
+        except ValueError:
+            continue
+    raise ValueError(f"Cannot read '{value}' as a time: use an age like 7d, 12h, 1w or a date like 2024-05-01.")
+
+
+def file_fingerprint(path: str, content_hash: Optional[str] = None) -> Tuple[str, int, Optional[int], Optional[int]]:
+    """
+    (content hash, size in bytes, width, height) of an image file. The hash is the SHA-256 of
+    the file bytes, the same as `ImageContext.content_hash`; pass the one a worker already
+    computed as `content_hash` to skip reading the file again. The dimensions come from the
+    header alone, without decoding the pixels.
+    """
+    from PIL import Image
+    if content_hash is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except OSError:
+        width = height = None
+    return content_hash, os.path.getsize(path), width, height
+
+
+def _number(value):
+    # Metric values worth storing: finite or infinite numbers (identical images' PSNR); NaN becomes NULL
+    if type(value) is float:
+        return (None if value != value else value), True
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, str) and value in ('inf', '-inf', 'nan'):
+        # The JSONL writer stores non-finite floats as strings
+        value = float(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None, False
+    return (None if isinstance(value, float) and math.isnan(value) else float(value)), True
+
+
+class ResultsStore:
+    """
+    Indexed SQLite store of evaluation results, for querying across runs without recomputing.
+
+    Runs, images (by content hash), pairs and one row per pair and metric are kept in
+    separate tables. Metric values are clustered by metric, so aggregating one metric over
+    millions of pairs reads only that metric's rows. Pairs are indexed by prompt key, run
+    and time. Records are inserted through `RunWriter`, which buffers them
+    and writes each batch in a single transaction.
+
+    Args:
+        path (str): Location of the SQLite file. Parent directories are created.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._connection.commit()
+        self._metric_ids = dict(self._connection.execute("SELECT name, id FROM metrics").fetchall())
+
+    def start_run(self, settings: dict, results_path: Optional[str] = None, started_at: Optional[float] = None) -> int:
+        """Register a run with its settings (as written to its manifest) and return its id."""
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO runs (started_at, results_path, settings) VALUES (?, ?, ?)",
+                (started_at if started_at is not None else time.time(), results_path, json.dumps(settings, sort_keys=True)))
+        return cursor.lastrowid
+
+    def writer(self, run_id: int, batch_size: int = 1000, created_at: Optional[float] = None) -> "RunWriter":
+        return RunWriter(self, run_id, batch_size, created_at)
+
+    def _metric_id(self, name: str) -> int:
+        if name not in self._metric_ids:
+            self._connection.execute("INSERT OR IGNORE INTO metrics (name) VALUES (?)", (name,))
+            self._metric_ids[name] = self._connection.execute("SELECT id FROM metrics WHERE name = ?", (name,)).fetchone()[0]
+        return self._metric_ids[name]
+
+    def _image_ids(self, fingerprints: Iterable[Tuple[str, int, Optional[int], Optional[int]]]) -> Dict[str, int]:
+        fingerprints = {fingerprint[0]: fingerprint for fingerprint in fingerprints}
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO images (content_hash, size_bytes, width, height) VALUES (?, ?, ?, ?)", fingerprints.values())
+        ids = {}
+        hashes = list(fingerprints)
+        # Bounded IN lists: SQLite limits the number of parameters per statement
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            ids.update(self._connection.execute(
+                f"SELECT content_hash, id FROM images WHERE content_hash IN ({','.join('?' * len(chunk))})", chunk).fetchall())
+        return ids
+
+    def insert(self, run_id: int, rows: List[Tuple[dict, Optional[tuple], Optional[tuple]]], created_at: Optional[float] = None):
+        """
+        Insert `(record, reference fingerprint, generated fingerprint)` rows in one transaction.
+        Fingerprints are `file_fingerprint` tuples, or None when the image files are unknown.
+        """
+        created_at = created_at if created_at is not None else time.time()
+        try:
+            self._insert(run_id, rows, created_at)
+        except sqlite3.Error:
+            # Metric ids registered inside the rolled back transaction are gone again
+            self._metric_ids = dict(self._connection.execute("SELECT name, id FROM metrics").fetchall())
+            raise
+
+    def _insert(self, run_id, rows, created_at):
+        # Take the write lock up front so the pair ids numbered below cannot be taken by another writer
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            image_ids = self._image_ids(fingerprint for _, *fingerprints in rows for fingerprint in fingerprints if fingerprint)
+            first_id = self._connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM pairs").fetchone()[0]
+            pairs, values = [], []
+            for pair_id, (record, reference, generated) in enumerate(rows, start=first_id):
+                pairs.append((pair_id, run_id, record['key'], record.get('reference'), record.get('generated'),
+                              image_ids[reference[0]] if reference else None, image_ids[generated[0]] if generated else None,
+                              record.get('summary'), created_at))
+                for name, value in record.items():
+                    if name in _PAIR_FIELDS:
+                        continue
+                    number, numeric = _number(value)
+                    if numeric:
+                        values.append((self._metric_id(name), pair_id, number))
+            self._connection.executemany(
+                "INSERT INTO pairs (id, run_id, key, reference, generated, reference_image_id, generated_image_id, summary, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", pairs)
+            self._connection.executemany("INSERT INTO metric_values (metric_id, pair_id, value) VALUES (?, ?, ?)", values)
+            self._connection.commit()
+        except BaseException:
+            self._connection.rollback()
+            raise
+
+    def metrics(self) -> List[str]:
+        return sorted(self._metric_ids)
+
+    def runs(self) -> List[dict]:
+        """Every run with its settings and how many pairs it stored, oldest first."""
+        rows = self._connection.execute(
+            "SELECT r.id, r.started_at, r.results_path, r.settings, "
+            "(SELECT COUNT(*) FROM pairs p WHERE p.run_id = r.id) FROM runs r ORDER BY r.id").fetchall()
+        return [{'id': run_id, 'started_at': started_at, 'results_path': results_path, 'settings': json.loads(settings), 'pairs': pairs}
+                for run_id, started_at, results_path, settings, pairs in rows]
+
+    def aggregate(self, metric: str, key_pattern: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+                  run_id: Optional[int] = None, group_by: Optional[str] = None, aggregates: Iterable[str] = ('count', 'mean', 'min', 'max')) -> List[dict]:
+        """
+        Aggregate one metric's stored values in SQL, without loading the rows into Python.
+        Aggregates cover finite values only, like the run report's means; each row also has
+        `non_finite`, the number of infinite or NaN values they left out.
+
+        Args:
+            metric (str): Stored record field, e.g. `ssim`, `vmaf` or `score`.
+            key_pattern (str, optional): Shell-style pattern on the prompt key, e.g. `*cat*` (case-sensitive).
+            since (float, optional): Only pairs stored at or after this Unix time (see `parse_since`).
+            until (float, optional): Only pairs stored before this Unix time.
+            run_id (int, optional): Only this run's pairs.
+            group_by (str, optional): `key`, `run` or `day` for one row per group; None for a single row.
+            aggregates (list): Which of `count`, `mean`, `min`, `max` and `sum` to compute.
+
+        Returns:
+            list: One dict per group with the requested aggregates and `non_finite`, plus `group` when grouping.
+        """
+        unknown = [name for name in aggregates if name not in AGGREGATES]
+        if unknown:
+            raise ValueError(f"Unknown aggregates: {', '.join(unknown)}. Available: {', '.join(AGGREGATES)}")
+        if group_by is not None and group_by not in GROUP_BY:
+            raise ValueError(f"Unknown grouping '{group_by}'. Available: {', '.join(GROUP_BY)}")
+        if metric not in self._metric_ids:
+            return []
+
+        conditions, parameters = ["v.metric_id = ?"], [self._metric_ids[metric]]
+        if key_pattern:
+            # GLOB takes the shell-style pattern as is, and uses the key index for patterns with a literal prefix
+            conditions.append("p.key GLOB ?")
+            parameters.append(key_pattern)
+        if since is not None:
+            conditions.append("p.created_at >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("p.created_at < ?")
+            parameters.append(until)
+        if run_id is not None:
+            conditions.append("p.run_id = ?")
+            parameters.append(run_id)
+
+        columns = [AGGREGATES[name] for name in aggregates] + [_NON_FINITE]
+        group = GROUP_BY[group_by] if group_by else None
+        query = (f"SELECT {', '.join(([group] if group else []) + columns)} FROM metric_values v "
+                 f"JOIN pairs p ON p.id = v.pair_id WHERE {' AND '.join(conditions)}")
+        if group:
+            query += f" GROUP BY {group} ORDER BY {group}"
+        names = (['group'] if group else []) + list(aggregates) + ['non_finite']
+        rows = [dict(zip(names, row)) for row in self._connection.execute(query, parameters).fetchall()]
+        # An aggregate over no rows still returns one row of NULLs
+        return [row for row in rows if row.get('count', 1) or row['non_finite']]
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RunWriter:
+    """
+    Buffers one run's records and inserts them into a ResultsStore `batch_size` at a time, each
+    batch in one transaction. Has the `write` / `close` interface of the results file writers.
+
+    Args:
+        store (ResultsStore): Store receiving the records.
+        run_id (int): Run the records belong to, from `ResultsStore.start_run`.
+        batch_size (int): Records per transaction.
+        created_at (float, optional): Time stored for every pair, e.g. an imported run's start; defaults to when each batch is inserted.
+    """
+
+    def __init__(self, store: ResultsStore, run_id: int, batch_size: int = 1000, created_at: Optional[float] = None):
+        self.store = store
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.created_at = created_at
+        self._rows = []
+
+    def write(self, record: dict, reference_path: Optional[str] = None, generated_path: Optional[str] = None):
+        """
+        Queue a record; with the image paths, their content hash, byte size and dimensions are stored too.
+        The hashes evaluation recorded as `reference_hash` / `generated_hash` are reused rather than
+        read and hashed again.
+        """
+        self._rows.append((record, file_fingerprint(reference_path, record.get('reference_hash')) if reference_path else None,
+                           file_fingerprint(generated_path, record.get('generated_hash')) if generated_path else None))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self.store.insert(self.run_id, self._rows, created_at=self.created_at)
+            self._rows = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,52 @@
+import time
+
+from termcolor import colored
+
+
+class ConsoleView:
+    """
+    Optional human-readable view of a running evaluation.
+
+    Prints a one-line progress update at most every `interval` seconds instead of a full
+    report per pair, so console output stays constant-size per update however long the
+    run. With `verbose`, every pair's metrics are printed as well.
+
+    Args:
+        total (int): Number of pairs the run will evaluate.
+        interval (float): Minimum seconds between progress lines. 0 prints after every pair.
+        verbose (bool): Also print each pair's metric values.
+        labels (dict, optional): Console labels per output name; `{base}` and `{improved}`
+            are filled with the pair's file names.
+    """
+
+    def __init__(self, total: int, interval: float = 5.0, verbose: bool = False, labels=None):
+        self.total = total
+        self.interval = interval
+        self.verbose = verbose
+        self.labels = labels or {}
+        self.done = 0
+        self.started_at = time.monotonic()
+        self._printed_at = None
+
+    def pair(self, base: str, improved: str, results: dict, score=None, summary=None, mean_score=None):
+        self.done += 1
+        if self.verbose:
+            print(f"Comparing {base} and {improved}:")
+            for output, value in results.items():
+                label = self.labels.get(output, output).format(base=base, improved=improved)
+                print(f"  {label}: {value}")
+            if score is not None:
+                print(colored(f"{summary} (Score: {score:.16f})", 'red'))
+            print()
+        now = time.monotonic()
+        if self._printed_at is None or now - self._printed_at >= self.interval or self.done == self.total:
+            self._printed_at = now
+            self.progress(mean_score)
+
+    def progress(self, mean_score=None):
+        elapsed = time.monotonic() - self.started_at
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = f"[{self.done}/{self.total}] {rate:.2f} pairs/s, {elapsed:.0f}s elapsed"
+        if mean_score is not None:
+            line += f", mean score {mean_score:.4f}"
+        print(colored(line, 'blue'))
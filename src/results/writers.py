@@ -0,0 +1,176 @@
+import json
+import math
+import os
+from typing import Dict, List
+
+import numpy as np
+from termcolor import colored
+
+
+def _plain(value):
+    # NumPy scalars from the metric functions are not JSON serializable
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        # Keep the file strict JSON; inf (identical images' PSNR) and NaN become strings
+        return str(value)
+    return value
+
+
+class JsonlResultsWriter:
+    """
+    Appends one JSON object per line and flushes after every record, so the results of
+    finished pairs are on disk even if the run is interrupted.
+
+    Each record goes out as a single newline-terminated write, then is fsynced. A crash can
+    therefore only leave a torn last line, which `read_results` drops and truncates away
+    before a resumed run appends to the file.
+
+    Args:
+        path (str): Output file. Parent directories are created.
+        append (bool): Append to an existing file instead of truncating it.
+        fsync (bool): Force every record to disk, not just to the OS page cache.
+    """
+
+    def __init__(self, path: str, append: bool = False, fsync: bool = True):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, "a" if append else "w")
+
+    def write(self, record: dict):
+        self._file.write(json.dumps({name: _plain(value) for name, value in record.items()}) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ParquetResultsWriter:
+    """
+    Writes records to a Parquet file through pyarrow, one row group per `rows_per_group` records.
+
+    Parquet cannot be appended to line by line, so records are buffered and written in row
+    groups; records still buffered when the process dies are lost. The schema is inferred
+    from the first row group. Requires the optional `pyarrow` dependency.
+    """
+
+    def __init__(self, path: str, rows_per_group: int = 1024):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Writing Parquet results needs pyarrow: pip install pyarrow") from None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.rows_per_group = rows_per_group
+        self._rows = []
+        self._writer = None
+
+    def write(self, record: dict):
+        self._rows.append({name: value.item() if isinstance(value, np.generic) else value for name, value in record.items()})
+        if len(self._rows) >= self.rows_per_group:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if not self._rows:
+            return
+        if self._writer is None:
+            table = pa.Table.from_pylist(self._rows)
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pylist(self._rows, schema=self._writer.schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_results_writer(path: str, append: bool = False):
+    """Open a results writer for `path`: Parquet for `.parquet` files, JSON Lines otherwise."""
+    if path.endswith(".parquet"):
+        if append:
+            raise ValueError("Parquet results cannot be appended to; use a .jsonl results file.")
+        return ParquetResultsWriter(path)
+    return JsonlResultsWriter(path, append=append)
+
+
+def read_results(path: str, repair: bool = True) -> List[dict]:
+    """
+    Read the records of a JSONL results file.
+
+    A last line without its newline is the remains of a write cut short by a crash: it is
+    skipped, and with `repair` truncated from the file so appending can resume cleanly.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as file:
+        content = file.read()
+    complete = content[:content.rfind(b"\n") + 1]
+    if repair and len(complete) != len(content):
+        print(colored(f"Dropping a partially written record at the end of {path}", 'yellow'))
+        with open(path, "r+b") as file:
+            file.truncate(len(complete))
+            os.fsync(file.fileno())
+    return [json.loads(line) for line in complete.decode().splitlines() if line.strip()]
+
+
+def read_columns(path: str) -> Dict[str, np.ndarray]:
+    """
+    The numeric fields of a results file (JSONL or Parquet) as one float64 array per field,
+    NaN where a record has no number. Non-finite values stored as strings are read back as floats.
+    Failure records, which have an `error` instead of values, are left out.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        records = pq.read_table(path).to_pylist()
+    else:
+        records = read_results(path, repair=False)
+    records = [record for record in records if not record.get('error')]
+    names = {name for record in records for name, value in record.items()
+             if not isinstance(value, bool) and isinstance(value, (int, float)) or value in ('inf', '-inf', 'nan')}
+    columns = {name: np.full(len(records), np.nan) for name in sorted(names)}
+    for row, record in enumerate(records):
+        for name, column in columns.items():
+            value = record.get(name)
+            if isinstance(value, str) and value in ('inf', '-inf', 'nan'):
+                value = float(value)
+            if not isinstance(value, bool) and isinstance(value, (int, float)):
+                column[row] = value
+    return columns
+
+
+def write_json_atomic(path: str, data: dict):
+    """Write `data` as JSON so that readers see either the old or the new file, never a partial one."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(data, file, indent=2, default=_plain)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def write_summary(path: str, summary: dict):
+    """Write the end-of-run summary as JSON, replacing the file atomically."""
+    write_json_atomic(path, summary)
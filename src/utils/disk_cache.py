@@ -0,0 +1,164 @@
+import atexit
+import json
+import os
+import sqlite3
+import time
+import weakref
+import zlib
+from typing import Optional
+
+# Caches of this process that are still open, flushed by one exit hook for all of them
+_open_caches = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_caches():
+    # Pool workers and CLI runs exit without closing their caches
+    for cache in list(_open_caches):
+        cache.flush()
+
+
+class DiskCache:
+    """
+    A small persistent key/value cache backed by a single SQLite file.
+
+    Values are stored as JSON. The cache is bounded by the total size of the stored
+    values: once it grows past `max_size_bytes`, the least recently used entries are
+    evicted. Entries older than `ttl_seconds` are treated as misses and dropped. Safe to
+    share between processes; each process opens its own connection.
+
+    Hits do not write: an entry's access time is only refreshed once it is older than
+    `touch_interval_seconds`, and refreshes are queued and written in one transaction by
+    `flush`, which runs every `TOUCH_BATCH_SIZE` refreshes, before eviction and on `close`.
+
+    Args:
+        path (str): Location of the SQLite file. Parent directories are created.
+        max_size_bytes (int, optional): Size budget for stored values. None means unbounded.
+        ttl_seconds (float, optional): Lifetime of an entry from when it was written. None never expires.
+        compress (bool): zlib-compress values, worthwhile for large text such as LLM responses.
+        touch_interval_seconds (float): Granularity of the access times that eviction orders by.
+    """
+
+    # Queued access-time refreshes that trigger a flush
+    TOUCH_BATCH_SIZE = 256
+
+    def __init__(self, path: str, max_size_bytes: Optional[int] = 512 * 1024 * 1024, ttl_seconds: Optional[float] = None, compress: bool = False,
+                 touch_interval_seconds: float = 60.0):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.ttl_seconds = ttl_seconds
+        self.compress = compress
+        self.touch_interval_seconds = touch_interval_seconds
+        # key -> access time not yet written
+        self._touched = {}
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self._connection.commit()
+        self._size = self._total_size()
+        _open_caches.add(self)
+
+    def _total_size(self) -> int:
+        return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _encode(self, value):
+        encoded = json.dumps(value)
+        return zlib.compress(encoded.encode()) if self.compress else encoded
+
+    @staticmethod
+    def _decode(stored):
+        # Compressed entries are stored as bytes, plain ones as text
+        if isinstance(stored, bytes):
+            stored = zlib.decompress(stored).decode()
+        return json.loads(stored)
+
+    def get(self, key: str, default=None):
+        row = self._connection.execute("SELECT value, created_at, accessed_at FROM entries WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+            self.delete(key)
+            row = None
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if now - row[2] > self.touch_interval_seconds:
+            self._touched[key] = now
+            if len(self._touched) >= self.TOUCH_BATCH_SIZE:
+                self.flush()
+        return self._decode(row[0])
+
+    def flush(self):
+        """Write the queued access-time refreshes in one transaction."""
+        if not self._touched:
+            return
+        touched = [(accessed_at, key) for key, accessed_at in self._touched.items()]
+        self._touched = {}
+        with self._connection:
+            self._connection.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", touched)
+
+    def set(self, key: str, value):
+        encoded = self._encode(value)
+        now = time.time()
+        self._touched.pop(key, None)
+        with self._connection:
+            # A replaced entry's size no longer counts towards the budget
+            replaced = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), now, now),
+            )
+        self._size += len(encoded) - (replaced[0] if replaced else 0)
+        if self.max_size_bytes is not None and self._size > self.max_size_bytes:
+            self.evict()
+
+    def delete(self, key: str):
+        with self._connection:
+            deleted = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if deleted:
+            self._size -= deleted[0]
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until the cache is back under 90% of its budget."""
+        self.flush()
+        if self.ttl_seconds is not None:
+            with self._connection:
+                self._connection.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._size = self._total_size()
+        target = int(self.max_size_bytes * 0.9)
+        while self._size > target:
+            rows = self._connection.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                self._size -= size
+                if self._size <= target:
+                    break
+            with self._connection:
+                self._connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def stats(self) -> dict:
+        entries = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'size_bytes': self._total_size()}
+
+    def close(self):
+        self.flush()
+        _open_caches.discard(self)
+        self._connection.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Stand-in for an ffmpeg binary built with libvmaf, for exercising the VMAF code paths on
+machines without a libvmaf build. Point `FFMPEG_PATH` at this file.
+
+It understands the two invocations the framework makes: single-image inputs (the score is
+printed as a "VMAF score" line on stderr) and `-f concat` lists with a
+`libvmaf=log_fmt=json:log_path=...` filter (per-frame scores are written to the JSON log).
+Scores are deterministic: 100 for identical frames, lower as the mean absolute grayscale
+difference grows.
+"""
+import json
+import re
+import sys
+
+import numpy as np
+from PIL import Image
+
+
+def _read_concat(path):
+    files = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("file "):
+                files.append(line[5:].strip().strip("'").replace("'\\''", "'"))
+    return files
+
+
+def _score(reference, distorted):
+    reference = np.asarray(Image.open(reference).convert("L"), dtype=np.float32)
+    distorted = np.asarray(Image.open(distorted).convert("L"), dtype=np.float32)
+    if reference.shape != distorted.shape:
+        return 0.0
+    return max(0.0, 100.0 - float(np.abs(reference - distorted).mean()))
+
+
+def main(argv):
+    inputs = []
+    concat = False
+    filter_graph = ""
+    index = 0
+    while index < len(argv):
+        argument = argv[index]
+        if argument == "-f" and index + 1 < len(argv) and argv[index + 1] == "concat":
+            concat = True
+        elif argument == "-i":
+            inputs.append(argv[index + 1])
+            index += 1
+        elif argument in ("-filter_complex", "-lavfi"):
+            filter_graph = argv[index + 1]
+            index += 1
+        index += 1
+
+    if len(inputs) != 2 or "libvmaf" not in filter_graph:
+        print("fake_ffmpeg: expected two inputs and a libvmaf filter", file=sys.stderr)
+        return 1
+
+    if concat:
+        references, distorted = _read_concat(inputs[0]), _read_concat(inputs[1])
+    else:
+        references, distorted = [inputs[0]], [inputs[1]]
+    scores = [_score(r, d) for r, d in zip(references, distorted)]
+
+    log_path = re.search(r"log_path='?([^':]+)'?", filter_graph)
+    if log_path:
+        frames = [{"frameNum": i, "metrics": {"vmaf": score}} for i, score in enumerate(scores)]
+        with open(log_path.group(1), 'w') as file:
+            json.dump({"frames": frames, "pooled_metrics": {"vmaf": {"mean": float(np.mean(scores))}}}, file)
+    print(f"[libvmaf @ 0x0] VMAF score: {float(np.mean(scores)):.6f}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,6 +1,7 @@
 import argparse
+import asyncio
 import os
-from typing import Optional
+from typing import List, Optional
 from src.utils.constants import STATIC_CODE, SYSTEM_MESSAGE_MASTER, USER_MESSAGE_ONE, ASSISTANT_MESSAGE_ONE, USER_MESSAGE_TWO, AI_FILE_IMPORTS, DEFAULT_PLACEHOLDER_PROMPT, SYSTEM_MESSAGE_GPT_3_5, USER_FEEDBACK_SMALL
 from termcolor import colored
 from dotenv import load_dotenv
@@ -9,15 +10,28 @@ from src.completions.completion_generator import ChatCompletionGenerator
 loaded_dot_env = load_dotenv()
 
 def update_message_with_new_prompt(input_prompt, replacement: Optional[str] = None) -> str:
-    file_path = os.path.join(os.getcwd(), "src/resources/prompt_keys/v1_bengal_cat_base.txt")
-    
-    with open(file_path, "r") as file:
-        new_prompt = file.read().strip()
-    if replacement != None:
-        new_prompt = replacement
+    # The bundled prompt file is only the fallback; a given prompt is sent as-is
+    if replacement is not None:
+        new_prompt = replacement.strip()
+    else:
+        file_path = os.path.join(os.getcwd(), "src/resources/prompt_keys/v1_bengal_cat_base.txt")
+        with open(file_path, "r") as file:
+            new_prompt = file.read().strip()
     updated_message = input_prompt.format(new_prompt)
     return updated_message
 
+def _analysis_messages(prompt: str) -> list:
+    user_message_updated = update_message_with_new_prompt(USER_MESSAGE_TWO, prompt)
+    return [{"role": "system", "content": SYSTEM_MESSAGE_MASTER},
+            {"role": "user", "content": USER_MESSAGE_ONE},
+            {"role": "assistant", "content": ASSISTANT_MESSAGE_ONE},
+            {"role": "user", "content": user_message_updated}]
+
+def _code_extraction_messages(resultant_feedback: str) -> list:
+    user_content_code_small = USER_FEEDBACK_SMALL + "\"\"\"" + resultant_feedback + "\"\"\""
+    return [{"role": "system", "content": SYSTEM_MESSAGE_GPT_3_5},
+            {"role": "user", "content": user_content_code_small}]
+
 def analyze_prompt(prompt: Optional[str], model: Optional[str] = "gpt-3.5-turbo-16k") -> str:
     print("Enter analyze prompt")
     print (f"analyze_prompt is using model {model}")
@@ -31,27 +45,43 @@ def analyze_prompt(prompt: Optional[str], model: Optional[str] = "gpt-3.5-turbo-
         resultant_code = STATIC_CODE
 
         # Design prompts and querying to ChatCompletionGenerators
-        user_message_updated = update_message_with_new_prompt(USER_MESSAGE_TWO)
-        list_msgs_gen_code_large = [{"role": "system", "content": SYSTEM_MESSAGE_MASTER}, 
-                                          {"role": "user", "content": USER_MESSAGE_ONE}, 
-                                          {"role": "assistant", "content": ASSISTANT_MESSAGE_ONE}, 
-                                          {"role": "user", "content": user_message_updated}]
+        list_msgs_gen_code_large = _analysis_messages(prompt)
         
         # Generate first big completion (ETA is 1-2 minutes if using gpt-4)
         resultant_feedback = completion_generator.generate_completion(messages=list_msgs_gen_code_large, model="gpt-3.5-turbo-16k-0613", temperature=0.1)
 
         # Design gpt-3.5-turbo-16k-0613 cheaper prompt to extract code
-        user_content_code_small = USER_FEEDBACK_SMALL + "\"\"\"" + resultant_feedback + "\"\"\""
-        list_msgs_extract_code_small = [{"role": "system", "content": SYSTEM_MESSAGE_GPT_3_5}, 
-                                  {"role": "user", "content": user_content_code_small}]
+        list_msgs_extract_code_small = _code_extraction_messages(resultant_feedback)
         
         # Final, pure, AI-updated resultant code generated
         resultant_code = completion_generator_small.generate_completion(messages=list_msgs_extract_code_small, model="gpt-3.5-turbo-16k-0613", temperature=0.1)
         
         res = (f"prompt used for analysis: " + prompt)
         print(colored(res, 'green'))
-        print(colored("Evaluation function has been updated, located in `ai_adjusted_eval_metric.py`", 'green'))
+        print(colored("Evaluation function has been updated", 'green'))
     else:
         print(colored("No base prompt for metric enhancement."), 'red')
         return ""
-    return resultant_code
\ No newline at end of file
+    return resultant_code
+
+async def analyze_prompt_async(prompt: str, generator, model: Optional[str] = "gpt-3.5-turbo-16k-0613") -> str:
+    """
+    Non-blocking analyze_prompt on a shared AsyncChatCompletionGenerator, so many prompts can be analyzed at once.
+    """
+    if prompt == DEFAULT_PLACEHOLDER_PROMPT:
+        return ""
+    resultant_feedback = await generator.generate_completion(_analysis_messages(prompt), model=model, temperature=0.1)
+    return await generator.generate_completion(_code_extraction_messages(resultant_feedback), model=model, temperature=0.1)
+
+def analyze_prompts(prompts: List[str], model: Optional[str] = "gpt-3.5-turbo-16k-0613", max_concurrency: int = 8) -> List[str]:
+    """
+    Analyze many prompts concurrently and return the generated evaluation code for each, in input order.
+    Duplicate prompts are only sent to the API once.
+    """
+    from src.completions.async_completion_generator import AsyncChatCompletionGenerator
+
+    async def run():
+        async with AsyncChatCompletionGenerator(max_concurrency=max_concurrency) as generator:
+            return await asyncio.gather(*(analyze_prompt_async(prompt, generator, model=model) for prompt in prompts))
+
+    return asyncio.run(run())
@@ -0,0 +1,137 @@
+"""
+Per-stage timing and memory instrumentation.
+
+Stages (each metric, image decoding, ffmpeg runs, LLM calls) are timed with `stage(name)`.
+Every stage accumulates call count, wall time, CPU time, the growth of the process's peak
+RSS while it ran and, when memory tracing is enabled, the tracemalloc peak above the
+allocation level it started at. Stats are per process; pool workers send theirs back to
+the parent, which folds them in with `merge_stats`.
+
+Stages nest: an image is decoded lazily inside the first metric that reads it, so that
+metric's time includes the decode. Concurrent async stages (LLM requests) overlap, so
+only their wall time is meaningful per call.
+"""
+import cProfile
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+_RSS_UNIT_KB = 1 / 1024 if sys.platform == 'darwin' else 1
+
+# Accumulated stats of this process, keyed by stage name
+_stats: Dict[str, dict] = {}
+
+
+def _max_rss_kb() -> float:
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT_KB
+
+
+def _empty() -> dict:
+    return {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'max_wall_s': 0.0, 'rss_growth_kb': 0.0, 'tracemalloc_peak_kb': 0.0}
+
+
+def enable_memory_tracing():
+    """Start tracemalloc so stages also record their allocation peaks. Slows allocation-heavy code noticeably."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block and add it to the stats of stage `name`."""
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        start_traced = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start_rss = _max_rss_kb()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start_wall
+        stats = _stats.setdefault(name, _empty())
+        stats['calls'] += 1
+        stats['wall_s'] += wall
+        stats['cpu_s'] += time.process_time() - start_cpu
+        stats['max_wall_s'] = max(stats['max_wall_s'], wall)
+        stats['rss_growth_kb'] += max(0.0, _max_rss_kb() - start_rss)
+        if tracing:
+            # Nested stages reset the peak too, so an outer stage's peak is a lower bound
+            peak = (tracemalloc.get_traced_memory()[1] - start_traced) / 1024
+            stats['tracemalloc_peak_kb'] = max(stats['tracemalloc_peak_kb'], peak)
+
+
+def get_stats() -> Dict[str, dict]:
+    """Snapshot of the accumulated stats of this process, keyed by stage name."""
+    return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def reset_stats():
+    _stats.clear()
+
+
+def merge_stats(snapshot: Dict[str, dict]):
+    """Fold in a `get_stats()` snapshot from another process."""
+    for name, other in snapshot.items():
+        stats = _stats.setdefault(name, _empty())
+        for field in ('calls', 'wall_s', 'cpu_s', 'rss_growth_kb'):
+            stats[field] += other[field]
+        for field in ('max_wall_s', 'tracemalloc_peak_kb'):
+            stats[field] = max(stats[field], other[field])
+
+
+def format_stats_table(stats: Optional[Dict[str, dict]] = None) -> str:
+    """Stages as a text table, most expensive first by total wall time."""
+    stats = get_stats() if stats is None else stats
+    total_wall = sum(entry['wall_s'] for entry in stats.values()) or 1.0
+    lines = [f"{'stage':28} {'calls':>7} {'wall s':>9} {'share':>6} {'cpu s':>9} {'mean ms':>9} {'max ms':>9} {'rss+ MB':>8} {'alloc MB':>8}"]
+    for name, entry in sorted(stats.items(), key=lambda item: item[1]['wall_s'], reverse=True):
+        mean_ms = 1000 * entry['wall_s'] / entry['calls'] if entry['calls'] else 0.0
+        lines.append(f"{name:28} {entry['calls']:7d} {entry['wall_s']:9.3f} {entry['wall_s'] / total_wall:6.1%} {entry['cpu_s']:9.3f} "
+                     f"{mean_ms:9.2f} {1000 * entry['max_wall_s']:9.2f} {entry['rss_growth_kb'] / 1024:8.1f} {entry['tracemalloc_peak_kb'] / 1024:8.1f}")
+    return "\n".join(lines)
+
+
+def dump_stats(path: str, stats: Optional[Dict[str, dict]] = None):
+    """Write the stats as JSON."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(get_stats() if stats is None else stats, file, indent=2)
+
+
+def is_sampled(key: str, rate: float) -> bool:
+    """Deterministically select about `rate` of all keys, the same ones in every process and run."""
+    if rate <= 0:
+        return False
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], 'big') / 2 ** 64 < rate
+
+
+@contextmanager
+def profile_if_sampled(key: str, rate: float, directory: Optional[str]):
+    """Run the block under cProfile when `key` is sampled, saving `<directory>/<key>.prof` for pstats or snakeviz."""
+    if not directory or not is_sampled(key, rate):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        safe_key = "".join(character if character.isalnum() or character in "-_." else "_" for character in key)
+        profiler.dump_stats(os.path.join(directory, f"{safe_key}.prof"))
@@ -1,7 +1,9 @@
 import os
 
 def rename_files(directory, new_filenames):
-    original_filenames = sorted(os.listdir(directory))
+    # Files only, from one streamed listing; sorted so downloads are renamed in the order they were named
+    with os.scandir(directory) as entries:
+        original_filenames = sorted(entry.name for entry in entries if entry.is_file())
 
     new_filenames_iter = iter(new_filenames)
     for filename in original_filenames:
@@ -14,6 +16,10 @@ def rename_files(directory, new_filenames):
 
             old_filepath = os.path.join(directory, filename)
             new_filepath = os.path.join(directory, new_filename)
+            if os.path.exists(new_filepath):
+                # os.rename would silently replace it, losing an image
+                print(f"Skipping {filename}: {new_filename} already exists.")
+                continue
             os.rename(old_filepath, new_filepath)
 
             print(f"Renamed {filename} to {new_filename}")
@@ -0,0 +1,75 @@
+"""Shared fixtures: synthetic base/improved image pairs written to a temporary dataset, and main.py runs over them."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.bench_metrics import FAKE_FFMPEG, REPO_ROOT, synthetic_pair  # noqa: F401
+
+SAMPLE_IMAGES = os.path.join(REPO_ROOT, "src", "resources", "*", "*.png")
+
+
+def write_pairs(directory, count, size=(240, 200), seed=0):
+    """
+    Write `count` synthetic pairs as `<directory>/ref/pair<i>_base.png` and `<directory>/gen/pair<i>_improved.png`.
+    MS-SSIM needs both sides over 160 pixels.
+
+    Returns:
+        dict: (reference path, generated path) keyed by pair key.
+    """
+    reference_directory, generated_directory = os.path.join(directory, "ref"), os.path.join(directory, "gen")
+    os.makedirs(reference_directory, exist_ok=True)
+    os.makedirs(generated_directory, exist_ok=True)
+    pairs = {}
+    for index in range(count):
+        base, improved = synthetic_pair(*size, seed=seed + index)
+        key = f"pair{index}"
+        pairs[key] = (os.path.join(reference_directory, f"{key}_base.png"), os.path.join(generated_directory, f"{key}_improved.png"))
+        base.save(pairs[key][0])
+        improved.save(pairs[key][1])
+    return pairs
+
+
+def seed_ai_evaluation_cache(path):
+    """
+    Store the static evaluation function as the generated code for main.py's pair prompt, so runs
+    score pairs without an API key, as they would after the code had been generated once.
+    """
+    from main import PAIR_PROMPT
+    from src.evaluation_metrics.ai_evaluation import AI_EVALUATION_MODEL, _cache_key
+    from src.utils.constants import STATIC_CODE
+    from src.utils.disk_cache import DiskCache
+    cache = DiskCache(path, max_size_bytes=None)
+    cache.set(_cache_key(PAIR_PROMPT, AI_EVALUATION_MODEL), STATIC_CODE)
+    cache.close()
+
+
+def main_command(directory, results, *arguments):
+    """main.py over the `write_pairs` dataset in `directory`, with the fake ffmpeg and no feature cache or bootstrap."""
+    return [sys.executable, os.path.join(REPO_ROOT, "main.py"), "--reference-directory", os.path.join(directory, "ref"),
+            "--generated-directory", os.path.join(directory, "gen"), "--ffmpeg-path", FAKE_FFMPEG, "--results", results,
+            "--no-cache", "--bootstrap-resamples", "0", *arguments]
+
+
+def main_environment(directory):
+    """Environment for main.py subprocesses: a seeded AI evaluation cache in `directory` and no AI-enhanced scoring."""
+    path = os.path.join(directory, "ai_evaluation.sqlite")
+    if not os.path.exists(path):
+        seed_ai_evaluation_cache(path)
+    return {**os.environ, 'AI_EVALUATION_CACHE_PATH': path, 'AI_ENHANCED_EVALUATION': '', 'PYTHONPATH': REPO_ROOT}
+
+
+def run_main(directory, results, *arguments, check=True):
+    """Run main.py (see `main_command`) in `directory` and return the completed process."""
+    process = subprocess.run(main_command(directory, results, *arguments), cwd=directory, env=main_environment(directory),
+                             stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=300)
+    if check and process.returncode:
+        raise AssertionError(f"main.py failed:\n{process.stdout}\n{process.stderr}")
+    return process
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Four synthetic pairs under `tmp_path`; see `write_pairs`."""
+    return write_pairs(str(tmp_path), 4)
@@ -0,0 +1,63 @@
+"""A local aiohttp server speaking enough of the chat completions API to test the async generator against."""
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+
+class MockChatServer:
+    """
+    Serves `POST /chat/completions` on a free localhost port, answering with the last message's
+    content reversed. Use it as an async context manager and point `api_base` at `url`.
+
+    Args:
+        delay (float): Seconds each request takes before it is answered.
+        failures (list, optional): `(status, headers)` answers given to the first requests, in order,
+            e.g. `[(429, {'Retry-After': '0.2'})]`, before requests are answered normally.
+
+    Attributes:
+        requests (list): `(arrival time, request body)` of every request received.
+        max_active (int): Most requests in progress at the same time.
+    """
+
+    def __init__(self, delay: float = 0.0, failures=None):
+        self.delay = delay
+        self.failures = list(failures or [])
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.url = None
+        self._runner = None
+
+    async def _completions(self, request):
+        body = await request.json()
+        self.requests.append((time.monotonic(), body))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                status, headers = self.failures.pop(0)
+                error = {'error': {'message': f"mock failure {status}", 'type': 'mock', 'param': None, 'code': None}}
+                return web.Response(status=status, headers=headers, text=json.dumps(error), content_type='application/json')
+            content = body['messages'][-1]['content'][::-1]
+            return web.json_response({'id': f"mock-{len(self.requests)}", 'object': 'chat.completion', 'model': body['model'],
+                                      'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                                      'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}})
+        finally:
+            self.active -= 1
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post('/chat/completions', self._completions)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
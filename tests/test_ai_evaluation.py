@@ -0,0 +1,101 @@
+"""AI-adjusted evaluation functions: the prompt sent matches the cache key, generation happens once, and output stays out of the cwd."""
+import os
+
+import pytest
+
+from main import PAIR_PROMPT
+from src.evaluation_metrics import ai_evaluation
+from src.evaluation_metrics.ai_evaluation import AI_EVALUATION_MODEL, _cache_key, generated_module_path, get_ai_evaluation_function
+from src.utils import helpers
+from src.utils.constants import STATIC_CODE, USER_MESSAGE_TWO
+from src.utils.disk_cache import DiskCache
+from tests.conftest import REPO_ROOT
+
+METRICS = {'mse': 50.0, 'ssim': 0.9, 'psnr': 35.0, 'brisque_diff': -3.0, 'hist_corr': 0.95, 'entropy_diff': 0.1, 'edge_mse': 400.0,
+           'fft_mse': 1e6, 'ms_ssim': 0.98, 'gsim': 0.0, 'vmaf': 90.0}
+
+
+@pytest.fixture
+def completions(monkeypatch, tmp_path):
+    """
+    Chat completions answered locally: every request's messages are recorded, the analysis gets
+    a canned review and the code extraction `code` (the fenced STATIC_CODE by default).
+    Compiled functions are forgotten, and the working directory is an empty temporary one.
+    """
+    requests = []
+    answers = {'code': STATIC_CODE}
+
+    class Generator:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_completion(self, messages, temperature=0.1, model=None):
+            requests.append(messages)
+            return "Looks fine." if len(messages) == 4 else answers['code']
+
+    monkeypatch.setattr(helpers, 'ChatCompletionGenerator', Generator)
+    monkeypatch.setattr(ai_evaluation, '_compiled_functions', {})
+    monkeypatch.setattr(ai_evaluation, '_disk_caches', {})
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    return requests, answers
+
+
+def analysis_prompts(requests):
+    """The user message of each analysis request, the one carrying the prompt."""
+    return [messages[-1]['content'] for messages in requests if len(messages) == 4]
+
+
+def test_sent_prompt_matches_the_cache_key(tmp_path, completions):
+    requests, _ = completions
+    cache_path = str(tmp_path / "cache" / "ai_evaluation.sqlite")
+    prompts = ["A watercolor fox in the snow", "A neon city street at night"]
+    for prompt in prompts + prompts:
+        get_ai_evaluation_function(prompt, cache_path=cache_path)
+    # One generation per prompt, each sending that prompt
+    assert analysis_prompts(requests) == [USER_MESSAGE_TWO.format(prompt) for prompt in prompts]
+    cache = DiskCache(cache_path, max_size_bytes=None)
+    assert all(cache.get(_cache_key(prompt, AI_EVALUATION_MODEL)) for prompt in prompts)
+    cache.close()
+
+    # A new process reads the code back from the disk cache, still without a request
+    ai_evaluation._compiled_functions.clear()
+    assert get_ai_evaluation_function(prompts[0], cache_path=cache_path)(METRICS) is not None
+    assert len(analysis_prompts(requests)) == 2
+
+
+def test_main_prompt_sends_the_bundled_prompt_file(completions, monkeypatch):
+    # Runs used to send the bundled prompt file's text whatever their prompt; main.py's prompt is that text
+    monkeypatch.chdir(REPO_ROOT)
+    assert helpers.update_message_with_new_prompt(USER_MESSAGE_TWO, PAIR_PROMPT) == helpers.update_message_with_new_prompt(USER_MESSAGE_TWO)
+
+
+def test_a_given_prompt_does_not_need_the_prompt_file(completions):
+    # The working directory has no src/resources, as when the package is used from another project
+    assert helpers.update_message_with_new_prompt("{}", " A fox ") == "A fox"
+    with pytest.raises(FileNotFoundError):
+        helpers.update_message_with_new_prompt("{}")
+
+
+def test_generated_code_is_written_next_to_the_cache(tmp_path, completions):
+    cache_path = str(tmp_path / "cache" / "ai_evaluation.sqlite")
+    function = get_ai_evaluation_function("A watercolor fox in the snow", cache_path=cache_path)
+    assert os.listdir(os.getcwd()) == []
+    path = generated_module_path("A watercolor fox in the snow", AI_EVALUATION_MODEL, cache_path)
+    assert os.path.dirname(path) == str(tmp_path / "cache")
+    with open(path) as file:
+        code = file.read()
+    assert "def evaluate_image_improvement" in code and "```" not in code
+    assert path != generated_module_path("A neon city street at night", AI_EVALUATION_MODEL, cache_path)
+    assert function(METRICS) is not None
+
+
+def test_unusable_code_falls_back_and_is_not_cached(tmp_path, completions):
+    requests, answers = completions
+    answers['code'] = "this is not python"
+    cache_path = str(tmp_path / "cache" / "ai_evaluation.sqlite")
+    assert get_ai_evaluation_function("A fox", cache_path=cache_path)(METRICS) is not None
+    ai_evaluation._compiled_functions.clear()
+    get_ai_evaluation_function("A fox", cache_path=cache_path)
+    assert len(analysis_prompts(requests)) == 2
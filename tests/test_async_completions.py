@@ -0,0 +1,126 @@
+"""AsyncChatCompletionGenerator against a local mock server: concurrency, retries, rate limits and coalescing."""
+import asyncio
+import time
+
+import openai
+import pytest
+
+from src.completions.async_completion_generator import AsyncChatCompletionGenerator, TokenBucket
+from tests.mock_openai import MockChatServer
+
+
+def messages(text):
+    return [{'role': 'user', 'content': text}]
+
+
+def run(scenario, server=None, **options):
+    """Run `scenario(generator, server)` against a fresh mock server and uncached generator."""
+    options = {'openai_api_key': 'test-key', 'model': 'mock-model', 'use_cache': False, 'base_delay': 0.01, **options}
+
+    async def main():
+        async with server or MockChatServer() as mock:
+            async with AsyncChatCompletionGenerator(api_base=mock.url, **options) as generator:
+                return await scenario(generator, mock)
+    return asyncio.run(main())
+
+
+def test_concurrency_is_limited_and_order_kept():
+    async def scenario(generator, server):
+        return await generator.generate_completions([messages(f"prompt {i}") for i in range(10)], model='mock-model'), server
+
+    results, server = run(scenario, MockChatServer(delay=0.05), max_concurrency=3)
+    assert results == [f"prompt {i}"[::-1] for i in range(10)]
+    assert server.max_active == 3
+    assert len(server.requests) == 10
+
+
+def test_rate_limited_requests_retry_after_the_servers_delay():
+    async def scenario(generator, server):
+        start = time.monotonic()
+        result = await generator.generate_completion(messages("hello"), model='mock-model')
+        return result, time.monotonic() - start, generator.api_calls
+
+    failures = [(429, {'Retry-After': '0.2'}), (429, {'Retry-After': '0.2'})]
+    result, elapsed, api_calls = run(scenario, MockChatServer(failures=failures))
+    assert result == "olleh"
+    assert api_calls == 3
+    assert elapsed >= 0.4
+
+
+def test_retry_after_is_clamped_to_max_delay():
+    async def scenario(generator, server):
+        start = time.monotonic()
+        await generator.generate_completion(messages("hello"), model='mock-model')
+        return time.monotonic() - start
+
+    elapsed = run(scenario, MockChatServer(failures=[(429, {'Retry-After': '3600'})]), max_delay=0.1)
+    assert elapsed < 2
+
+
+def test_server_errors_back_off_then_give_up():
+    async def scenario(generator, server):
+        with pytest.raises(openai.error.APIError):
+            await generator.generate_completion(messages("hello"), model='mock-model')
+        return len(server.requests)
+
+    assert run(scenario, MockChatServer(failures=[(500, {})] * 5), max_retries=2) == 3
+
+
+def test_backoff_is_bounded_full_jitter():
+    generator = AsyncChatCompletionGenerator(openai_api_key='test-key', use_cache=False, base_delay=0.5, max_delay=4.0)
+    error = openai.error.APIError("boom")
+    for attempt in range(8):
+        bound = min(4.0, 0.5 * 2 ** attempt)
+        delays = [generator._backoff(attempt, error) for _ in range(50)]
+        assert all(0 <= delay <= bound for delay in delays)
+    rate_limited = openai.error.RateLimitError("slow down", headers={'retry-after': '1.5'})
+    assert generator._backoff(0, rate_limited) == 1.5
+    assert generator._backoff(0, openai.error.RateLimitError("slow down", headers={'retry-after': '90'})) == 4.0
+
+
+def test_token_bucket_paces_requests_beyond_its_burst():
+    async def acquire_all(bucket, amounts):
+        start = time.monotonic()
+        for amount in amounts:
+            await bucket.acquire(amount)
+        return time.monotonic() - start
+
+    # 600 per minute is 10 per second: a burst of 2, then 4 more at 0.1 s each
+    assert 0.35 <= asyncio.run(acquire_all(TokenBucket(600, capacity=2), [1] * 6)) < 1.0
+    # Token-sized acquisitions: 30 tokens over a capacity of 10 at 100 per second
+    assert 0.15 <= asyncio.run(acquire_all(TokenBucket(6000, capacity=10), [10, 10, 10])) < 0.8
+    # A request larger than the bucket drains it instead of waiting forever
+    assert asyncio.run(acquire_all(TokenBucket(60, capacity=5), [50])) < 0.1
+
+
+def test_generator_requests_are_paced_by_its_buckets():
+    async def scenario(generator, server):
+        generator._request_bucket = TokenBucket(600, capacity=1)
+        await generator.generate_completions([messages(f"prompt {i}") for i in range(4)], model='mock-model')
+        arrivals = sorted(arrival for arrival, _ in server.requests)
+        return [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+
+    gaps = run(scenario)
+    assert all(gap >= 0.08 for gap in gaps)
+
+
+def test_identical_requests_in_flight_are_coalesced():
+    async def scenario(generator, server):
+        results = await generator.generate_completions([messages("same")] * 5 + [messages("other")], model='mock-model')
+        return results, len(server.requests), generator.coalesced
+
+    results, requests, coalesced = run(scenario, MockChatServer(delay=0.1))
+    assert results == ["emas"] * 5 + ["rehto"]
+    assert requests == 2
+    assert coalesced == 4
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_request():
+    async def scenario(generator, server):
+        first = asyncio.ensure_future(generator.generate_completion(messages("same"), model='mock-model'))
+        second = asyncio.ensure_future(generator.generate_completion(messages("same"), model='mock-model'))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        return await second, len(server.requests)
+
+    assert run(scenario, MockChatServer(delay=0.1)) == ("emas", 1)
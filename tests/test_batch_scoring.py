@@ -0,0 +1,85 @@
+"""Vectorized batch scoring against the original per-pair scoring formula."""
+import numpy as np
+import pytest
+
+from src.evaluation_metrics import (SCORING_TABLE, SUMMARIES, evaluate_image_improvement, metrics_to_columns, score_batch, summarize_buckets,
+                                    summary_bucket)
+from src.utils.constants import DEFAULT_PLACEHOLDER_PROMPT
+
+
+def original_score(metrics):
+    """evaluate_image_improvement as it was written before the scoring table, term by term."""
+    score = 0
+    score += 3 * (1 / (1 + metrics['mse'] / 20000))
+    score += 3 * (1 / (1 + metrics['edge_mse'] / 20000))
+    score += 3 * (1 / (1 + metrics['fft_mse'] / 1e9))
+    score += 4 * metrics['ssim']
+    score += 3 * (metrics['psnr'] / 50)
+    score += 4 * max(0, -metrics['brisque_diff'] / 100)
+    score += 2 * ((metrics['hist_corr'] + 1) / 2)
+    score += metrics['entropy_diff'] / 10
+    score += 4 * metrics['ms_ssim']
+    score += 4 * metrics['gsim']
+    score += 2.5 * (metrics['vmaf'] / 100)
+    score /= 3 + 3 + 3 + 4 + 3 + 4 + 2 + 2 + 4 + 4 + 5
+    if score > 0.8:
+        summary = SUMMARIES[3]
+    elif score > 0.5:
+        summary = SUMMARIES[2]
+    elif score > 0.2:
+        summary = SUMMARIES[1]
+    else:
+        summary = SUMMARIES[0]
+    return score, summary
+
+
+def random_metrics(count, seed=0):
+    """Metrics of `count` pairs whose quality ranges from poor to near perfect, so every summary bucket is reached."""
+    rng = np.random.default_rng(seed)
+    records = []
+    for quality in rng.uniform(0, 1, count):
+        noise = lambda: rng.uniform(0.9, 1.1)  # noqa: E731
+        records.append({'mse': (1 - quality) * 5000 * noise(), 'edge_mse': (1 - quality) * 20000 * noise(), 'fft_mse': (1 - quality) * 1e10 * noise(),
+                        'ssim': quality * noise(), 'psnr': 5 + 55 * quality * noise(), 'brisque_diff': rng.normal(-100 * quality, 10),
+                        'hist_corr': 2 * quality * noise() - 1, 'entropy_diff': rng.normal(0, 2), 'ms_ssim': quality * noise(),
+                        'gsim': quality * noise(), 'vmaf': 100 * quality * noise()})
+    return records
+
+
+def test_batch_scores_match_the_original_formula():
+    records = random_metrics(2000)
+    scores, buckets = score_batch(metrics_to_columns(records))
+    expected = [original_score(record) for record in records]
+    np.testing.assert_allclose(scores, [score for score, _ in expected], rtol=1e-12)
+    assert [SUMMARIES[bucket] for bucket in buckets] == [summary for _, summary in expected]
+    # Every summary is reached, so the comparison covers all thresholds
+    assert len(set(buckets.tolist())) == len(SUMMARIES)
+
+
+def test_single_pair_scoring_matches_the_batch():
+    for record in random_metrics(50, seed=1):
+        score, summary = evaluate_image_improvement(record, prompt=DEFAULT_PLACEHOLDER_PROMPT)
+        expected_score, expected_summary = original_score(record)
+        assert score == pytest.approx(expected_score, rel=1e-12) and summary == expected_summary
+
+
+def test_column_dicts_score_like_structured_arrays():
+    records = random_metrics(20, seed=2)
+    columns = {name: np.array([record[name] for record in records]) for name in SCORING_TABLE}
+    np.testing.assert_array_equal(score_batch(columns)[0], score_batch(metrics_to_columns(records))[0])
+    with pytest.raises(KeyError, match="vmaf"):
+        score_batch({name: column for name, column in columns.items() if name != 'vmaf'})
+
+
+def test_a_modified_table_rescores_without_the_metrics():
+    records = random_metrics(20, seed=3)
+    columns = metrics_to_columns(records)
+    table = {**SCORING_TABLE, 'vmaf': {'weight': 0, 'normalize': SCORING_TABLE['vmaf']['normalize']}}
+    without_vmaf = [original_score(record)[0] - 2.5 * record['vmaf'] / 100 / 37 for record in records]
+    np.testing.assert_allclose(score_batch(columns, table=table)[0], without_vmaf, rtol=1e-12)
+
+
+def test_buckets_at_thresholds_and_nan():
+    # A score equal to a threshold stays in the lower bucket, as the original `>` checks did
+    assert summary_bucket([0.2, 0.2000001, 0.5, 0.8, 0.81, -1.0, np.nan]).tolist() == [0, 1, 1, 2, 3, 0, 0]
+    assert summarize_buckets([0, 3, 3, 1]) == dict(zip(SUMMARIES, [1, 1, 0, 2]))
@@ -0,0 +1,67 @@
+"""The benchmark suite: it runs end to end on the fake ffmpeg, saves every timing and flags regressions against a baseline."""
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from benchmarks.bench_metrics import REPO_ROOT, compare_to_baseline, synthetic_pair
+
+BENCHMARKS = ['calculate_mse', 'calculate_ssim', 'calculate_psnr', 'calculate_histogram_correlation', 'calculate_edge_mse', 'calculate_fft_mse',
+              'calculate_ms_ssim', 'calculate_gsim', 'calculate_entropy', 'calculate_colorfulness', 'calculate_brisque', 'calculate_vmaf',
+              'compare_images', 'evaluate_image_improvement', 'score_batch']
+
+
+def benchmark(tmp_path, *arguments):
+    # An empty FFMPEG_PATH in the environment must not matter: the suite always uses the stand-in
+    return subprocess.run([sys.executable, os.path.join(REPO_ROOT, "benchmarks", "bench_metrics.py"), "--sizes", "512", "--repeat", "1",
+                           "--score-rows", "100", *arguments], cwd=str(tmp_path), env={**os.environ, 'FFMPEG_PATH': ''},
+                          capture_output=True, text=True, timeout=300)
+
+
+@pytest.fixture(scope="module")
+def results(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("benchmarks")
+    process = benchmark(directory, "--output", str(directory / "results.json"))
+    assert process.returncode == 0, process.stderr
+    with open(directory / "results.json") as file:
+        return json.load(file), process.stdout
+
+
+def test_every_hot_path_is_timed(results):
+    saved, output = results
+    assert saved['repeat'] == 1 and list(saved['sizes']) == ['512']
+    timings = saved['sizes']['512']
+    assert list(timings) == BENCHMARKS
+    for name, timing in timings.items():
+        assert timing['seconds'] > 0 and timing['pairs_per_second'] == pytest.approx(1 / timing['seconds']), name
+        assert name in output
+
+
+def test_regressions_fail_the_run(tmp_path, results):
+    saved, _ = results
+    # A baseline ten times faster than any machine: everything regressed
+    faster = dict(saved, sizes={'512': {name: {'seconds': timing['seconds'] / 10} for name, timing in saved['sizes']['512'].items()}})
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(faster))
+    process = benchmark(tmp_path, "--output", str(tmp_path / "results.json"), "--baseline", str(baseline), "--fail-on-regression")
+    assert process.returncode == 1 and process.stdout.count("REGRESSION") == len(BENCHMARKS)
+
+
+def test_baseline_comparison_applies_the_tolerance():
+    results = {'sizes': {'512': {'a': {'seconds': 1.05}, 'b': {'seconds': 1.5}, 'c': {'seconds': 0.5}, 'new': {'seconds': 1.0}}}}
+    baseline = {'sizes': {'512': {'a': {'seconds': 1.0}, 'b': {'seconds': 1.0}, 'c': {'seconds': 1.0}, 'gone': {'seconds': 1.0}}}}
+    assert compare_to_baseline(results, baseline, 0.10) == [('512', 'b', 1.5)]
+    assert compare_to_baseline(results, baseline, 0.01) == [('512', 'a', pytest.approx(1.05)), ('512', 'b', 1.5)]
+    assert compare_to_baseline(results, {'sizes': {}}, 0.10) == []
+
+
+def test_synthetic_pairs_are_reproducible():
+    first, second = synthetic_pair(256, 192, seed=3), synthetic_pair(256, 192, seed=3)
+    assert all(np.array_equal(np.array(a), np.array(b)) for a, b in zip(first, second))
+    base, improved = first
+    assert base.size == improved.size == (256, 192) and base.mode == improved.mode == "RGB"
+    assert not np.array_equal(np.array(base), np.array(improved))
+    assert not np.array_equal(np.array(base), np.array(synthetic_pair(256, 192, seed=4)[0]))
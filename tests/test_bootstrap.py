@@ -0,0 +1,139 @@
+"""Bootstrap statistics: Poisson weights against a classic bootstrap, sign-flip p-values under the null, and the time budget."""
+import os
+import statistics
+import time
+
+import numpy as np
+import pytest
+
+from src.evaluation_metrics.batch_scoring import SCORING_TABLE
+from src.results.bootstrap import (_poisson_pair_table, _poisson_table, _poisson_weights, bootstrap_means, bootstrap_statistics,
+                                   sign_flip_pvalues)
+
+# Seconds allowed for the statistics of a 30k-pair run with 18 columns at the default 2000 resamples
+BUDGET_SECONDS = float(os.getenv('BOOTSTRAP_BUDGET_SECONDS', 1.0))
+
+
+def classic_bootstrap_means(values, resamples, rng):
+    """Column means over `resamples` draws of N rows with replacement, the textbook bootstrap."""
+    means = np.empty((resamples, values.shape[1]))
+    for index in range(resamples):
+        means[index] = values[rng.integers(0, len(values), len(values))].mean(axis=0)
+    return means
+
+
+def test_poisson_table_approximates_poisson_one():
+    table = _poisson_table().astype(np.float64)
+    assert len(table) == 256
+    assert np.bincount(table.astype(np.int64)).tolist() == [94, 94, 47, 16, 4, 1]
+    # Mean and variance of Poisson(1) are both 1; rounding the probabilities to 1/256 adds 0.4%
+    assert table.mean() == pytest.approx(1.0, abs=0.005)
+    assert table.var() == pytest.approx(1.0, abs=0.005)
+
+
+def test_pair_table_draws_the_weights_of_both_bytes():
+    table = _poisson_table()
+    data = np.random.default_rng(0).bytes(64 * 10)
+    weights = _poisson_weights(np.random.default_rng(0), 64, 10)
+    assert weights.dtype == np.float32 and weights.shape == (64, 10)
+    np.testing.assert_array_equal(weights.ravel(), table[np.frombuffer(data, dtype=np.uint8)])
+    assert len(_poisson_pair_table()) == 1 << 16
+
+
+def test_intervals_match_a_classic_bootstrap():
+    rng = np.random.default_rng(0)
+    # Skewed and differently scaled columns, one with non-finite values
+    values = np.column_stack([rng.lognormal(0, 1, 500), rng.normal(3e8, 1e7, 500), rng.exponential(2, 500)])
+    values[:25, 2] = np.inf
+    poisson = bootstrap_means(values, 20000, np.random.default_rng(1))
+    classic = classic_bootstrap_means(values[:, :2], 20000, np.random.default_rng(2))
+    classic_finite = classic_bootstrap_means(values[25:, 2:], 20000, np.random.default_rng(3))
+    classic = np.column_stack([classic, classic_finite])
+    # Same centre, spread and percentile interval, to a few percent of the standard error
+    standard_error = classic.std(axis=0)
+    np.testing.assert_allclose(poisson.mean(axis=0), classic.mean(axis=0), atol=0.05 * standard_error.max(), rtol=0)
+    np.testing.assert_allclose(poisson.std(axis=0), standard_error, rtol=0.05)
+    for quantile in (0.025, 0.975):
+        np.testing.assert_array_less(np.abs(np.quantile(poisson, quantile, axis=0) - np.quantile(classic, quantile, axis=0)),
+                                     0.1 * standard_error)
+
+
+def test_intervals_cover_the_true_mean():
+    rng = np.random.default_rng(4)
+    datasets = rng.normal(10, 2, (400, 200, 1))
+    covered = 0
+    for values in datasets:
+        low, high = np.quantile(bootstrap_means(values, 500, rng), [0.025, 0.975])
+        covered += low <= 10 <= high
+    # 95% intervals, with a few percent of slack for 400 datasets and the percentile method at N=200
+    assert 0.90 <= covered / len(datasets) <= 0.99
+
+
+def test_sign_flip_pvalues_are_uniform_under_the_null():
+    rng = np.random.default_rng(5)
+    # 500 columns of symmetric zero-mean differences, some heavy-tailed and some with ties at zero
+    differences = np.column_stack([rng.normal(0, 1, (60, 250)), rng.standard_t(2, (60, 200)),
+                                   np.round(rng.normal(0, 1, (60, 50)))])
+    p_values = sign_flip_pvalues(differences, 2000, rng)
+    for alpha in (0.01, 0.05, 0.1):
+        # Binomial standard deviation of the rejection rate over 500 columns is about 0.01 at alpha 0.05
+        assert abs(np.mean(p_values <= alpha) - alpha) <= max(0.03, alpha / 2)
+    assert np.histogram(p_values, bins=5, range=(0, 1))[0].min() >= 70
+
+
+def test_sign_flip_detects_a_shift():
+    rng = np.random.default_rng(6)
+    p_values = sign_flip_pvalues(rng.normal(0.8, 1, (50, 20)), 2000, rng)
+    assert np.all(p_values < 0.01)
+    # Ten positive differences: only 2 of the 1024 sign assignments are as extreme
+    exact = sign_flip_pvalues(np.ones((10, 1)), 20000, rng)[0]
+    assert exact == pytest.approx(2 / 1024, rel=0.2)
+
+
+def test_non_finite_values_are_left_out():
+    rng = np.random.default_rng(7)
+    values = np.column_stack([rng.uniform(0, 100, 60), np.tile([4.0, 8.0, np.inf, np.nan], 15)])
+    resampled = bootstrap_means(values, 4000, rng)
+    assert np.all(np.isfinite(resampled))
+    # Only the 4s and 8s take part, so every resampled mean lies between them
+    assert resampled[:, 1].min() >= 4 and resampled[:, 1].max() <= 8
+    assert np.mean(resampled[:, 1]) == pytest.approx(6, abs=0.05)
+
+
+def scoring_columns(pairs, seed=8):
+    rng = np.random.default_rng(seed)
+    columns = {name: rng.uniform(0.2, 0.8, pairs) for name in SCORING_TABLE}
+    columns['psnr'] = rng.uniform(20, 40, pairs)
+    columns['brisque_diff'] = rng.normal(-5, 3, pairs)
+    return columns
+
+
+def test_statistics_report_the_score_over_scored_pairs():
+    columns = scoring_columns(300)
+    columns['psnr'][:10] = np.inf
+    report = bootstrap_statistics(columns, resamples=1000, seed=0)
+    assert report['pairs'] == 300 and report['score']['pairs'] == 290
+    score = report['score']
+    assert score['ci_low'] <= score['score'] <= score['ci_high']
+    assert 0 < score['verdict_confidence'] <= 1
+    assert report['metrics']['brisque_diff']['p_value'] < 0.01
+    for entry in report['metrics'].values():
+        assert entry['ci_low'] <= entry['mean'] <= entry['ci_high']
+    # Seeded, so reports are reproducible
+    assert bootstrap_statistics(columns, resamples=1000, seed=0) == report
+
+
+def test_statistics_of_a_large_run_fit_the_budget():
+    rng = np.random.default_rng(9)
+    columns = scoring_columns(30000)
+    for name in ('score', 'brisque_image1', 'brisque_image2', 'entropy_image1', 'entropy_image2', 'colorfulness_image1',
+                 'colorfulness_image2', 'entropy_diff'):
+        columns[name] = rng.normal(50, 10, 30000)
+    assert len(columns) == 18
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        bootstrap_statistics(columns)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    assert median <= BUDGET_SECONDS, f"bootstrap statistics took {median:.2f} s, over the {BUDGET_SECONDS:.2f} s budget"
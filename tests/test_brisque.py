@@ -0,0 +1,101 @@
+"""BRISQUE parity: the NumPy implementation against pybrisque's `get_score(path)`, the original scoring path."""
+import glob
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.metrics.brisque_native import brisque_features
+from src.metrics.image_context import ImageContext
+from src.metrics.metric_calculations import calculate_brisque, get_brisque
+from tests.conftest import SAMPLE_IMAGES, synthetic_pair
+
+# Largest accepted absolute score difference and relative feature difference
+TOLERANCE = 1e-6
+
+# pybrisque 1.0's get_score(path) for the bundled samples, so parity is checked even where pybrisque cannot load
+REFERENCE_SCORES = {
+    'v1_bengal_cat_base.png': 86.97147999893696,
+    'v1_black_cat_base.png': 37.0374658355089,
+    'v1_bengal_cat_improved.png': 81.10704875098133,
+    'v1_cat_with_hat_improved.png': 80.51347581608627,
+}
+
+
+@pytest.fixture(scope="module")
+def pybrisque():
+    """pybrisque's BRISQUE scorer; skips the test when pybrisque or libsvm is not installed."""
+    libsvm = pytest.importorskip("libsvm")
+    with pytest.MonkeyPatch.context() as patch:
+        # pybrisque imports `svmutil` top-level, which the libsvm wheel keeps inside its package directory
+        patch.syspath_prepend(os.path.dirname(libsvm.__file__))
+        svm = pytest.importorskip("svm")
+        import scipy
+        if not hasattr(scipy, "ndarray"):
+            # libsvm 3.23 tests inputs against `scipy.ndarray`, which SciPy has removed; without SciPy it takes its list path
+            patch.setattr(svm, "scipy", None)
+        brisque = pytest.importorskip("brisque")
+        yield brisque.BRISQUE()
+    sys.modules.pop("brisque", None)
+
+
+@pytest.fixture(scope="module")
+def images(tmp_path_factory):
+    """The bundled samples plus synthetic RGB, RGBA and JPEG files, as paths."""
+    directory = tmp_path_factory.mktemp("brisque")
+    paths = sorted(glob.glob(SAMPLE_IMAGES))
+    for seed, (width, height) in enumerate(((512, 512), (333, 257))):
+        base, improved = synthetic_pair(width, height, seed)
+        paths.append(str(directory / f"synthetic{width}x{height}.png"))
+        base.save(paths[-1])
+        paths.append(str(directory / f"synthetic{width}x{height}_rgba.png"))
+        improved.convert("RGBA").save(paths[-1])
+        paths.append(str(directory / f"synthetic{width}x{height}.jpg"))
+        improved.save(paths[-1], quality=90)
+    return paths
+
+
+def test_gray_plane_decodes_like_cv2_imread(images):
+    import cv2
+    for path in images:
+        context = ImageContext(path)
+        assert np.array_equal(context.brisque_gray, cv2.imread(path, cv2.IMREAD_GRAYSCALE)), path
+
+
+def test_in_memory_gray_plane_uses_cv2_luma():
+    import cv2
+    image = synthetic_pair(160, 128)[0]
+    expected = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
+    assert np.array_equal(ImageContext(image=image).brisque_gray, expected)
+
+
+@pytest.mark.parametrize("name", sorted(REFERENCE_SCORES))
+def test_scores_match_recorded_pybrisque_scores(name):
+    path = next(path for path in glob.glob(SAMPLE_IMAGES) if os.path.basename(path) == name)
+    assert abs(calculate_brisque(ImageContext(path)) - REFERENCE_SCORES[name]) < TOLERANCE
+    # A plain path goes through the same decoding
+    assert abs(calculate_brisque(path) - REFERENCE_SCORES[name]) < TOLERANCE
+
+
+def test_scores_and_features_match_pybrisque(pybrisque, images):
+    for path in images:
+        context = ImageContext(path)
+        reference_features = pybrisque.get_feature(path)
+        relative_error = np.abs(context.brisque_features - reference_features) / np.maximum(np.abs(reference_features), 1e-12)
+        assert relative_error.max() < TOLERANCE, path
+        assert abs(calculate_brisque(context) - pybrisque.get_score(path)) < TOLERANCE, path
+
+
+def test_batched_prediction_matches_single_predictions(images):
+    features = np.stack([ImageContext(path).brisque_features for path in images])
+    model = get_brisque()
+    single = np.array([model.predict(vector)[0] for vector in features])
+    np.testing.assert_allclose(model.predict(features), single, rtol=0, atol=1e-9)
+
+
+def test_raw_grayscale_array_scores_like_its_context():
+    image = synthetic_pair(160, 128)[1]
+    gray = np.array(Image.fromarray(np.array(image)).convert("L"))
+    assert np.allclose(brisque_features(gray), ImageContext(image=image.convert("L")).brisque_features)
@@ -0,0 +1,145 @@
+"""DiskCache size accounting, eviction and access-time batching, and the content-addressed FeatureCache on top of it."""
+import atexit
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from src.metrics import ImagePairContext, compare_images
+from src.metrics.feature_cache import FeatureCache
+from src.utils import disk_cache
+from src.utils.disk_cache import DiskCache
+from tests.conftest import REPO_ROOT
+
+
+def stored_size(cache):
+    return cache._total_size()
+
+
+def accessed_at(path, key):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT accessed_at FROM entries WHERE key = ?", (key,)).fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_replacing_an_entry_counts_only_its_new_size(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), max_size_bytes=None)
+    for length in (100, 10, 1000, 50):
+        cache.set('key', "x" * length)
+        assert cache._size == stored_size(cache)
+    cache.set('other', [1, 2, 3])
+    cache.delete('key')
+    cache.delete('missing')
+    assert cache._size == stored_size(cache) == len("[1, 2, 3]")
+    cache.close()
+
+
+def test_rewriting_one_key_does_not_trigger_eviction(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), max_size_bytes=10_000)
+    passes = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda: passes.append(1) or evict())
+    for index in range(10):
+        cache.set(f"key{index}", "x" * 500)
+    # 200 rewrites of 500 bytes used to count as 100 KB, and each write past the budget ran an eviction pass
+    for _ in range(200):
+        cache.set('key0', "y" * 500)
+    assert not passes
+    assert len(cache) == 10 and cache.get('key9') == "x" * 500
+    cache.close()
+
+
+def test_eviction_drops_the_least_recently_used_entries(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), max_size_bytes=5_000, touch_interval_seconds=0)
+    for index in range(8):
+        cache.set(f"key{index}", "x" * 500)
+        time.sleep(0.01)
+    cache.get('key0')
+    cache.flush()
+    for index in range(8, 12):
+        cache.set(f"key{index}", "x" * 500)
+    # Back under 90% of the budget, keeping the recently read key0 and the newest entries
+    assert stored_size(cache) <= 4_500 and cache._size == stored_size(cache)
+    assert cache.get('key0') is not None and cache.get('key11') is not None and cache.get('key1') is None
+    cache.close()
+
+
+def test_hits_queue_access_times_until_flushed(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = DiskCache(path, touch_interval_seconds=0)
+    cache.set('key', 1)
+    written = accessed_at(path, 'key')
+    time.sleep(0.01)
+    assert cache.get('key') == 1 and cache.hits == 1
+    assert accessed_at(path, 'key') == written
+    cache.flush()
+    assert accessed_at(path, 'key') > written
+    cache.close()
+
+
+def test_exit_hook_is_registered_once_per_process(tmp_path):
+    before = atexit._ncallbacks()
+    caches = [DiskCache(str(tmp_path / f"cache{index}.sqlite")) for index in range(20)]
+    assert atexit._ncallbacks() == before
+    assert all(cache in disk_cache._open_caches for cache in caches)
+    for cache in caches:
+        cache.close()
+    assert not any(cache in disk_cache._open_caches for cache in caches)
+
+
+def test_open_caches_are_flushed_at_exit(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    script = f"""
+import time
+from src.utils.disk_cache import DiskCache
+cache = DiskCache({path!r}, touch_interval_seconds=0)
+cache.set('open', 1)
+cache.set('closed', 1)
+closed = DiskCache({path!r}, touch_interval_seconds=0)
+time.sleep(0.01)
+cache.get('open')
+closed.get('closed')
+closed.close()
+"""
+    process = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, env={**os.environ, 'PYTHONPATH': REPO_ROOT},
+                             capture_output=True, text=True, timeout=60)
+    # The closed cache is not flushed again at exit, which would fail on its closed connection
+    assert process.returncode == 0 and not process.stderr, process.stderr
+    connection = sqlite3.connect(path)
+    rows = dict(connection.execute("SELECT key, accessed_at - created_at FROM entries"))
+    connection.close()
+    assert rows['open'] > 0 and rows['closed'] > 0
+
+
+def test_feature_cache_is_keyed_by_content_version_and_vmaf_engine(tmp_path, dataset):
+    path = str(tmp_path / "features.sqlite")
+    reference, generated = dataset['pair0']
+    pair = ImagePairContext(reference, generated)
+    cache = FeatureCache(path, vmaf_identity="ffmpeg-a")
+    cache.set_image(pair.image1, {'entropy': np.float32(4.5), 'hist': np.arange(3)})
+    cache.set_pair(pair, {'vmaf': 90.0})
+    image = cache.get_image(ImagePairContext(reference, generated).image1)
+    assert image['entropy'] == 4.5 and np.array_equal(image['hist'], [0, 1, 2])
+    # Another VMAF engine or metrics version misses pair entries; image entries do not involve VMAF
+    assert FeatureCache(path, vmaf_identity="ffmpeg-b").get_pair(pair) is None
+    assert FeatureCache(path, vmaf_identity="ffmpeg-a").get_pair(pair) == {'vmaf': 90.0}
+    assert FeatureCache(path, version=0, vmaf_identity="ffmpeg-a").get_image(pair.image1) is None
+    # A copy of the image under another name hits, since entries are keyed by content
+    copy = str(tmp_path / "copy.png")
+    with open(reference, 'rb') as source, open(copy, 'wb') as target:
+        target.write(source.read())
+    assert cache.get_image(ImagePairContext(copy, generated).image1) is not None
+
+
+def test_cached_results_equal_computed_ones(tmp_path, dataset):
+    reference, generated = dataset['pair1']
+    cache = FeatureCache(str(tmp_path / "features.sqlite"))
+    computed = compare_images(reference, generated, metrics=['mse', 'ssim', 'entropy'], cache=cache)
+    assert cache.stats()['entries'] == 3
+    cached = compare_images(reference, generated, metrics=['mse', 'ssim', 'entropy'], cache=cache)
+    assert cached == computed and cache.stats()['hits'] == 3
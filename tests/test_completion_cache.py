@@ -0,0 +1,100 @@
+"""On-disk response cache of chat completions, for the blocking and the async generator."""
+import asyncio
+import sqlite3
+import time
+
+import openai
+import pytest
+
+from src.completions import completion_generator
+from src.completions.async_completion_generator import AsyncChatCompletionGenerator
+from src.completions.completion_generator import ChatCompletionGenerator, open_completion_cache, request_key
+from tests.mock_openai import MockChatServer
+
+
+@pytest.fixture
+def api_calls(monkeypatch, tmp_path):
+    """
+    Route the default response cache to a fresh `.cache/` under `tmp_path`, and answer the
+    blocking API with each request's last message reversed. Returns the list of requests made.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(completion_generator, '_completion_caches', {})
+    calls = []
+
+    def create(model, messages, max_tokens, temperature):
+        calls.append((model, messages, temperature))
+        return {'choices': [{'message': {'content': messages[-1]['content'][::-1]}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, 'create', create)
+    return calls
+
+
+def messages(text):
+    return [{'role': 'user', 'content': text}]
+
+
+def test_repeated_requests_are_served_from_the_cache(api_calls):
+    generator = ChatCompletionGenerator()
+    assert generator.generate_completion(messages("hello")) == "olleh"
+    assert generator.generate_completion(messages("hello")) == "olleh"
+    assert len(api_calls) == 1 and generator.cache_stats()['hits'] == 1
+    # Another process (a new generator) shares the file
+    assert ChatCompletionGenerator().generate_completion(messages("hello")) == "olleh"
+    assert len(api_calls) == 1
+
+
+def test_anything_that_changes_the_request_misses(api_calls):
+    generator = ChatCompletionGenerator()
+    generator.generate_completion(messages("hello"))
+    generator.generate_completion(messages("hello"), temperature=0.5)
+    generator.generate_completion(messages("hello"), model="gpt-4")
+    generator.generate_completion(messages("hello there"))
+    assert len(api_calls) == 4
+
+
+def test_disabled_cache_always_calls_the_api(api_calls):
+    generator = ChatCompletionGenerator(use_cache=False)
+    generator.generate_completion(messages("hello"))
+    generator.generate_completion(messages("hello"))
+    assert len(api_calls) == 2 and generator.cache_stats()['entries'] == 0
+
+
+def test_request_keys_ignore_dict_order():
+    first = request_key("m", [{'role': 'user', 'content': "x"}], 0.1, 10)
+    assert first == request_key("m", [{'content': "x", 'role': 'user'}], 0.1, 10)
+    assert first != request_key("m", [{'role': 'user', 'content': "x"}], 0.1, 11)
+
+
+def test_entries_expire_and_are_compressed(tmp_path):
+    path = str(tmp_path / "completions.sqlite")
+    cache = open_completion_cache(path, ttl_seconds=0.2)
+    cache.set("key", "a long answer " * 100)
+    assert cache.get("key") == "a long answer " * 100
+    connection = sqlite3.connect(path)
+    value, size = connection.execute("SELECT value, size FROM entries").fetchone()
+    connection.close()
+    assert isinstance(value, bytes) and size < len("a long answer " * 100)
+    time.sleep(0.3)
+    assert cache.get("key") is None and len(cache) == 0
+    assert open_completion_cache("") is None
+
+
+def test_async_generator_shares_the_cache(api_calls):
+    async def run(server):
+        async with AsyncChatCompletionGenerator(openai_api_key='test-key', api_base=server.url) as generator:
+            first = await generator.generate_completions([messages("hello"), messages("world")], model='mock-model')
+        async with AsyncChatCompletionGenerator(openai_api_key='test-key', api_base=server.url) as generator:
+            second = await generator.generate_completions([messages("hello"), messages("world")], model='mock-model')
+        return first, second
+
+    async def main():
+        async with MockChatServer() as server:
+            return await run(server), len(server.requests)
+
+    (first, second), requests = asyncio.run(main())
+    assert first == second == ["olleh", "dlrow"]
+    assert requests == 2
+    # The blocking generator reads what the async one stored, for the same request
+    assert ChatCompletionGenerator().generate_completion(messages("hello"), model='mock-model') == "olleh"
+    assert not api_calls
@@ -0,0 +1,52 @@
+"""Duplicate pairs: closed-form values for identical pairs only, and no made-up VMAF."""
+import shutil
+
+import pytest
+
+from src.metrics import compare_images
+from src.results import ResultsAggregator
+from tests.conftest import FAKE_FFMPEG
+
+
+@pytest.fixture(autouse=True)
+def fake_ffmpeg(monkeypatch):
+    monkeypatch.setenv("FFMPEG_PATH", FAKE_FFMPEG)
+
+
+@pytest.fixture
+def identical_pair(dataset, tmp_path):
+    reference, _ = dataset['pair0']
+    copy = str(tmp_path / "copy_improved.png")
+    shutil.copyfile(reference, copy)
+    return reference, copy
+
+
+def test_identical_pair_gets_closed_forms_and_no_vmaf(identical_pair):
+    results = compare_images(*identical_pair)
+    assert results['duplicate'] == 'identical'
+    assert results['mse'] == 0.0 and results['ssim'] == 1.0 and results['psnr'] == float('inf')
+    assert results['vmaf'] is None
+    assert results['brisque_image1'] == results['brisque_image2'] and results['brisque_diff'] == 0
+
+
+def test_identical_pairs_leave_the_vmaf_mean_alone(dataset, identical_pair):
+    distinct = compare_images(*dataset['pair1'])
+    aggregator = ResultsAggregator()
+    aggregator.update(distinct)
+    aggregator.update(compare_images(*identical_pair))
+    assert aggregator.stats['vmaf'].count == 1
+    assert aggregator.stats['vmaf'].mean == pytest.approx(distinct['vmaf'])
+    assert aggregator.duplicates['identical'] == 1
+
+
+def test_near_duplicates_are_flagged_but_computed(dataset):
+    from PIL import Image
+    reference, generated = dataset['pair0']
+    # Re-encode the base with one pixel changed: different bytes, same picture
+    image = Image.open(reference).convert("RGB")
+    image.putpixel((0, 0), tuple(255 - channel for channel in image.getpixel((0, 0))))
+    image.save(generated)
+    results = compare_images(reference, generated, near_duplicate_threshold=0.05)
+    assert results['duplicate'] == 'near'
+    assert 0 < results['mse'] < 1 and results['psnr'] != float('inf')
+    assert results['vmaf'] is not None and results['vmaf'] < 100
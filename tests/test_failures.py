@@ -0,0 +1,87 @@
+"""Pairs that cannot be compared: failure records in the results stream, counted in the summary and retried on resume."""
+import json
+import os
+
+import numpy as np
+
+from src.pipeline import EvaluationOptions, evaluate_batch
+from src.results import ResultsAggregator, read_columns
+from tests.conftest import FAKE_FFMPEG, run_main
+
+
+def break_image(path):
+    with open(path, 'wb') as file:
+        file.write(b"not an image")
+
+
+def read_jsonl(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_failed_pairs_get_failure_results(tmp_path, dataset):
+    break_image(dataset['pair1'][1])
+    batch = [(key, *paths) for key, paths in dataset.items()] + [('missing', str(tmp_path / "missing.png"), dataset['pair0'][1])]
+    results = dict(evaluate_batch(batch, EvaluationOptions(ffmpeg_path=FAKE_FFMPEG)))
+    # Every pair of the batch is accounted for, the failed ones with just their error
+    assert list(results) == [key for key, _, _ in batch]
+    assert results['pair1'] == {'error': results['pair1']['error']} and "UnidentifiedImageError" in results['pair1']['error']
+    assert results['missing'] == {'error': "One or both images do not exist"}
+    assert all('error' not in results[key] and 'ssim' in results[key] for key in ('pair0', 'pair2', 'pair3'))
+
+
+def test_failure_records_are_counted_not_aggregated(tmp_path):
+    aggregator = ResultsAggregator()
+    aggregator.update({'key': 'a', 'mse': 1.0})
+    aggregator.update({'key': 'b', 'reference': 'b_base.png', 'generated': 'b_improved.png', 'error': "OSError: broken"})
+    assert aggregator.records == 1 and aggregator.failed == 1
+    summary = aggregator.summary()
+    assert summary['records'] == 1 and summary['failed'] == 1 and summary['metrics']['mse']['count'] == 1
+    merged = ResultsAggregator.from_partial(json.loads(json.dumps(aggregator.to_partial())))
+    merged.merge(aggregator)
+    assert (merged.records, merged.failed) == (2, 2)
+    # Partials written before failures were counted merge as having none
+    assert ResultsAggregator.from_partial({k: v for k, v in aggregator.to_partial().items() if k != 'failed'}).failed == 0
+
+    path = tmp_path / "results.jsonl"
+    path.write_text("\n".join(json.dumps(record) for record in [{'key': 'a', 'mse': 1.0}, {'key': 'b', 'error': "OSError: broken"},
+                                                                  {'key': 'c', 'mse': 3.0}]) + "\n")
+    np.testing.assert_array_equal(read_columns(str(path))['mse'], [1.0, 3.0])
+
+
+def test_run_records_failures_and_resume_retries_them(tmp_path, dataset):
+    directory = str(tmp_path)
+    broken = dataset['pair2'][1]
+    with open(broken, 'rb') as file:
+        data = file.read()
+    break_image(broken)
+    process = run_main(directory, "results.jsonl")
+    assert "1 image pairs could not be compared" in process.stdout
+    records = read_jsonl(os.path.join(directory, "results.jsonl"))
+    failures = [record for record in records if 'error' in record]
+    assert [(record['key'], record['generated']) for record in failures] == [('pair2', "pair2_improved.png")]
+    assert set(failures[0]) == {'key', 'reference', 'generated', 'error'}
+    with open(os.path.join(directory, "results.summary.json")) as file:
+        summary = json.load(file)
+    assert summary['records'] == 3 and summary['failed'] == 1
+    with open(os.path.join(directory, "results.manifest.json")) as file:
+        assert json.load(file)['failed'] == 1
+
+    # Once the image is readable again, resuming evaluates only the failed pair
+    with open(broken, 'wb') as file:
+        file.write(data)
+    run_main(directory, "results.jsonl", "--resume")
+    records = read_jsonl(os.path.join(directory, "results.jsonl"))
+    assert [record['key'] for record in records if 'error' not in record].count('pair2') == 1
+    assert len(records) == 5
+    with open(os.path.join(directory, "results.summary.json")) as file:
+        summary = json.load(file)
+    assert summary['records'] == 4 and summary['failed'] == 0
+
+
+def test_failures_come_back_from_worker_processes(tmp_path, dataset):
+    break_image(dataset['pair0'][0])
+    run_main(str(tmp_path), "results.jsonl", "--workers", "2")
+    records = read_jsonl(os.path.join(str(tmp_path), "results.jsonl"))
+    assert sorted(record['key'] for record in records) == sorted(dataset)
+    assert [record['key'] for record in records if 'error' in record] == ['pair0']
@@ -0,0 +1,145 @@
+"""Stage instrumentation: timings, memory peaks, merging worker stats, sampled profiling and the run's stage file."""
+import json
+import os
+import pstats
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pytest
+
+from src.utils.instrumentation import (dump_stats, enable_memory_tracing, format_stats_table, get_stats, is_sampled, merge_stats,
+                                       profile_if_sampled, reset_stats, stage)
+from tests.conftest import REPO_ROOT, run_main
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    reset_stats()
+    yield
+    reset_stats()
+
+
+def busy(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def test_stages_accumulate_wall_and_cpu_time():
+    for _ in range(3):
+        with stage("sleep"):
+            time.sleep(0.02)
+    with stage("busy"):
+        busy(0.05)
+    stats = get_stats()
+    assert stats['sleep']['calls'] == 3 and stats['sleep']['wall_s'] >= 0.06 and stats['sleep']['cpu_s'] < 0.03
+    assert 0.02 <= stats['sleep']['max_wall_s'] <= stats['sleep']['wall_s']
+    assert stats['busy']['calls'] == 1 and stats['busy']['cpu_s'] >= 0.05 and stats['busy']['wall_s'] >= 0.05
+    # A snapshot, not the live stats
+    stats['busy']['calls'] = 99
+    assert get_stats()['busy']['calls'] == 1
+
+
+def test_nested_and_failing_stages_are_recorded():
+    with pytest.raises(RuntimeError):
+        with stage("outer"):
+            with stage("inner"):
+                time.sleep(0.01)
+            raise RuntimeError("metric failed")
+    stats = get_stats()
+    assert stats['outer']['calls'] == stats['inner']['calls'] == 1
+    # The outer stage includes the time of the stage nested in it
+    assert stats['outer']['wall_s'] >= stats['inner']['wall_s'] >= 0.01
+
+
+def test_memory_tracing_records_allocation_peaks():
+    was_tracing = tracemalloc.is_tracing()
+    enable_memory_tracing()
+    try:
+        with stage("allocate"):
+            block = bytearray(8 * 1024 * 1024)
+            del block
+        with stage("small"):
+            block = bytearray(1024)
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    stats = get_stats()
+    assert stats['allocate']['tracemalloc_peak_kb'] >= 8 * 1024
+    assert stats['small']['tracemalloc_peak_kb'] < 1024
+    with stage("untraced"):
+        block = bytearray(8 * 1024 * 1024)
+    assert get_stats()['untraced']['tracemalloc_peak_kb'] == 0
+
+
+def test_worker_snapshots_merge_into_the_parent():
+    with stage("decode"):
+        time.sleep(0.01)
+    worker = {'decode': {'calls': 4, 'wall_s': 1.0, 'cpu_s': 0.5, 'max_wall_s': 0.4, 'rss_growth_kb': 100.0, 'tracemalloc_peak_kb': 50.0},
+              'metric.ssim': {'calls': 2, 'wall_s': 2.0, 'cpu_s': 1.5, 'max_wall_s': 1.2, 'rss_growth_kb': 0.0, 'tracemalloc_peak_kb': 0.0}}
+    local = get_stats()['decode']
+    merge_stats(worker)
+    merge_stats(json.loads(json.dumps(worker)))
+    stats = get_stats()
+    assert stats['decode']['calls'] == 9
+    assert stats['decode']['wall_s'] == pytest.approx(local['wall_s'] + 2.0) and stats['decode']['rss_growth_kb'] == pytest.approx(local['rss_growth_kb'] + 200)
+    # Maxima are maxima across processes, not sums
+    assert stats['decode']['max_wall_s'] == 0.4 and stats['decode']['tracemalloc_peak_kb'] == 50.0
+    assert stats['metric.ssim'] == {**worker['metric.ssim'], 'calls': 4, 'wall_s': 4.0, 'cpu_s': 3.0}
+
+
+def test_table_and_dump(tmp_path):
+    merge_stats({'fast': {'calls': 10, 'wall_s': 0.5, 'cpu_s': 0.5, 'max_wall_s': 0.1, 'rss_growth_kb': 0.0, 'tracemalloc_peak_kb': 0.0},
+                 'slow': {'calls': 2, 'wall_s': 1.5, 'cpu_s': 1.0, 'max_wall_s': 1.0, 'rss_growth_kb': 2048.0, 'tracemalloc_peak_kb': 0.0}})
+    lines = format_stats_table().splitlines()
+    assert lines[0].split()[:3] == ['stage', 'calls', 'wall']
+    # Most expensive first, with its share of the total and mean time per call
+    assert lines[1].split()[:5] == ['slow', '2', '1.500', '75.0%', '1.000'] and lines[1].split()[5] == '750.00'
+    assert lines[2].split()[0] == 'fast'
+    path = str(tmp_path / "logs" / "run.stages.json")
+    dump_stats(path)
+    with open(path) as file:
+        assert json.load(file) == get_stats()
+
+
+def test_sampling_is_deterministic_and_proportional():
+    keys = [f"pair{index}" for index in range(20000)]
+    sampled = [key for key in keys if is_sampled(key, 0.1)]
+    assert 0.09 < len(sampled) / len(keys) < 0.11
+    assert not any(is_sampled(key, 0) for key in keys[:100]) and all(is_sampled(key, 1) for key in keys[:100])
+    # Nested rates select nested sets
+    assert set(key for key in keys if is_sampled(key, 0.02)) <= set(sampled)
+    # Other processes, with other hash seeds, pick the same keys
+    code = f"from src.utils.instrumentation import is_sampled; print([k for k in {keys[:500]!r} if is_sampled(k, 0.1)])"
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env={**os.environ, 'PYTHONHASHSEED': '123'},
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == repr([key for key in keys[:500] if is_sampled(key, 0.1)])
+
+
+def test_sampled_keys_are_profiled(tmp_path):
+    directory = str(tmp_path / "profiles")
+    keys = [f"pair {index}/x" for index in range(40)]
+    for key in keys:
+        with profile_if_sampled(key, 0.25, directory):
+            busy(0.001)
+    expected = [key for key in keys if is_sampled(key, 0.25)]
+    files = sorted(os.listdir(directory))
+    # Keys are made safe for file names
+    assert files == sorted(key.replace(" ", "_").replace("/", "_") + ".prof" for key in expected) and files
+    assert pstats.Stats(os.path.join(directory, files[0])).total_calls > 0
+    with profile_if_sampled("pair 0/x", 1.0, None):
+        pass
+
+
+def test_runs_write_merged_stage_stats(tmp_path, dataset):
+    directory = str(tmp_path)
+    run_main(directory, "results.jsonl", "--workers", "2", "--profile-sample", "1", "--profile-dir", "profiles")
+    with open(os.path.join(directory, "results.stages.json")) as file:
+        stats = json.load(file)
+    # Both images of every pair were decoded once, in the worker processes, and reported back
+    assert stats['decode']['calls'] == 2 * len(dataset)
+    for name in ('metric.mse', 'metric.structural_batch', 'metric.brisque', 'ffmpeg.vmaf', 'score'):
+        assert stats[name]['calls'] >= 1, name
+    assert sorted(os.listdir(os.path.join(directory, "profiles"))) == sorted(f"{key}.prof" for key in dataset)
@@ -0,0 +1,136 @@
+"""Memory-bounded mode and resample policies: the default values to float32 rounding, lower peaks, aligned mismatched pairs."""
+import tracemalloc
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.metrics import METRICS, ImageContext, ImagePairContext, calculate_fft_mse, calculate_mse, compare_images
+from src.metrics.image_context import PAIR_BYTES_PER_PIXEL
+from src.pipeline import EvaluationOptions, evaluate_batch
+from tests.conftest import FAKE_FFMPEG, synthetic_pair
+
+LOCAL_METRICS = [name for name in METRICS if name != 'vmaf']
+# Values computed on float32 planes and half spectra; everything else is exact
+FLOAT32_TOLERANCE = {'ssim': 1e-6, 'gsim': 1e-5, 'fft_mse': 1e-5}
+
+
+@pytest.fixture
+def large_pair(tmp_path):
+    """A 701x560 pair: more rows than one streaming block, and an odd width for the half spectra."""
+    base, improved = synthetic_pair(701, 560, seed=1)
+    paths = str(tmp_path / "large_base.png"), str(tmp_path / "large_improved.png")
+    base.save(paths[0])
+    improved.save(paths[1])
+    return paths
+
+
+def save(image, path):
+    image.save(path)
+    return str(path)
+
+
+def test_bounded_values_match_the_default(large_pair):
+    default = compare_images(*large_pair, metrics=LOCAL_METRICS)
+    bounded = compare_images(*large_pair, metrics=LOCAL_METRICS, memory_bounded=True)
+    assert set(bounded) == set(default)
+    for name, value in default.items():
+        if isinstance(value, float):
+            assert bounded[name] == pytest.approx(value, rel=FLOAT32_TOLERANCE.get(name, 1e-12), abs=1e-12), name
+
+
+def test_half_spectra_and_streaming_sums_on_odd_shapes():
+    rng = np.random.default_rng(2)
+    for shape in ((300, 257), (513, 64), (7, 9)):
+        gray1, gray2 = (rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(2))
+        pair = ImagePairContext(ImageContext(image=Image.fromarray(gray1)), ImageContext(image=Image.fromarray(gray2)), memory_bounded=True)
+        assert calculate_fft_mse(pair) == pytest.approx(calculate_fft_mse(gray1, gray2), rel=1e-5), shape
+        assert calculate_mse(pair) == pytest.approx(calculate_mse(gray1, gray2), rel=1e-12), shape
+
+
+def test_bounded_mode_lowers_the_allocation_peak(large_pair):
+    metrics = ['mse', 'psnr', 'ssim', 'gsim', 'fft_mse', 'colorfulness']
+    peaks = {}
+    for memory_bounded in (False, True):
+        # Warm up imports and caches outside the measurement
+        compare_images(*large_pair, metrics=metrics, memory_bounded=memory_bounded)
+        tracemalloc.start()
+        try:
+            compare_images(*large_pair, metrics=metrics, memory_bounded=memory_bounded)
+            peaks[memory_bounded] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    assert peaks[True] < 0.7 * peaks[False]
+
+
+def test_memory_cap_downscales_only_the_pair_metrics(large_pair):
+    cap = 10 * 1024 * 1024
+    pair = ImagePairContext(*large_pair, memory_bounded=True, max_pair_bytes=cap)
+    image1, image2 = pair.aligned
+    width, height = image1.image.size
+    assert image2.image.size == (width, height) and width * height * PAIR_BYTES_PER_PIXEL <= cap
+    assert width / height == pytest.approx(701 / 560, rel=0.01)
+    default = compare_images(*large_pair, metrics=LOCAL_METRICS)
+    capped = compare_images(*large_pair, metrics=LOCAL_METRICS, memory_bounded=True, max_pair_bytes=cap)
+    for name in ('brisque_image1', 'brisque_image2', 'colorfulness_image1', 'entropy_image2'):
+        assert capped[name] == default[name], name
+    assert capped['mse'] != default['mse']
+    # The cap only applies in memory-bounded mode, and a cap the pair fits in changes nothing
+    unbounded = ImagePairContext(*large_pair, max_pair_bytes=cap)
+    assert unbounded.aligned == (unbounded.image1, unbounded.image2)
+    roomy = compare_images(*large_pair, metrics=['mse', 'ssim'], memory_bounded=True, max_pair_bytes=1 << 30)
+    assert roomy['mse'] == default['mse']
+
+
+@pytest.mark.parametrize("policy, size", [('reference', (300, 240)), ('smaller', (300, 240)), ('larger', (450, 360))])
+def test_resample_policies_align_mismatched_pairs(tmp_path, policy, size):
+    base, improved = synthetic_pair(300, 240, seed=3)
+    reference = save(base, tmp_path / "base.png")
+    generated = save(improved.resize((450, 360), Image.LANCZOS), tmp_path / "improved.png")
+    aligned = ImagePairContext(reference, generated, resample=policy).aligned
+    assert aligned[0].image.size == aligned[1].image.size == size
+    results = compare_images(reference, generated, metrics=['mse', 'ssim', 'psnr', 'entropy'], resample=policy)
+    # The same values as resampling the images by hand
+    image1, image2 = Image.open(reference), Image.open(generated)
+    if image1.size != size:
+        image1 = image1.resize(size, Image.LANCZOS)
+    if image2.size != size:
+        image2 = image2.resize(size, Image.LANCZOS)
+    expected = compare_images(ImageContext(image=image1), ImageContext(image=image2), metrics=['mse', 'ssim', 'psnr'])
+    for name in ('mse', 'ssim', 'psnr'):
+        assert results[name] == pytest.approx(expected[name], rel=1e-12), name
+    # Per-image metrics still see the originals
+    assert results['entropy_image2'] == compare_images(reference, generated, metrics=['entropy'])['entropy_image2']
+
+
+def test_mismatched_pairs_without_a_policy_fail_as_before(tmp_path):
+    base, improved = synthetic_pair(300, 240, seed=4)
+    reference = save(base, tmp_path / "base.png")
+    generated = save(improved.resize((320, 240)), tmp_path / "improved.png")
+    pair = ImagePairContext(reference, generated)
+    assert pair.aligned == (pair.image1, pair.image2)
+    with pytest.raises(ValueError):
+        compare_images(reference, generated, metrics=['mse'])
+    with pytest.raises(ValueError, match="Unknown resample policy 'nearest'"):
+        ImagePairContext(reference, generated, resample='nearest')
+
+
+def test_settings_that_change_values_change_the_cache_variant(large_pair):
+    assert ImagePairContext(*large_pair).variant == ""
+    variants = {ImagePairContext(*large_pair, memory_bounded=True).variant, ImagePairContext(*large_pair, resample='smaller').variant,
+                ImagePairContext(*large_pair, memory_bounded=True, max_pair_bytes=1 << 20).variant,
+                ImagePairContext(*large_pair, memory_bounded=True, resample='larger').variant}
+    assert len(variants) == 4 and "" not in variants
+
+
+def test_batches_release_each_pair_once_scored(dataset, monkeypatch):
+    released = []
+    release = ImagePairContext.release
+    monkeypatch.setattr(ImagePairContext, 'release', lambda self: released.append(self.image1_path) or release(self))
+    batch = [(key, *paths) for key, paths in dataset.items()]
+    for memory_bounded in (False, True):
+        released.clear()
+        options = EvaluationOptions(ffmpeg_path=FAKE_FFMPEG, memory_bounded=memory_bounded, batch_size=len(batch))
+        results = dict(evaluate_batch(batch, options))
+        assert all('error' not in values for values in results.values())
+        assert sorted(set(released)) == sorted(reference for reference, _ in dataset.values())
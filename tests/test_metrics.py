@@ -0,0 +1,69 @@
+"""Metrics on shared image contexts: one decode per image, the same values as the plain-array calculations."""
+import math
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.metrics import (METRICS, ImageContext, calculate_colorfulness, calculate_edge_mse, calculate_entropy, calculate_fft_mse, calculate_gsim,
+                         calculate_histogram_correlation, calculate_ms_ssim, calculate_mse, calculate_psnr, calculate_ssim, compare_images)
+from src.utils.instrumentation import get_stats, reset_stats
+
+# Everything but VMAF, which needs ffmpeg and has tests of its own
+LOCAL_METRICS = [name for name in METRICS if name != 'vmaf']
+
+
+def direct_values(reference, generated):
+    """Each metric computed on its own from freshly decoded arrays, as compare_images did before contexts."""
+    image1, image2 = Image.open(reference), Image.open(generated)
+    gray1, gray2 = np.array(image1.convert("L")), np.array(image2.convert("L"))
+    return {
+        'mse': calculate_mse(gray1, gray2), 'ssim': calculate_ssim(gray1, gray2), 'psnr': calculate_psnr(gray1, gray2),
+        'hist_corr': calculate_histogram_correlation(gray1, gray2), 'edge_mse': calculate_edge_mse(gray1, gray2),
+        'fft_mse': calculate_fft_mse(gray1, gray2), 'ms_ssim': calculate_ms_ssim(gray1, gray2), 'gsim': calculate_gsim(gray1, gray2),
+        'colorfulness_image1': calculate_colorfulness(np.array(image1)), 'colorfulness_image2': calculate_colorfulness(np.array(image2)),
+        'entropy_image1': float(np.ravel(calculate_entropy(gray1))[0]), 'entropy_image2': float(np.ravel(calculate_entropy(gray2))[0]),
+    }
+
+
+def test_shared_contexts_give_the_direct_values(dataset):
+    reference, generated = dataset['pair0']
+    results = compare_images(reference, generated, metrics=LOCAL_METRICS)
+    expected = direct_values(reference, generated)
+    for name, value in expected.items():
+        assert results[name] == pytest.approx(value, rel=1e-12, abs=1e-12), name
+    assert results['entropy_diff'] == pytest.approx(expected['entropy_image2'] - expected['entropy_image1'])
+    assert results['brisque_diff'] == pytest.approx(results['brisque_image2'] - results['brisque_image1'])
+    assert results['duplicate'] == 'distinct'
+
+
+def test_each_image_is_decoded_once(dataset):
+    reference, generated = dataset['pair1']
+    reset_stats()
+    compare_images(reference, generated, metrics=LOCAL_METRICS)
+    assert get_stats()['decode']['calls'] == 2
+    # One stage per metric that ran, so the decode is not hidden in a metric that happened to go first
+    assert all(get_stats()[f"metric.{name}"]['calls'] >= 1 for name in ('mse', 'ssim', 'fft_mse', 'ms_ssim', 'gsim'))
+
+
+def test_planes_are_memoized_and_released(dataset):
+    context = ImageContext(dataset['pair2'][0])
+    gray = context.gray
+    assert context.gray is gray and context.edges is context.edges
+    content_hash, histogram = context.content_hash, context.histogram
+    context.release()
+    assert 'gray' not in context.__dict__ and 'data' not in context.__dict__ and 'image' not in context.__dict__
+    # Small values survive the release; dropped planes come back from the file unchanged
+    assert context.__dict__['histogram'] is histogram and context.content_hash == content_hash
+    assert np.array_equal(context.gray, gray)
+
+
+def test_in_memory_images_are_compared_like_files(dataset):
+    reference, generated = dataset['pair3']
+    from_files = compare_images(reference, generated, metrics=['mse', 'ssim', 'psnr', 'entropy', 'colorfulness'])
+    in_memory = compare_images(ImageContext(image=Image.open(reference)), ImageContext(image=Image.open(generated)),
+                               metrics=['mse', 'ssim', 'psnr', 'entropy', 'colorfulness'])
+    for name, value in from_files.items():
+        if name != 'duplicate':
+            assert in_memory[name] == pytest.approx(value), name
+    assert math.isfinite(in_memory['psnr'])
@@ -0,0 +1,162 @@
+"""Pairing by file name key: the default and custom patterns, recursive keys, orphans and duplicates, and incremental rescans."""
+import json
+import os
+import shutil
+
+import pytest
+
+from src.pipeline import DEFAULT_GENERATED_PATTERN, DEFAULT_REFERENCE_PATTERN, PairIndex, compile_key_pattern, pair_manifest_path
+from src.pipeline.pairing import match_key, relative_key
+from tests.conftest import run_main, synthetic_pair
+
+
+def touch(root, relative, data=b"image bytes"):
+    path = os.path.join(str(root), *relative.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+    return path
+
+
+@pytest.fixture
+def trees(tmp_path):
+    return tmp_path / "ref", tmp_path / "gen"
+
+
+@pytest.mark.parametrize("name, key", [("my_baseball_base.png", "my_baseball"), ("cat_base.png", "cat"), ("cat_base-v2.jpg", "cat"),
+                                       ("a_base_b_base.png", "a_base_b"), ("base.png", None), ("cat_based.png", None),
+                                       ("cat.png", None)])
+def test_default_reference_keys(name, key):
+    assert match_key(compile_key_pattern(DEFAULT_REFERENCE_PATTERN), name) == key
+
+
+def test_default_generated_keys():
+    pattern = compile_key_pattern(DEFAULT_GENERATED_PATTERN)
+    assert match_key(pattern, "my_baseball_improved.png") == "my_baseball"
+    assert match_key(pattern, "dog_improved_2.webp") == "dog"
+    assert match_key(pattern, "dog_improvedx.png") is None
+
+
+def test_key_patterns_need_one_key_group():
+    assert match_key(compile_key_pattern(r"(.+)-before\."), "img3-before.png") == "img3"
+    assert match_key(compile_key_pattern(r"(?P<set>\w)_(?P<key>.+)\.png"), "a_img3.png") == "img3"
+    for pattern in (r".+\.png", r"(.+)-(.+)\.png"):
+        with pytest.raises(ValueError, match="needs a"):
+            compile_key_pattern(pattern)
+
+
+def test_subdirectories_prefix_keys():
+    assert relative_key("", "img3") == "img3"
+    assert relative_key(os.path.join("cats", "a"), "img3") == "cats/a/img3"
+
+
+def test_pairs_orphans_and_duplicates(trees):
+    reference, generated = trees
+    expected = {'cat': (touch(reference, "cat_base.jpg"), touch(generated, "cat_improved.png")),
+                'my_baseball': (touch(reference, "my_baseball_base.png"), touch(generated, "my_baseball_improved.png")),
+                'animals/owl': (touch(reference, "animals/owl_base.png"), touch(generated, "animals/owl_improved.png"))}
+    # Same key as cat_base.jpg, later in path order
+    duplicate = touch(reference, "cat_base.png")
+    repeated = touch(generated, "cat_improved_2.png")
+    lonely_base, lonely_improved = touch(reference, "dog_base.png"), touch(generated, "animals/dog_improved.png")
+    unmatched = touch(generated, "notes.png")
+    touch(reference, ".hidden/fox_base.png")
+    touch(generated, ".hidden/fox_improved.png")
+    touch(reference, "fox_base.txt")
+    index = PairIndex(str(reference), str(generated))
+    pairs = list(index.pairs())
+    assert {key: (base, improved) for key, base, improved in pairs} == expected and len(pairs) == 3
+    assert index.orphans == {'reference': [lonely_base], 'generated': [lonely_improved]}
+    assert sorted(index.duplicates) == sorted([duplicate, repeated])
+    assert index.unmatched == [unmatched]
+
+
+def test_custom_patterns(trees):
+    reference, generated = trees
+    base = touch(reference, "set1/img3-before.jpg")
+    improved = touch(generated, "set1/img3-after.jpg")
+    touch(reference, "set1/img3_base.png")
+    index = PairIndex(str(reference), str(generated), r"(?P<key>.+)-before\.", r"(.+)-after\.")
+    assert list(index.pairs()) == [('set1/img3', base, improved)]
+    assert index.unmatched == [os.path.join(str(reference), "set1", "img3_base.png")]
+
+
+def scan(trees, manifest):
+    index = PairIndex(str(trees[0]), str(trees[1]), manifest_path=str(manifest))
+    pairs = sorted(key for key, _, _ in index.pairs())
+    stats = {side: dict(getattr(index, side).stats) for side in ('reference', 'generated')}
+    return pairs, stats
+
+
+def test_rescans_only_list_changed_directories(trees, tmp_path):
+    reference, generated = trees
+    for group in range(4):
+        for item in range(5):
+            touch(reference, f"group{group}/img{item}_base.png")
+            touch(generated, f"group{group}/img{item}_improved.png")
+    manifest = tmp_path / "pairs.json"
+    pairs, stats = scan(trees, manifest)
+    assert len(pairs) == 20 and stats['reference'] == {'listed_directories': 5, 'stat_files': 20}
+
+    written = os.stat(manifest).st_mtime_ns
+    assert scan(trees, manifest) == (pairs, {side: {'listed_directories': 0, 'stat_files': 0} for side in ('reference', 'generated')})
+    # Nothing changed, so the manifest is not rewritten
+    assert os.stat(manifest).st_mtime_ns == written
+
+    touch(reference, "group2/new_base.png")
+    touch(generated, "group2/new_improved.png")
+    shutil.rmtree(reference / "group3")
+    pairs, stats = scan(trees, manifest)
+    assert 'group2/new' in pairs and not any(key.startswith('group3/') for key in pairs) and len(pairs) == 16
+    # The root lost a subdirectory and group2 gained a file; only those are listed, and only the new file is stat-ed
+    assert stats['reference'] == {'listed_directories': 2, 'stat_files': 1}
+    assert stats['generated'] == {'listed_directories': 1, 'stat_files': 1}
+
+    # A file replaced under the same name is stat-ed again
+    touch(generated, "group0/replacement.png", b"new content")
+    os.replace(generated / "group0" / "replacement.png", generated / "group0" / "img0_improved.png")
+    pairs, stats = scan(trees, manifest)
+    assert stats['generated'] == {'listed_directories': 1, 'stat_files': 1}
+    with open(manifest) as file:
+        state = json.load(file)
+    assert state['generated']['directories']['group0'][2]['img0_improved.png'][1] == len(b"new content")
+
+
+def test_stale_or_broken_manifests_are_rebuilt(trees, tmp_path, capsys):
+    reference, generated = trees
+    touch(reference, "cat_base.png")
+    touch(generated, "cat_improved.png")
+    manifest = tmp_path / "pairs.json"
+    scan(trees, manifest)
+    # A manifest for other patterns does not apply
+    index = PairIndex(str(reference), str(generated), r"(.+)_base\.png", DEFAULT_GENERATED_PATTERN, manifest_path=str(manifest))
+    assert [key for key, _, _ in index.pairs()] == ['cat'] and index.reference.stats['listed_directories'] == 1
+    assert index.generated.stats['listed_directories'] == 0
+    manifest.write_text('{"version": 1, "reference": ')
+    assert scan(trees, manifest)[1]['reference']['listed_directories'] == 1
+    assert "Ignoring unreadable pair manifest" in capsys.readouterr().out
+    manifest.write_text(json.dumps({**json.loads(manifest.read_text()), 'version': 0}))
+    assert scan(trees, manifest)[1]['generated']['listed_directories'] == 1
+
+
+def test_manifest_paths_depend_on_directories_and_patterns(tmp_path):
+    path = pair_manifest_path("ref", "gen", DEFAULT_REFERENCE_PATTERN, DEFAULT_GENERATED_PATTERN)
+    assert path.startswith(os.path.join(".cache", "pairs", "")) and path.endswith(".json")
+    assert path == pair_manifest_path(os.path.abspath("ref"), "gen", DEFAULT_REFERENCE_PATTERN, DEFAULT_GENERATED_PATTERN)
+    assert path != pair_manifest_path("gen", "ref", DEFAULT_REFERENCE_PATTERN, DEFAULT_GENERATED_PATTERN)
+    assert path != pair_manifest_path("ref", "gen", r"(.+)_base\.png", DEFAULT_GENERATED_PATTERN)
+
+
+def test_runs_pair_nested_and_custom_named_images(tmp_path):
+    directory = str(tmp_path)
+    for index, name in enumerate(["cats/img1", "cats/img2", "dogs/img1"]):
+        base, improved = synthetic_pair(240, 200, seed=index)
+        base.save(touch(tmp_path / "ref", f"{name}-before.png"))
+        improved.save(touch(tmp_path / "gen", f"{name}-after.png"))
+    touch(tmp_path / "ref", "birds/img1-before.png")
+    process = run_main(directory, "results.jsonl", "--reference-pattern", r"(?P<key>.+)-before\.",
+                       "--generated-pattern", r"(?P<key>.+)-after\.")
+    assert "1 base images without an improved image: img1-before.png" in process.stdout
+    with open(tmp_path / "results.jsonl") as file:
+        assert sorted(json.loads(line)['key'] for line in file) == ["cats/img1", "cats/img2", "dogs/img1"]
+    assert len(os.listdir(tmp_path / ".cache" / "pairs")) == 1
@@ -0,0 +1,152 @@
+"""Batch prompt enhancement: output order, the reorder window, malformed lines and resuming from the output file."""
+import asyncio
+import io
+import json
+
+import pytest
+
+from src.completions import async_completion_generator
+from src.easy_prompt_enhancer import prompt_enhancer
+from src.easy_prompt_enhancer.prompt_enhancer import enhance_batch, load_checkpoint, read_prompts, run_batch
+
+
+class Output(io.StringIO):
+    """An output file that remembers how many prompts had been sent when each line was written."""
+
+    def __init__(self, generator_calls):
+        super().__init__()
+        self.generator_calls = generator_calls
+        self.sent_at_write = []
+
+    def write(self, text):
+        self.sent_at_write.append(len(self.generator_calls))
+        return super().write(text)
+
+    def records(self):
+        return [json.loads(line) for line in self.getvalue().splitlines()]
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    """
+    Enhancement answered locally: the messages are just the prompt, the answer is the prompt
+    upper-cased after `delays[prompt]` seconds (default 0), and prompts in `failing` raise.
+    Returns `(sent prompts, delays, failing)`.
+    """
+    sent, delays, failing = [], {}, set()
+
+    class Generator:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            pass
+
+        async def generate_completion(self, messages, model=None):
+            prompt = messages[-1]['content']
+            sent.append(prompt)
+            await asyncio.sleep(delays.get(prompt, 0))
+            if prompt in failing:
+                raise RuntimeError("rate limited")
+            return prompt.upper()
+
+    monkeypatch.setattr(async_completion_generator, 'AsyncChatCompletionGenerator', Generator)
+    monkeypatch.setattr(prompt_enhancer, 'enhancement_messages', lambda prompt: [{'role': 'user', 'content': prompt}])
+    return sent, delays, failing
+
+
+def catalogue(count):
+    return [(str(index), f"prompt {index}", None) for index in range(count)]
+
+
+def test_catalogue_lines_are_parsed_with_ids_and_errors():
+    lines = ["a fox\n", "\n", '{"id": "x7", "prompt": "a cat"}\n', '{"prompt": 3}\n', '{"prompt": "a dog"\n', "  an owl  \n"]
+    items = list(read_prompts(lines))
+    assert [(prompt_id, prompt) for prompt_id, prompt, _ in items] == [
+        ("0", "a fox"), ("x7", "a cat"), ("2", '{"prompt": 3}'), ("3", '{"prompt": "a dog"'), ("4", "an owl")]
+    assert [error is None for _, _, error in items] == [True, True, False, False, True]
+
+
+def test_results_are_written_in_input_order(completions):
+    sent, delays, failing = completions
+    delays.update({"prompt 0": 0.2, "prompt 3": 0.1})
+    failing.add("prompt 5")
+    output = Output(sent)
+    counts = asyncio.run(enhance_batch(catalogue(10), output, concurrency=4))
+    records = output.records()
+    assert [record['id'] for record in records] == [str(index) for index in range(10)]
+    assert records[0] == {'id': "0", 'prompt': "prompt 0", 'enhanced': "PROMPT 0"}
+    assert records[5] == {'id': "5", 'prompt': "prompt 5", 'error': "RuntimeError: rate limited"}
+    assert counts == {'enhanced': 9, 'failed': 1, 'skipped': 0}
+
+
+def test_completion_order_writes_results_as_they_arrive(completions):
+    sent, delays, _ = completions
+    delays["prompt 0"] = 0.2
+    output = Output(sent)
+    asyncio.run(enhance_batch(catalogue(10), output, concurrency=4, order="completion"))
+    ids = [record['id'] for record in output.records()]
+    assert sorted(ids) == sorted(str(index) for index in range(10)) and ids[-1] == "0"
+    # Nothing held prompt 0 back, so every other prompt was read before it finished
+    assert output.sent_at_write[-1] == 10
+
+
+@pytest.mark.parametrize("window", [1, 3, 6])
+def test_reading_stops_at_the_window_past_a_slow_prompt(completions, window):
+    sent, delays, _ = completions
+    delays["prompt 0"] = 0.2
+    output = Output(sent)
+    asyncio.run(enhance_batch(catalogue(30), output, concurrency=4, window=window))
+    assert [record['id'] for record in output.records()] == [str(index) for index in range(30)]
+    # While prompt 0 was outstanding, only the window's worth of prompts had been read
+    assert output.sent_at_write[0] == window
+    assert len(sent) == 30
+
+
+def test_default_window_is_four_times_the_concurrency(completions):
+    sent, delays, _ = completions
+    delays["prompt 0"] = 0.2
+    output = Output(sent)
+    asyncio.run(enhance_batch(catalogue(50), output, concurrency=3))
+    assert output.sent_at_write[0] == 12
+
+
+def test_malformed_lines_are_recorded_and_retried_on_resume(tmp_path, completions):
+    sent, _, failing = completions
+    source, output = tmp_path / "prompts.txt", tmp_path / "enhanced.jsonl"
+    source.write_text('a fox\n{"id": "cat", "prompt": "a cat"}\n{"prompt": "a dog"\nan owl\n')
+    failing.add("an owl")
+    assert run_batch(str(source), str(output), concurrency=2) == {'enhanced': 2, 'failed': 2, 'skipped': 0}
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert records[2] == {'id': "2", 'prompt': '{"prompt": "a dog"', 'error': records[2]['error']}
+    assert records[2]['error'].startswith("Malformed line: JSONDecodeError")
+    assert sent == ["a fox", "a cat", "an owl"]
+
+    # The fixed catalogue resumes: done prompts are skipped, the malformed line and the failure are retried
+    source.write_text('a fox\n{"id": "cat", "prompt": "a cat"}\n{"prompt": "a dog"}\nan owl\n')
+    failing.clear()
+    sent.clear()
+    assert run_batch(str(source), str(output), concurrency=2) == {'enhanced': 2, 'failed': 0, 'skipped': 2}
+    assert sorted(sent) == ["a dog", "an owl"]
+    assert load_checkpoint(str(output)) == {"0", "cat", "2", "3"}
+
+
+def test_checkpoints_drop_a_torn_last_line(tmp_path):
+    output = tmp_path / "enhanced.jsonl"
+    output.write_text('{"id": "0", "prompt": "a", "enhanced": "A"}\n{"id": "1", "prompt": "b", "error": "x"}\n{"id": "2", "prom')
+    assert load_checkpoint(str(output)) == {"0"}
+    assert output.read_text().endswith('"error": "x"}\n')
+    assert load_checkpoint(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_no_resume_overwrites_the_output(tmp_path, completions):
+    sent, _, _ = completions
+    source, output = tmp_path / "prompts.txt", tmp_path / "enhanced.jsonl"
+    source.write_text("a fox\n")
+    output.write_text('{"id": "0", "prompt": "a fox", "enhanced": "old"}\n')
+    run_batch(str(source), str(output), resume=False)
+    assert [json.loads(line)['enhanced'] for line in output.read_text().splitlines()] == ["A FOX"]
+    assert sent == ["a fox"]
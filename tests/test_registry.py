@@ -0,0 +1,61 @@
+"""Metric registry: dependency resolution, `--metrics` parsing and runs over a metric subset."""
+import json
+import os
+
+import pytest
+
+from src.metrics import METRICS, Metric, compare_images, parse_metric_list, required_planes, resolve_metrics
+from tests.conftest import run_main
+
+
+def names(metrics):
+    return [metric.name for metric in metrics]
+
+
+def test_dependencies_come_before_the_metrics_using_them():
+    assert names(resolve_metrics(['brisque_diff'])) == ['brisque', 'brisque_diff']
+    assert names(resolve_metrics(['entropy_diff', 'entropy', 'mse'])) == ['entropy', 'entropy_diff', 'mse']
+    everything = names(resolve_metrics())
+    assert sorted(everything) == sorted(METRICS)
+    assert all(everything.index(dependency) < everything.index(name) for name in everything for dependency in METRICS[name].depends_on)
+
+
+def test_unknown_and_circular_metrics_are_rejected(monkeypatch):
+    with pytest.raises(ValueError, match="Unknown metric 'sharpness'. Available metrics: mse"):
+        resolve_metrics(['mse', 'sharpness'])
+    monkeypatch.setitem(METRICS, 'loop_a', Metric('loop_a', None, depends_on=('loop_b',), scope='derived'))
+    monkeypatch.setitem(METRICS, 'loop_b', Metric('loop_b', None, depends_on=('loop_a',), scope='derived'))
+    with pytest.raises(ValueError, match="circular"):
+        resolve_metrics(['loop_a'])
+
+
+def test_metric_lists_parse_like_the_command_line():
+    assert parse_metric_list(None) is None and parse_metric_list("") is None and parse_metric_list(" ALL ") is None
+    assert parse_metric_list(" mse, ssim ,,") == ['mse', 'ssim']
+    with pytest.raises(ValueError):
+        parse_metric_list("mse,nope")
+
+
+def test_required_planes_are_listed_once():
+    assert required_planes(['mse', 'ssim', 'psnr']) == ['gray']
+    assert required_planes(['brisque_diff', 'edge_mse']) == ['brisque_features', 'edges']
+
+
+def test_outputs_name_both_images_of_per_image_metrics():
+    assert METRICS['mse'].outputs == ('mse',)
+    assert METRICS['entropy'].outputs == ('entropy_image1', 'entropy_image2')
+
+
+def test_compare_images_computes_only_the_selection(dataset):
+    results = compare_images(*dataset['pair0'], metrics=['brisque_diff', 'mse'])
+    assert set(results) == {'brisque_image1', 'brisque_image2', 'brisque_diff', 'mse', 'duplicate'}
+
+
+def test_metric_subset_runs_record_values_without_scores(tmp_path, dataset):
+    run_main(str(tmp_path), "results.jsonl", "--metrics", "mse,entropy_diff")
+    with open(os.path.join(str(tmp_path), "results.jsonl")) as file:
+        records = [json.loads(line) for line in file]
+    assert len(records) == len(dataset)
+    for record in records:
+        assert {'mse', 'entropy_image1', 'entropy_image2', 'entropy_diff'} <= set(record)
+        assert not {'ssim', 'vmaf', 'brisque_image1', 'score', 'summary'} & set(record)
@@ -0,0 +1,175 @@
+"""Streamed per-pair results: the JSONL writer, incremental aggregates, and resuming from a truncated results file."""
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from src.results import (JsonlResultsWriter, ResultsAggregator, RunningStats, check_resumable, load_manifest, manifest_path, open_results_writer,
+                         read_columns, read_results)
+from tests.conftest import run_main, write_pairs
+
+
+def strict_json(line):
+    """json.loads that refuses the non-standard NaN / Infinity literals."""
+    def refuse(constant):
+        raise ValueError(f"non-standard JSON constant {constant}")
+    return json.loads(line, parse_constant=refuse)
+
+
+def test_records_are_strict_json_lines(tmp_path):
+    path = str(tmp_path / "logs" / "results.jsonl")
+    with JsonlResultsWriter(path) as writer:
+        writer.write({'key': 'a', 'mse': np.float64(2.5), 'ssim': np.float32(0.5), 'psnr': math.inf, 'vmaf': None, 'flag': np.bool_(True)})
+        writer.write({'key': 'b', 'psnr': -math.inf, 'gsim': math.nan, 'count': np.int64(3)})
+    with open(path) as file:
+        records = [strict_json(line) for line in file]
+    assert records == [{'key': 'a', 'mse': 2.5, 'ssim': 0.5, 'psnr': 'inf', 'vmaf': None, 'flag': True},
+                       {'key': 'b', 'psnr': '-inf', 'gsim': 'nan', 'count': 3}]
+    with open_results_writer(path, append=True) as writer:
+        writer.write({'key': 'c'})
+    assert [record['key'] for record in read_results(path)] == ['a', 'b', 'c']
+    with pytest.raises(ValueError, match="appended"):
+        open_results_writer(str(tmp_path / "results.parquet"), append=True)
+
+
+def test_a_torn_last_line_is_dropped_and_truncated(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with open(path, "w") as file:
+        file.write('{"key": "a", "mse": 1.0}\n{"key": "b", "mse": 2.0}\n{"key": "c", "ms')
+    assert [record['key'] for record in read_results(path, repair=False)] == ['a', 'b']
+    assert os.path.getsize(path) > len('{"key": "a", "mse": 1.0}\n{"key": "b", "mse": 2.0}\n')
+    assert [record['key'] for record in read_results(path)] == ['a', 'b']
+    with open(path) as file:
+        assert file.read() == '{"key": "a", "mse": 1.0}\n{"key": "b", "mse": 2.0}\n'
+    # Appending after the repair continues on a fresh line
+    with JsonlResultsWriter(path, append=True) as writer:
+        writer.write({'key': 'c', 'mse': 3.0})
+    assert [record['key'] for record in read_results(path)] == ['a', 'b', 'c']
+    assert read_results(str(tmp_path / "missing.jsonl")) == []
+
+
+def test_columns_read_back_non_finite_strings(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with JsonlResultsWriter(path) as writer:
+        writer.write({'key': 'a', 'psnr': 30.0, 'vmaf': 90.0, 'summary': "better", 'duplicate': 'distinct', 'flag': True})
+        writer.write({'key': 'b', 'psnr': math.inf, 'vmaf': None})
+        writer.write({'key': 'c', 'psnr': -math.inf, 'vmaf': math.nan})
+    columns = read_columns(path)
+    assert set(columns) == {'psnr', 'vmaf'}
+    np.testing.assert_array_equal(columns['psnr'], [30.0, math.inf, -math.inf])
+    np.testing.assert_array_equal(columns['vmaf'], [90.0, math.nan, math.nan])
+
+
+def test_running_stats_match_numpy_and_merge():
+    rng = np.random.default_rng(0)
+    values = rng.normal(1e6, 3.0, 5000)
+    stats, first, second = RunningStats(), RunningStats(), RunningStats()
+    for index, value in enumerate(values):
+        stats.update(value)
+        (first if index < 1234 else second).update(value)
+    for value in (math.inf, math.nan, -math.inf):
+        stats.update(value)
+    # Welford keeps the variance of large, tightly spread values that sums of squares would lose
+    assert stats.count == 5000 and stats.skipped == 3
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12) and stats.std == pytest.approx(values.std(ddof=1), rel=1e-9)
+    assert (stats.min, stats.max) == (values.min(), values.max())
+    # Quantiles come from the sketch, within its 1% relative accuracy
+    assert stats.to_dict()['p50'] == pytest.approx(np.median(values), rel=0.01)
+    first.merge(second)
+    assert first.count == 5000 and first.mean == pytest.approx(stats.mean, rel=1e-12) and first.std == pytest.approx(stats.std, rel=1e-9)
+    restored = RunningStats.from_partial(json.loads(json.dumps(stats.to_partial())))
+    assert restored.to_dict() == stats.to_dict()
+    assert RunningStats().to_dict() == {'count': 0, 'skipped': 0} and math.isnan(RunningStats().variance)
+
+
+def test_aggregates_from_stored_records_match_the_live_ones(tmp_path):
+    scored = {'mse': 10.0, 'edge_mse': 50.0, 'fft_mse': 1e6, 'ssim': 0.9, 'psnr': 35.0, 'brisque_diff': -5.0, 'hist_corr': 0.9,
+              'entropy_diff': 0.1, 'ms_ssim': 0.95, 'gsim': 0.9, 'vmaf': 80.0}
+    records = [{'key': 'a', **scored, 'score': 0.9, 'summary': "better"},
+               {'key': 'b', **scored, 'mse': 20.0, 'score': 0.6, 'summary': "better"},
+               {'key': 'c', **scored, 'mse': 0.0, 'psnr': math.inf, 'vmaf': None, 'score': None, 'duplicate': 'identical'},
+               {'key': 'd', **scored, 'vmaf': math.nan, 'score': 0.7}]
+    live = ResultsAggregator()
+    path = str(tmp_path / "results.jsonl")
+    with JsonlResultsWriter(path) as writer:
+        for record in records:
+            live.update(record)
+            writer.write(record)
+    resumed = ResultsAggregator()
+    for record in read_results(path):
+        resumed.update(record)
+    assert resumed.summary() == live.summary()
+    summary = live.summary()
+    # The inf PSNR and NaN VMAF are skipped, not averaged in; only fully finite scored records reach the verdict
+    assert summary['metrics']['psnr'] == {**summary['metrics']['psnr'], 'count': 3, 'skipped': 1, 'mean': 35.0}
+    assert summary['metrics']['vmaf']['count'] == 2 and summary['metrics']['vmaf']['skipped'] == 1
+    assert summary['scored_records'] == 2 and sum(summary['score_distribution'].values()) == 2
+    assert summary['skipped_duplicates'] == {'identical': 1, 'near': 0}
+    assert live.scored_means()['mse'] == 15.0 and live.means(['mse'])['mse'] == 10.0
+
+
+def test_parquet_results_round_trip(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "results.parquet")
+    with open_results_writer(path) as writer:
+        for index in range(5):
+            writer.write({'key': f"k{index}", 'mse': np.float64(index), 'psnr': math.inf if index == 2 else 30.0 + index})
+    columns = read_columns(path)
+    np.testing.assert_array_equal(columns['mse'], np.arange(5.0))
+    assert columns['psnr'][2] == math.inf
+
+
+def test_manifests_only_resume_the_same_run(tmp_path):
+    settings = {'reference_directory': "ref", 'generated_directory': "gen", 'metrics': None}
+    assert manifest_path(str(tmp_path / "results.jsonl")) == str(tmp_path / "results.manifest.json")
+    with pytest.raises(ValueError, match="No run manifest"):
+        check_resumable(None, settings)
+    with pytest.raises(ValueError, match="metrics differ"):
+        check_resumable(dict(settings, metrics=['mse'], status='interrupted'), settings)
+    check_resumable(dict(settings, status='interrupted', completed=3), settings)
+
+
+def test_resume_after_a_crash_mid_write(tmp_path):
+    directory = str(tmp_path)
+    pairs = write_pairs(directory, 5)
+    # An identical pair, so the stored records hold an "inf" PSNR string to read back
+    shutil.copyfile(pairs['pair4'][0], pairs['pair4'][1])
+    run_main(directory, "complete.jsonl")
+    run_main(directory, "results.jsonl")
+    results_path = os.path.join(directory, "results.jsonl")
+    with open(results_path) as file:
+        lines = file.readlines()
+    assert any('"psnr": "inf"' in line for line in lines)
+
+    # A crash after two records, in the middle of writing the third
+    with open(results_path, "w") as file:
+        file.write(lines[0] + lines[-1] + lines[1][:len(lines[1]) // 2])
+    manifest = load_manifest(results_path)
+    with open(manifest_path(results_path), "w") as file:
+        json.dump(dict(manifest, status='interrupted', completed=2), file)
+
+    process = run_main(directory, "results.jsonl", "--resume")
+    assert "2 pairs already evaluated, 3 remaining" in process.stdout
+    records = read_results(results_path)
+    assert sorted(record['key'] for record in records) == sorted(pairs)
+    with open(os.path.join(directory, "results.summary.json")) as file:
+        resumed = json.load(file)
+    with open(os.path.join(directory, "complete.summary.json")) as file:
+        complete = json.load(file)
+    assert resumed['records'] == complete['records'] == 5
+    assert resumed['skipped_duplicates'] == complete['skipped_duplicates'] == {'identical': 1, 'near': 0}
+    assert resumed['score_distribution'] == complete['score_distribution']
+    for name, stats in complete['metrics'].items():
+        assert resumed['metrics'][name]['count'] == stats['count'] and resumed['metrics'][name]['skipped'] == stats['skipped'], name
+        if stats['count']:
+            assert resumed['metrics'][name]['mean'] == pytest.approx(stats['mean'], rel=1e-12), name
+    assert resumed['metrics']['psnr']['skipped'] == 1
+    assert load_manifest(results_path)['status'] == 'complete'
+
+    # A different metric selection is not resumed onto these results
+    process = run_main(directory, "results.jsonl", "--resume", "--metrics", "mse")
+    assert "Cannot resume: metrics differ" in process.stdout
+    assert len(read_results(results_path)) == 5
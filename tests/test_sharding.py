@@ -0,0 +1,129 @@
+"""Sharded runs: N `main.py --shard i/N` processes merge into the single-process summary."""
+import copy
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from merge_shards import load_partials, merge_partials
+from src.pipeline.sharding import dataset_identity, parse_shard, select_shard, shard_of
+from tests.conftest import REPO_ROOT, main_command, main_environment, run_main, write_pairs
+
+SHARDS = 3
+
+
+def assert_same(merged, single, path="summary"):
+    """Recursive equality, with floats compared to rounding: shards sum the same values in another order."""
+    if isinstance(single, dict):
+        assert set(merged) == set(single), path
+        for name in single:
+            assert_same(merged[name], single[name], f"{path}.{name}")
+    elif isinstance(single, float) and not isinstance(merged, bool):
+        assert merged == pytest.approx(single, rel=1e-9, abs=1e-12) or (math.isnan(merged) and math.isnan(single)), path
+    else:
+        assert merged == single, path
+
+
+@pytest.fixture(scope="module")
+def sharded_run(tmp_path_factory):
+    """A single-process run and a run split over SHARDS concurrent processes, on 8 pairs (one identical)."""
+    directory = str(tmp_path_factory.mktemp("sharding"))
+    pairs = write_pairs(directory, 8)
+    shutil.copyfile(pairs['pair7'][0], pairs['pair7'][1])
+    run_main(directory, "single.jsonl", "--pair-manifest", "single.pairs.json")
+    # One process per shard, all running at once, each with its own pair manifest like separate nodes
+    environment = main_environment(directory)
+    processes = [subprocess.Popen(main_command(directory, f"shard{index}.jsonl", "--shard", f"{index}/{SHARDS}",
+                                               "--pair-manifest", f"shard{index}.pairs.json"),
+                                  cwd=directory, env=environment, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                 for index in range(SHARDS)]
+    for process in processes:
+        output, _ = process.communicate(timeout=300)
+        assert process.returncode == 0, output
+    return directory
+
+
+def partial_paths(directory):
+    return [os.path.join(directory, f"shard{index}.partial.json") for index in range(SHARDS)]
+
+
+def test_every_pair_lands_in_exactly_one_shard(sharded_run):
+    keys = []
+    for index in range(SHARDS):
+        with open(os.path.join(sharded_run, f"shard{index}.jsonl")) as file:
+            shard_keys = [json.loads(line)['key'] for line in file]
+        assert shard_keys and all(shard_of(key, SHARDS) == index for key in shard_keys)
+        keys.extend(shard_keys)
+    assert sorted(keys) == [f"pair{index}" for index in range(8)]
+
+
+def test_merged_shards_match_the_single_process_summary(sharded_run):
+    output = os.path.join(sharded_run, "merged.summary.json")
+    process = subprocess.run([sys.executable, os.path.join(REPO_ROOT, "merge_shards.py"), *partial_paths(sharded_run), "--output", output],
+                             cwd=sharded_run, capture_output=True, text=True, timeout=120)
+    assert process.returncode == 0, process.stdout + process.stderr
+    with open(output) as file:
+        merged = json.load(file)
+    with open(os.path.join(sharded_run, "single.summary.json")) as file:
+        single = json.load(file)
+    assert merged['records'] == 8 and merged['skipped_duplicates']['identical'] == 1
+    assert_same(merged, single)
+
+
+def test_shards_record_the_same_dataset_identity(sharded_run):
+    identities = {json.dumps(partial['dataset'], sort_keys=True) for _, partial in load_partials(partial_paths(sharded_run))}
+    assert identities == {json.dumps(dataset_identity(f"pair{index}" for index in range(8)), sort_keys=True)}
+
+
+def test_merge_rejects_a_duplicate_shard(sharded_run):
+    partials = load_partials(partial_paths(sharded_run))
+    with pytest.raises(ValueError, match="more than once"):
+        merge_partials(partials + partials[:1])
+
+
+def test_merge_rejects_mismatched_shard_counts(sharded_run):
+    partials = load_partials(partial_paths(sharded_run))
+    path, partial = partials[-1]
+    partial = copy.deepcopy(partial)
+    partial['shard'] = [0, SHARDS + 1]
+    with pytest.raises(ValueError, match="out of"):
+        merge_partials(partials[:-1] + [(path, partial)])
+
+
+@pytest.mark.parametrize("setting, value", [('metrics', ['mse']), ('metrics_version', 0), ('resample', 'smaller'),
+                                            ('dataset', {'pairs': 9, 'keys_sha256': '0' * 64})])
+def test_merge_rejects_mismatched_settings(sharded_run, setting, value):
+    partials = load_partials(partial_paths(sharded_run))
+    path, partial = partials[-1]
+    partial = copy.deepcopy(partial)
+    partial[setting] = value
+    with pytest.raises(ValueError, match=setting):
+        merge_partials(partials[:-1] + [(path, partial)])
+
+
+def test_merge_ignores_directory_paths(sharded_run):
+    partials = load_partials(partial_paths(sharded_run))
+    path, partial = partials[-1]
+    partial = dict(partial, reference_directory="/mnt/elsewhere/ref", generated_directory="/mnt/elsewhere/gen")
+    assert merge_partials(partials[:-1] + [(path, partial)]).records == 8
+
+
+def test_merge_warns_about_missing_shards(sharded_run, capsys):
+    aggregator = merge_partials(load_partials(partial_paths(sharded_run)[:-1]))
+    assert f"of {SHARDS} are missing" in capsys.readouterr().out
+    assert 0 < aggregator.records < 8
+
+
+def test_shard_specs_and_partition():
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("4/4", "-1/2", "1", "a/b", "0/0"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+    keys = [f"key{index}" for index in range(200)]
+    shards = [select_shard(keys, index, 4) for index in range(4)]
+    assert sorted(key for shard in shards for key in shard) == sorted(keys)
+    assert all(shards)
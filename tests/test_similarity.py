@@ -0,0 +1,158 @@
+"""Similarity ranking: perceptual-hash index distances, ranking order and incremental index updates."""
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from sort_by_similarity import sort_by_similarity
+from src.metrics.perceptual_hash import dhash, image_signature, phash, thumbnail_vector
+from src.metrics.similarity_index import DISTANCES, SimilarityIndex
+
+
+def smooth_image(seed, size=(192, 160)):
+    """A smooth random RGB image, so small hashes and thumbnails see structure rather than noise."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (6, 5, 3), dtype=np.uint8)
+    return Image.fromarray(coarse).resize(size, Image.BICUBIC)
+
+
+@pytest.fixture
+def images(tmp_path):
+    """
+    A reference image, progressively noisier versions of it, a resized copy and unrelated images.
+
+    Returns:
+        tuple: (reference path, image directory, names of the noisy versions from least to most noisy).
+    """
+    reference = smooth_image(0)
+    reference_path = str(tmp_path / "reference.png")
+    reference.save(reference_path)
+    directory = tmp_path / "images"
+    (directory / "nested").mkdir(parents=True)
+    rng = np.random.default_rng(1)
+    noisy = []
+    for level in (5, 20, 45, 80):
+        pixels = np.asarray(reference, dtype=np.float64) + rng.normal(0, level, (160, 192, 3))
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(directory / f"noise{level:02d}.png")
+        noisy.append(f"noise{level:02d}.png")
+    reference.resize((96, 80), Image.LANCZOS).save(directory / "nested" / "small.png")
+    reference.save(directory / "copy.png")
+    for seed in (2, 3, 4):
+        smooth_image(seed).filter(ImageFilter.GaussianBlur(2)).save(directory / f"other{seed}.png")
+    (directory / "notes.txt").write_text("not an image")
+    return reference_path, str(directory), noisy
+
+
+def brute_force_distances(reference, paths, by):
+    """Distances computed one image at a time from unpacked bits, as a check on the vectorized index."""
+    query = image_signature(reference)
+    distances = []
+    for path in paths:
+        signature = image_signature(path)
+        phash_bits = np.sum(np.unpackbits(query['phash']) != np.unpackbits(signature['phash']))
+        dhash_bits = np.sum(np.unpackbits(query['dhash']) != np.unpackbits(signature['dhash']))
+        vector = np.linalg.norm(query['vector'].astype(np.float64) - signature['vector'])
+        distances.append({'phash': phash_bits, 'dhash': dhash_bits, 'vector': vector, 'combined': (phash_bits / 64 + vector / 2) / 2}[by])
+    return np.array(distances, dtype=np.float64)
+
+
+def test_signatures_are_compact_and_brightness_invariant():
+    image = smooth_image(5)
+    assert phash(image).shape == dhash(image).shape == (8,) and phash(image).dtype == np.uint8
+    vector = thumbnail_vector(image)
+    assert vector.shape == (256,) and vector.dtype == np.float32
+    assert abs(float(vector.mean())) < 1e-6 and np.linalg.norm(vector) == pytest.approx(1, rel=1e-5)
+    brighter = Image.fromarray(np.clip(np.asarray(image, dtype=np.int16) // 2 + 60, 0, 255).astype(np.uint8))
+    assert np.linalg.norm(thumbnail_vector(brighter) - vector) < 0.05
+    assert np.array_equal(image_signature(image)['phash'], phash(image))
+
+
+@pytest.mark.parametrize("by", DISTANCES)
+def test_index_distances_match_a_brute_force_scan(tmp_path, images, by):
+    reference, directory, _ = images
+    index = SimilarityIndex(str(tmp_path / "index.npz"))
+    index.update(directory)
+    distances = index.distances(index.signature(reference), by=by)
+    np.testing.assert_allclose(distances, brute_force_distances(reference, index.paths.tolist(), by), rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("by", DISTANCES)
+def test_rankings_put_closer_images_first(tmp_path, images, by):
+    reference, directory, noisy = images
+    ranking = sort_by_similarity(reference, directory, str(tmp_path / "index.npz"), by=by)
+    names = [os.path.relpath(path, directory) for path, _ in ranking]
+    distances = [distance for _, distance in ranking]
+    assert len(ranking) == 9 and "notes.txt" not in names
+    assert names[0] == "copy.png" and distances[0] == 0
+    assert distances == sorted(distances)
+    # Every version of the reference ranks ahead of the unrelated images
+    assert set(names[:6]) == {"copy.png", os.path.join("nested", "small.png"), *noisy}
+    if by != 'dhash':
+        # dHash is too coarse to order the noise levels
+        assert [name for name in names if name in noisy] == noisy
+
+
+@pytest.mark.parametrize("by", DISTANCES)
+def test_top_k_is_the_head_of_the_full_ranking(tmp_path, images, by):
+    reference, directory, _ = images
+    index_path = str(tmp_path / "index.npz")
+    full = sort_by_similarity(reference, directory, index_path, by=by)
+    for k in (1, 3, 10, 50):
+        assert sort_by_similarity(reference, directory, index_path, top_k=k, by=by) == full[:k]
+
+
+def test_updates_only_decode_new_and_changed_images(tmp_path, images, monkeypatch):
+    reference, directory, _ = images
+    index_path = str(tmp_path / "index.npz")
+    index = SimilarityIndex(index_path)
+    assert index.update(directory) == (9, 0)
+    index.save()
+
+    decoded = []
+    signature = SimilarityIndex.signature
+    monkeypatch.setattr(SimilarityIndex, 'signature', lambda self, image: decoded.append(image) or signature(self, image))
+    index = SimilarityIndex(index_path)
+    assert len(index) == 9 and index.update(directory) == (0, 0) and not decoded
+
+    changed = os.path.join(directory, "other2.png")
+    smooth_image(0).save(changed)
+    os.utime(changed, ns=(os.stat(changed).st_atime_ns, os.stat(changed).st_mtime_ns + 10 ** 9))
+    os.remove(os.path.join(directory, "other3.png"))
+    smooth_image(9).save(os.path.join(directory, "nested", "new.png"))
+    assert index.update(directory) == (2, 1)
+    assert sorted(decoded) == sorted([os.path.abspath(changed), os.path.abspath(os.path.join(directory, "nested", "new.png"))])
+    index.save()
+
+    # The re-indexed file now ranks as a copy of the reference, and the removed one is gone
+    ranking = dict(sort_by_similarity(reference, directory, index_path))
+    assert ranking[os.path.abspath(changed)] == 0
+    assert os.path.abspath(os.path.join(directory, "other3.png")) not in ranking and len(ranking) == 9
+
+
+def test_rankings_are_limited_to_the_directory(tmp_path, images):
+    reference, directory, _ = images
+    other = tmp_path / "images-other"
+    other.mkdir()
+    smooth_image(0).save(other / "copy.png")
+    index_path = str(tmp_path / "index.npz")
+    sort_by_similarity(reference, directory, index_path)
+    ranking = sort_by_similarity(reference, str(other), index_path)
+    # The shared index holds both trees, but `images-other` is not under `images` despite the common prefix
+    assert len(SimilarityIndex(index_path)) == 10
+    assert [path for path, _ in ranking] == [str(other / "copy.png")]
+    assert [path for path, _ in sort_by_similarity(reference, directory, index_path, top_k=20)] == \
+        [path for path, _ in sort_by_similarity(reference, directory, index_path)]
+
+
+def test_indexes_with_other_settings_are_rebuilt(tmp_path, images):
+    _, directory, _ = images
+    index_path = str(tmp_path / "index.npz")
+    index = SimilarityIndex(index_path)
+    index.update(directory)
+    index.save()
+    rebuilt = SimilarityIndex(index_path, hash_size=16)
+    assert len(rebuilt) == 0 and rebuilt.update(directory) == (9, 0)
+    assert rebuilt.phashes.shape == (9, 32)
+    with pytest.raises(ValueError, match="Unknown distance"):
+        rebuilt.distances(rebuilt.signature(smooth_image(0)), by='ssim')
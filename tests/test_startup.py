@@ -0,0 +1,73 @@
+"""Startup budget of the command line entry points: heavy dependencies stay lazy and imports stay fast."""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import pytest
+
+from tests.conftest import REPO_ROOT
+
+# Entry points as (label, script path or None for `import main`, arguments)
+ENTRY_POINTS = (
+    ("import main", None, ()),
+    ("main.py --help", "main.py", ("--help",)),
+    ("prompt_enhancer.py --help", os.path.join("src", "easy_prompt_enhancer", "prompt_enhancer.py"), ("--help",)),
+    ("results_db.py --help", "results_db.py", ("--help",)),
+    ("merge_shards.py --help", "merge_shards.py", ("--help",)),
+    ("sort_by_similarity.py --help", "sort_by_similarity.py", ("--help",)),
+)
+
+# Modules that cost seconds to import and must only load once a metric or API call needs them
+HEAVY_MODULES = ("torch", "cv2", "skimage", "scipy", "pytorch_msssim", "brisque", "openai", "aiohttp", "pandas", "pyarrow")
+
+# Median import time allowed per entry point; generous, since it only has to catch an eager heavy import
+BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', 1000))
+
+# Runs the entry point like the command line would, then reports the top-level modules it loaded
+_PROBE = """
+import json, runpy, sys
+script, arguments = sys.argv[1], sys.argv[2:]
+try:
+    if script == "-":
+        import main
+    else:
+        sys.argv = [script, *arguments]
+        runpy.run_path(script, run_name="__main__")
+except SystemExit:
+    pass
+print(json.dumps(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+
+def _run(script, arguments, *flags):
+    return subprocess.run([sys.executable, *flags, "-c", _PROBE, script or "-", *arguments], cwd=REPO_ROOT,
+                          env={**os.environ, 'PYTHONPATH': REPO_ROOT}, capture_output=True, text=True, timeout=120)
+
+
+def import_time_ms(script, arguments):
+    """Sum of the top-level cumulative import times `python -X importtime` reports for one run."""
+    total_us = 0
+    for line in _run(script, arguments, "-X", "importtime").stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented under their parent and already counted in its cumulative time
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1000
+
+
+@pytest.mark.parametrize("label, script, arguments", ENTRY_POINTS, ids=[label for label, _, _ in ENTRY_POINTS])
+def test_entry_point_does_not_import_heavy_modules(label, script, arguments):
+    process = _run(script, arguments)
+    assert process.returncode == 0, process.stderr
+    modules = json.loads(process.stdout.strip().splitlines()[-1])
+    assert not sorted(set(modules) & set(HEAVY_MODULES)), f"{label} imports heavy modules at startup"
+
+
+@pytest.mark.parametrize("label, script, arguments", ENTRY_POINTS[:3], ids=[label for label, _, _ in ENTRY_POINTS[:3]])
+def test_entry_point_imports_within_budget(label, script, arguments):
+    median_ms = statistics.median(import_time_ms(script, arguments) for _ in range(3))
+    assert median_ms <= BUDGET_MS, f"{label} took {median_ms:.0f} ms to import, over the {BUDGET_MS:.0f} ms budget"
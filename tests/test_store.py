@@ -0,0 +1,179 @@
+"""SQLite results store: aggregates match NumPy over the finite values, filters and groupings, imports and the query CLI."""
+import math
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from src.results import ResultsStore, file_fingerprint, parse_since, read_results
+from tests.conftest import REPO_ROOT, run_main
+
+DAY = 86400
+# Three runs on three UTC days
+RUN_TIMES = [1_700_000_000.0, 1_700_000_000.0 + DAY, 1_700_000_000.0 + 3 * DAY]
+
+
+@pytest.fixture
+def stored(tmp_path):
+    """
+    A store with three runs of 300 random records each, with infinite, NaN and missing values mixed in.
+    Returns the store and a flat list of `(run id, created_at, key, value or None if not stored)`.
+    """
+    rng = np.random.default_rng(0)
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    rows = []
+    for run, created_at in enumerate(RUN_TIMES):
+        run_id = store.start_run({'run': run}, started_at=created_at)
+        with store.writer(run_id, batch_size=64, created_at=created_at) as writer:
+            for index in range(300):
+                key = f"{rng.choice(['cat', 'dog', 'owl'])}_{index % 7}"
+                value = float(rng.normal(30, 5))
+                draw = rng.uniform()
+                if draw < 0.05:
+                    value = math.inf
+                elif draw < 0.08:
+                    value = -math.inf
+                elif draw < 0.11:
+                    value = math.nan
+                record = {'key': key, 'reference': f"{key}_base.png", 'generated': f"{key}_improved.png", 'summary': "better"}
+                if 0.11 <= draw < 0.14:
+                    # Missing metrics are not stored at all
+                    record['psnr'] = None
+                    value = None
+                elif draw < 0.02:
+                    # As read back from a JSONL results file
+                    record['psnr'] = "inf"
+                else:
+                    record['psnr'] = np.float64(value)
+                record['ssim'] = float(rng.uniform())
+                writer.write(record)
+                rows.append((run_id, created_at, key, value))
+    yield store, rows
+    store.close()
+
+
+def expected(values):
+    values = np.array([value for value in values if value is not None], dtype=np.float64)
+    finite = values[np.isfinite(values)]
+    return {'count': len(finite), 'mean': finite.mean(), 'min': finite.min(), 'max': finite.max(), 'sum': finite.sum(),
+            'non_finite': len(values) - len(finite)}
+
+
+def assert_row(row, values):
+    reference = expected(values)
+    assert row['count'] == reference['count'] and row['non_finite'] == reference['non_finite']
+    for name in ('mean', 'min', 'max', 'sum'):
+        if name in row:
+            assert row[name] == pytest.approx(reference[name], rel=1e-12), name
+
+
+def test_aggregates_cover_finite_values_only(stored):
+    store, rows = stored
+    [row] = store.aggregate('psnr', aggregates=('count', 'mean', 'min', 'max', 'sum'))
+    assert_row(row, [value for _, _, _, value in rows])
+    assert row['non_finite'] > 0 and math.isfinite(row['max']) and math.isfinite(row['min'])
+    assert store.metrics() == ['psnr', 'ssim']
+
+
+@pytest.mark.parametrize("group_by", ['key', 'run', 'day'])
+def test_groupings(stored, group_by):
+    store, rows = stored
+    position = {'key': 2, 'run': 0, 'day': 1}[group_by]
+    groups = {}
+    for row in rows:
+        label = time.strftime('%Y-%m-%d', time.gmtime(row[1])) if group_by == 'day' else row[position]
+        groups.setdefault(label, []).append(row[3])
+    result = store.aggregate('psnr', group_by=group_by)
+    assert [row['group'] for row in result] == sorted(groups)
+    for row in result:
+        assert_row(row, groups[row['group']])
+
+
+def test_filters(stored):
+    store, rows = stored
+    [row] = store.aggregate('psnr', key_pattern='cat_*')
+    assert_row(row, [value for _, _, key, value in rows if key.startswith('cat_')])
+    [row] = store.aggregate('psnr', key_pattern='*_[12]')
+    assert_row(row, [value for _, _, key, value in rows if key[-1] in '12'])
+    [row] = store.aggregate('psnr', since=RUN_TIMES[1])
+    assert_row(row, [value for _, created_at, _, value in rows if created_at >= RUN_TIMES[1]])
+    [row] = store.aggregate('psnr', since=RUN_TIMES[0], until=RUN_TIMES[2])
+    assert_row(row, [value for _, created_at, _, value in rows if created_at < RUN_TIMES[2]])
+    [row] = store.aggregate('psnr', run_id=2, key_pattern='owl*')
+    assert_row(row, [value for run_id, _, key, value in rows if run_id == 2 and key.startswith('owl')])
+    # GLOB is case-sensitive, as documented
+    assert store.aggregate('psnr', key_pattern='CAT*') == []
+    assert store.aggregate('psnr', since=RUN_TIMES[2] + 1) == []
+    assert store.aggregate('vmaf') == []
+
+
+def test_bad_queries_are_rejected(stored):
+    store, _ = stored
+    with pytest.raises(ValueError, match="Unknown aggregates: median"):
+        store.aggregate('psnr', aggregates=('mean', 'median'))
+    with pytest.raises(ValueError, match="Unknown grouping 'week'"):
+        store.aggregate('psnr', group_by='week')
+    [row] = store.aggregate('ssim', aggregates=('mean',))
+    assert set(row) == {'mean', 'non_finite'}
+
+
+def test_runs_are_listed_with_their_pairs(stored):
+    store, _ = stored
+    runs = store.runs()
+    assert [(run['id'], run['pairs'], run['settings']) for run in runs] == [(1, 300, {'run': 0}), (2, 300, {'run': 1}), (3, 300, {'run': 2})]
+    assert [run['started_at'] for run in runs] == RUN_TIMES
+
+
+def test_images_are_stored_once_by_content(tmp_path, dataset):
+    reference, generated = dataset['pair0']
+    fingerprint = file_fingerprint(reference)
+    assert fingerprint[1:] == (os.path.getsize(reference), 240, 200)
+    # A hash computed during evaluation is used as given
+    assert file_fingerprint(reference, "abc")[0] == "abc"
+    with ResultsStore(str(tmp_path / "results.sqlite")) as store:
+        with store.writer(store.start_run({})) as writer:
+            for _ in range(3):
+                writer.write({'key': 'pair0', 'mse': 1.0}, reference, generated)
+        images = store._connection.execute("SELECT content_hash, size_bytes, width, height FROM images ORDER BY id").fetchall()
+    assert images == [fingerprint, file_fingerprint(generated)]
+
+
+def test_relative_and_absolute_times():
+    now = 1_700_000_000.0
+    assert parse_since("7d", now=now) == now - 7 * DAY
+    assert parse_since(" 1.5h ", now=now) == now - 5400
+    assert parse_since("2w", now=now) == now - 14 * DAY
+    assert parse_since("2024-05-01") == time.mktime((2024, 5, 1, 0, 0, 0, 0, 0, -1))
+    assert parse_since("2024-05-01T12:30:00") == time.mktime((2024, 5, 1, 12, 30, 0, 0, 0, -1))
+    with pytest.raises(ValueError, match="Cannot read 'yesterday'"):
+        parse_since("yesterday")
+
+
+def results_db(store_path, *arguments):
+    return subprocess.run([sys.executable, os.path.join(REPO_ROOT, "results_db.py"), "--store", store_path, *arguments],
+                          cwd=REPO_ROOT, capture_output=True, text=True, timeout=120)
+
+
+def test_run_stores_and_imports_agree(tmp_path, dataset):
+    directory = str(tmp_path)
+    run_main(directory, "results.jsonl", "--store", "live.sqlite")
+    imported = os.path.join(directory, "imported.sqlite")
+    process = results_db(imported, "import", os.path.join(directory, "*.jsonl"))
+    assert process.returncode == 0 and f"Run 1: {len(dataset)} pairs" in process.stdout
+    records = read_results(os.path.join(directory, "results.jsonl"))
+    with ResultsStore(os.path.join(directory, "live.sqlite")) as live, ResultsStore(imported) as store:
+        for metric in ('ssim', 'psnr', 'vmaf', 'score', 'brisque_diff'):
+            [row] = store.aggregate(metric, aggregates=('count', 'mean', 'min', 'max', 'sum'))
+            assert_row(row, [float(record[metric]) for record in records])
+            assert live.aggregate(metric, aggregates=('count', 'sum')) == [{key: row[key] for key in ('count', 'sum', 'non_finite')}]
+        # Imported images are fingerprinted from the directories in the run's manifest
+        assert store._connection.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 2 * len(dataset)
+
+    process = results_db(imported, "query", "ssim", "--group-by", "key")
+    assert process.returncode == 0 and f"{len(dataset)} values of ssim" in process.stdout
+    assert all(key in process.stdout for key in dataset)
+    process = results_db(imported, "query", "sharpness")
+    assert process.returncode == 2 and "No stored metric 'sharpness'" in process.stderr
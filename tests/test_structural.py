@@ -0,0 +1,90 @@
+"""Stacked SSIM, MS-SSIM and GSIM: the same values as the per-pair calculate_* calls, for every batch layout."""
+import numpy as np
+import pytest
+
+from src.metrics import STRUCTURAL_METRICS, calculate_gsim, calculate_ms_ssim, calculate_ssim, compare_images, structural_similarity_batch
+from src.metrics import structural
+from src.pipeline import EvaluationOptions, evaluate_batch
+from tests.conftest import FAKE_FFMPEG, synthetic_pair
+
+PER_PAIR = {'ssim': calculate_ssim, 'ms_ssim': calculate_ms_ssim, 'gsim': calculate_gsim}
+# SSIM and GSIM are computed in float64 either way; MS-SSIM runs in float32 torch, where batching changes the summation order
+TOLERANCE = {'ssim': dict(rel=1e-10, abs=1e-12), 'gsim': dict(rel=1e-8, abs=1e-12), 'ms_ssim': dict(rel=1e-5, abs=1e-6)}
+
+
+def gray_pairs(sizes, seed=0):
+    """Grayscale `(base, improved)` uint8 arrays of the given `(width, height)` sizes."""
+    pairs = []
+    for index, size in enumerate(sizes):
+        base, improved = synthetic_pair(*size, seed=seed + index)
+        pairs.append((np.array(base.convert("L")), np.array(improved.convert("L"))))
+    return pairs
+
+
+def assert_per_pair_values(pairs, results, metrics=STRUCTURAL_METRICS):
+    for (image1, image2), values in zip(pairs, results):
+        assert values is not None and set(values) == set(metrics)
+        for name in metrics:
+            assert values[name] == pytest.approx(PER_PAIR[name](image1, image2), **TOLERANCE[name]), name
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 4, 16])
+def test_stacked_values_match_per_pair_calls(chunk_size):
+    # Two sizes interleaved, so pairs are regrouped by shape and chunks of a group are not contiguous in the input
+    pairs = gray_pairs([(240, 200), (320, 176)] * 3)
+    assert_per_pair_values(pairs, structural_similarity_batch(pairs, chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("metrics", [['ssim'], ['gsim'], ['ms_ssim'], ['gsim', 'ssim']])
+def test_metric_subsets(metrics):
+    pairs = gray_pairs([(240, 200)] * 2, seed=5)
+    assert_per_pair_values(pairs, structural_similarity_batch(pairs, metrics), metrics)
+    assert structural_similarity_batch(pairs, ['mse']) == [None, None]
+
+
+def test_unbatchable_pairs_are_left_to_the_per_pair_path():
+    small = gray_pairs([(150, 130)], seed=7)
+    mismatched = [(gray_pairs([(240, 200)], seed=8)[0][0], gray_pairs([(200, 240)], seed=9)[0][1])]
+    color = [tuple(np.array(image) for image in synthetic_pair(240, 200, seed=10))]
+    pairs = gray_pairs([(240, 200)], seed=11)
+    results = structural_similarity_batch(small + mismatched + color + pairs)
+    assert results[:3] == [None, None, None]
+    assert_per_pair_values(pairs, results[3:])
+    # Too small for MS-SSIM's four downsamplings, but fine for SSIM and GSIM
+    assert_per_pair_values(small, structural_similarity_batch(small, ['ssim', 'gsim']), ['ssim', 'gsim'])
+
+
+def test_float32_planes_stay_close():
+    pairs = gray_pairs([(240, 200)] * 3, seed=12)
+    exact = structural_similarity_batch(pairs, ['ssim', 'gsim'])
+    bounded = structural_similarity_batch(pairs, ['ssim', 'gsim'], dtype=np.float32)
+    for values, bounded_values in zip(exact, bounded):
+        assert bounded_values['ssim'] == pytest.approx(values['ssim'], abs=1e-4)
+        assert bounded_values['gsim'] == pytest.approx(values['gsim'], abs=1e-6)
+
+
+def test_failed_chunks_fall_back(monkeypatch):
+    pairs = gray_pairs([(240, 200)] * 2, seed=13)
+
+    def fail(*args):
+        raise RuntimeError("out of memory")
+
+    monkeypatch.setattr(structural, '_score_group', fail)
+    assert structural_similarity_batch(pairs) == [None, None]
+
+
+def test_batched_runs_give_the_per_pair_values(dataset, tmp_path):
+    from PIL import Image
+    # A pair of another size, stacked in a group of its own
+    base, improved = synthetic_pair(320, 176, seed=9)
+    dataset['wide'] = (str(tmp_path / "wide_base.png"), str(tmp_path / "wide_improved.png"))
+    base.save(dataset['wide'][0])
+    improved.save(dataset['wide'][1])
+    batch = [(key, *paths) for key, paths in dataset.items()]
+    results = dict(evaluate_batch(batch, EvaluationOptions(ffmpeg_path=FAKE_FFMPEG, batch_size=len(batch))))
+    for key, (reference, generated) in dataset.items():
+        gray1, gray2 = (np.array(Image.open(path).convert("L")) for path in (reference, generated))
+        single = compare_images(reference, generated, metrics=list(STRUCTURAL_METRICS))
+        for name in STRUCTURAL_METRICS:
+            assert results[key][name] == pytest.approx(PER_PAIR[name](gray1, gray2), **TOLERANCE[name]), (key, name)
+            assert results[key][name] == pytest.approx(single[name], **TOLERANCE[name]), (key, name)
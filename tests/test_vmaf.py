@@ -0,0 +1,142 @@
+"""VmafEngine batching against the bundled fake ffmpeg: ffconcat batches, JSON frame logs, retries and unscored pairs."""
+import json
+import os
+import stat
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.metrics.metric_calculations import calculate_vmaf
+from src.metrics.vmaf import VmafEngine, _concat_list, _frame_scores
+from tests.conftest import FAKE_FFMPEG, synthetic_pair, write_pairs
+
+# Runs the fake ffmpeg, recording each invocation's concat lists; can drop a frame from the JSON log
+_RECORDING_FFMPEG = """#!{python}
+import json, os, re, runpy, sys
+arguments = sys.argv[1:]
+lists = [arguments[index + 1] for index, argument in enumerate(arguments) if argument == "-i"]
+frames = [[line[5:].strip().strip("'") for line in open(path) if line.startswith("file ")] for path in lists]
+with open({calls!r}, "a") as file:
+    file.write(json.dumps(frames) + "\\n")
+sys.argv = [{fake!r}] + arguments
+try:
+    runpy.run_path({fake!r}, run_name="__main__")
+except SystemExit as exit:
+    if exit.code:
+        raise
+drop = os.environ.get("VMAF_TEST_DROP_FRAME")
+log_path = re.search(r"log_path='?([^':]+)'?", " ".join(arguments))
+if drop is not None and log_path:
+    with open(log_path.group(1)) as file:
+        log = json.load(file)
+    log["frames"] = [frame for frame in log["frames"] if frame["frameNum"] != int(drop)]
+    with open(log_path.group(1), "w") as file:
+        json.dump(log, file)
+"""
+
+
+@pytest.fixture
+def ffmpeg(tmp_path):
+    """A recording ffmpeg: `(path, calls)`, where `calls()` lists the reference frames of every invocation so far."""
+    calls = tmp_path / "calls.jsonl"
+    path = tmp_path / "ffmpeg"
+    path.write_text(_RECORDING_FFMPEG.format(python=sys.executable, calls=str(calls), fake=FAKE_FFMPEG))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+
+    def recorded():
+        if not calls.exists():
+            return []
+        return [json.loads(line)[0] for line in calls.read_text().splitlines()]
+    return str(path), recorded
+
+
+def expected_score(reference, distorted):
+    # The fake ffmpeg's score: 100 minus the mean absolute grayscale difference
+    reference = np.asarray(Image.open(reference).convert("L"), dtype=np.float32)
+    distorted = np.asarray(Image.open(distorted).convert("L"), dtype=np.float32)
+    return max(0.0, 100.0 - float(np.abs(reference - distorted).mean()))
+
+
+def pair_list(pairs):
+    return [(reference, distorted) for reference, distorted in pairs.values()]
+
+
+def test_pairs_are_batched_into_ffconcat_streams(tmp_path, ffmpeg):
+    path, calls = ffmpeg
+    pairs = pair_list(write_pairs(str(tmp_path), 5))
+    scores = VmafEngine(ffmpeg_path=path, batch_size=2).score_pairs(pairs)
+    assert [len(frames) for frames in calls()] == [2, 2, 1]
+    assert [frame for frames in calls() for frame in frames] == [os.path.abspath(reference) for reference, _ in pairs]
+    assert scores == pytest.approx([expected_score(*pair) for pair in pairs], abs=1e-5)
+
+
+def test_pairs_are_grouped_by_size(tmp_path, ffmpeg):
+    path, calls = ffmpeg
+    pairs = pair_list(write_pairs(str(tmp_path / "small"), 2)) + pair_list(write_pairs(str(tmp_path / "large"), 2, size=(320, 240)))
+    pairs = [pairs[0], pairs[2], pairs[1], pairs[3]]
+    scores = VmafEngine(ffmpeg_path=path, batch_size=8).score_pairs(pairs)
+    assert sorted(len(frames) for frames in calls()) == [2, 2]
+    assert scores == pytest.approx([expected_score(*pair) for pair in pairs], abs=1e-5)
+
+
+def test_failed_batch_is_retried_pair_by_pair(tmp_path, ffmpeg):
+    path, calls = ffmpeg
+    pairs = pair_list(write_pairs(str(tmp_path), 4))
+    # A truncated file still has a readable header, so only ffmpeg's decode fails on it
+    with open(pairs[2][1], 'rb') as file:
+        data = file.read()
+    with open(pairs[2][1], 'wb') as file:
+        file.write(data[:len(data) // 2])
+    scores = VmafEngine(ffmpeg_path=path, batch_size=8).score_pairs(pairs)
+    assert [len(frames) for frames in calls()] == [4, 1, 1, 1, 1]
+    assert scores[2] is None
+    assert [scores[index] for index in (0, 1, 3)] == pytest.approx([expected_score(*pairs[index]) for index in (0, 1, 3)], abs=1e-5)
+
+
+def test_mismatched_sizes_get_none_not_zero(tmp_path, ffmpeg):
+    path, calls = ffmpeg
+    pairs = pair_list(write_pairs(str(tmp_path), 2))
+    small = str(tmp_path / "small.png")
+    synthetic_pair(200, 180)[1].save(small)
+    scores = VmafEngine(ffmpeg_path=path).score_pairs([pairs[0], (pairs[1][0], small)])
+    assert scores[1] is None
+    assert scores[0] == pytest.approx(expected_score(*pairs[0]), abs=1e-5)
+    # The mismatched pair never reaches ffmpeg, which would have scored it 0
+    assert [len(frames) for frames in calls()] == [1]
+
+
+def test_unreadable_pairs_and_missing_ffmpeg_get_none(tmp_path):
+    pairs = pair_list(write_pairs(str(tmp_path), 2))
+    assert VmafEngine(ffmpeg_path=FAKE_FFMPEG).score_pairs([(pairs[0][0], str(tmp_path / "missing.png")), pairs[1]])[0] is None
+    assert VmafEngine(ffmpeg_path=str(tmp_path / "no-ffmpeg")).score_pairs(pairs) == [None, None]
+
+
+def test_frame_missing_from_the_log_gets_none(tmp_path, ffmpeg, monkeypatch):
+    path, _ = ffmpeg
+    monkeypatch.setenv("VMAF_TEST_DROP_FRAME", "1")
+    pairs = pair_list(write_pairs(str(tmp_path), 3))
+    scores = VmafEngine(ffmpeg_path=path).score_pairs(pairs)
+    assert scores[1] is None and None not in (scores[0], scores[2])
+
+
+def test_frame_scores_parse_both_log_formats():
+    libvmaf2 = {'frames': [{'frameNum': 1, 'metrics': {'vmaf': 80.5}}, {'frameNum': 0, 'metrics': {'vmaf': 90}}]}
+    assert _frame_scores(libvmaf2) == {0: 90.0, 1: 80.5}
+    libvmaf1 = {'frames': [{'VMAF_score': 70.25}, {'VMAF_score': 60}]}
+    assert _frame_scores(libvmaf1) == {0: 70.25, 1: 60.0}
+    assert _frame_scores({'frames': [{'frameNum': 0, 'metrics': {'psnr': 30}}]}) == {}
+    assert _frame_scores({}) == {}
+
+
+def test_concat_list_quotes_paths(tmp_path):
+    listing = _concat_list([str(tmp_path / "it's.png")])
+    assert listing.splitlines() == ["ffconcat version 1.0", f"file '{tmp_path}/it'\\''s.png'", "duration 1"]
+
+
+def test_calculate_vmaf_scores_one_pair(tmp_path, monkeypatch):
+    monkeypatch.setenv("FFMPEG_PATH", FAKE_FFMPEG)
+    reference, distorted = pair_list(write_pairs(str(tmp_path), 1))[0]
+    assert calculate_vmaf(reference, distorted) == pytest.approx(expected_score(reference, distorted), abs=1e-5)
+    assert calculate_vmaf(reference, reference) == pytest.approx(100.0)
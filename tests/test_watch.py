@@ -0,0 +1,197 @@
+"""Watch mode: pairs are reported once both files have settled, and a watching run evaluates pairs as they appear."""
+import json
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+from src.pipeline import watch
+from src.pipeline.watch import PairWatcher
+from tests.conftest import main_command, main_environment, synthetic_pair
+
+
+class Clock:
+    """Stands in for the `time` module of the watcher: monotonic time advances only when told to."""
+
+    def __init__(self):
+        self.wall_start = time.time()
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.wall_start + self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(watch, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def directories(tmp_path):
+    reference, generated = tmp_path / "ref", tmp_path / "gen"
+    reference.mkdir()
+    generated.mkdir()
+    return reference, generated
+
+
+def write(path, data=b"image bytes", age=None, clock=None):
+    """Write `path`, modified `age` seconds ago (files there before the watcher started), or at `clock`'s current time."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if age is not None or clock is not None:
+        stamp = time.time() - age if age is not None else clock.time()
+        os.utime(path, (stamp, stamp))
+    return str(path)
+
+
+def test_pairs_are_reported_once_both_files_settle(clock, directories):
+    reference, generated = directories
+    watcher = PairWatcher(str(reference), str(generated), settle_seconds=2.0)
+    base = write(reference / "cat_base.png", clock=clock)
+    assert watcher.poll() == {}
+    clock.now = 1.0
+    improved = write(generated / "cat_improved.png", clock=clock)
+    clock.now = 2.5
+    # The base image has settled, its partner has not
+    assert watcher.poll() == {}
+    clock.now = 3.5
+    assert watcher.poll() == {'cat': (base, improved)}
+    clock.now = 10.0
+    assert watcher.poll() == {}
+
+
+def test_files_still_being_written_restart_their_quiet_period(clock, directories):
+    reference, generated = directories
+    watcher = PairWatcher(str(reference), str(generated), settle_seconds=2.0)
+    base = write(reference / "cat_base.png", b"x" * 100, clock=clock)
+    improved = write(generated / "cat_improved.png", b"y" * 100, clock=clock)
+    watcher.poll()
+    clock.now = 1.5
+    write(generated / "cat_improved.png", b"y" * 200, clock=clock)
+    assert watcher.poll() == {}
+    clock.now = 3.0
+    assert watcher.poll() == {}
+    clock.now = 3.6
+    assert watcher.poll() == {'cat': (base, improved)}
+
+
+def test_empty_files_never_count(clock, directories):
+    reference, generated = directories
+    watcher = PairWatcher(str(reference), str(generated), settle_seconds=1.0)
+    base = write(reference / "cat_base.png", b"", age=3600)
+    improved = write(generated / "cat_improved.png", age=3600)
+    clock.now = 5.0
+    assert watcher.poll() == {}
+    write(reference / "cat_base.png", b"now written", clock=clock)
+    clock.now = 6.5
+    assert watcher.poll() == {'cat': (base, improved)}
+
+
+def test_files_from_before_the_watch_count_at_once(clock, directories):
+    reference, generated = directories
+    old = (write(reference / "old_base.png", age=3600), write(generated / "old_improved.png", age=3600))
+    write(reference / "new_base.png", clock=clock)
+    write(generated / "new_improved.png", clock=clock)
+    write(generated / "alone_improved.png", age=3600)
+    write(reference / "notes.txt", age=3600)
+    watcher = PairWatcher(str(reference), str(generated), settle_seconds=2.0, done=["done"])
+    write(reference / "done_base.png", age=3600)
+    write(generated / "done_improved.png", age=3600)
+    assert watcher.poll() == {'old': old}
+    clock.now = 2.0
+    assert list(watcher.poll()) == ['new']
+
+
+def test_nested_files_and_custom_patterns(clock, directories):
+    reference, generated = directories
+    base = write(reference / "cats" / "a" / "img3-before.jpg", age=60)
+    improved = write(generated / "cats" / "a" / "img3-after.jpg", age=60)
+    write(generated / "cats" / "b" / "img3-after.jpg", age=60)
+    watcher = PairWatcher(str(reference), str(generated), settle_seconds=1.0, reference_pattern=r"(?P<key>.+)-before\.",
+                          generated_pattern=r"(.+)-after\.")
+    assert watcher.poll() == {'cats/a/img3': (base, improved)}
+
+
+def test_stamps_are_kept_only_for_files_waiting_for_a_partner(clock, directories):
+    reference, generated = directories
+    watcher = PairWatcher(str(reference), str(generated), settle_seconds=1.0)
+    write(reference / "cat_base.png", age=60)
+    write(generated / "cat_improved.png", age=60)
+    waiting = write(reference / "dog_base.png", age=60)
+    gone = write(reference / "owl_base.png", age=60)
+    assert list(watcher.poll()) == ['cat']
+    os.remove(gone)
+    watcher.poll()
+    assert list(watcher._stamps) == [waiting]
+
+
+def wait_for(condition, timeout=120):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.2)
+
+
+def line_count(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as file:
+        return sum(1 for line in file if line.endswith("\n"))
+
+
+def watch_process(directory):
+    command = main_command(directory, "results.jsonl", "--watch", "--watch-interval", "0.2", "--settle-seconds", "0.3")
+    return subprocess.Popen(command, cwd=directory, env=main_environment(directory), stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def add_pair(directory, key, seed):
+    base, improved = synthetic_pair(240, 200, seed=seed)
+    base.save(os.path.join(directory, "ref", f"{key}_base.png"))
+    improved.save(os.path.join(directory, "gen", f"{key}_improved.png"))
+
+
+def stop(process):
+    process.send_signal(signal.SIGINT)
+    output, _ = process.communicate(timeout=120)
+    assert process.returncode == 0, output
+    return output
+
+
+def test_watching_run_evaluates_new_pairs_and_restarts(tmp_path):
+    directory = str(tmp_path)
+    os.makedirs(os.path.join(directory, "ref"))
+    os.makedirs(os.path.join(directory, "gen"))
+    results = os.path.join(directory, "results.jsonl")
+    add_pair(directory, "first", 0)
+    process = watch_process(directory)
+    try:
+        wait_for(lambda: line_count(results) == 1)
+        add_pair(directory, "second", 1)
+        wait_for(lambda: line_count(results) == 2)
+    finally:
+        stop(process)
+    with open(os.path.join(directory, "results.manifest.json")) as file:
+        assert json.load(file)['status'] == 'stopped'
+
+    # A restarted watcher skips the stored pairs and carries on with new ones
+    add_pair(directory, "third", 2)
+    process = watch_process(directory)
+    try:
+        wait_for(lambda: line_count(results) == 3)
+        time.sleep(1.0)
+    finally:
+        output = stop(process)
+    assert "2 pairs already in" in output
+    with open(results) as file:
+        assert [json.loads(line)['key'] for line in file] == ["first", "second", "third"]
+    with open(os.path.join(directory, "results.summary.json")) as file:
+        assert json.load(file)['records'] == 3